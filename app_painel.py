@@ -5,35 +5,86 @@ Este arquivo mostra a forma COMPLETA de integração do painel ao seu app.py atu
 """
 
 from fastapi import FastAPI, Request, Depends
-from fastapi.responses import Response, JSONResponse
+from fastapi.responses import Response, JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from twilio.twiml.voice_response import VoiceResponse
 import uvicorn
+import os
+import time
 from datetime import datetime
-from typing import List, Dict, Any
-from sqlalchemy import func
+from typing import List, Dict, Any, Optional
 
 # ============================================================================
 # 1. IMPORTAR SUAS FUNÇÕES DE CLASSIFICAÇÃO EXISTENTES
 # ============================================================================
 
 from classifiers import (
-    classify_emergency_call,
-    classify_police_urgency, 
+    aclassify_emergency_call,
+    aclassify_police_urgency, 
     generate_police_instructions,
-    classify_firefighter_urgency,
+    aclassify_firefighter_urgency,
     generate_firefighter_instructions,
-    classify_samu_urgency,
-    generate_samu_instructions
+    aclassify_samu_urgency,
+    generate_samu_instructions,
+    get_cache_stats,
+    aclassify_call_with_urgency,
+    get_llm_stats,
+    add_call_observer
 )
 
+# Categoria + urgência numa única chamada à OpenAI (em vez de duas sequenciais)
+COMBINED_CLASSIFICATION = os.getenv("COMBINED_CLASSIFICATION", "0") == "1"
+
 # ============================================================================
 # 2. IMPORTAR O MÓDULO DO DASHBOARD COM BANCO DE DADOS
 # ============================================================================
 
-from dashboard_db import setup_dashboard_routes, add_call_to_db
-from database import get_db
-from sqlalchemy.orm import Session
+from dashboard_db import setup_dashboard_routes
+from database import get_async_db
+from call_ids import generate_call_id
+from call_writer import call_writer
+from stats_rollup import apply_rollup, get_stats
+from database import Call
+from history import fetch_history_async, HISTORY_DEFAULT_LIMIT
+from live_feed import live_feed
+from call_archive import start_partition_maintenance
+import asyncio
+from sqlalchemy.ext.asyncio import AsyncSession
+from contextlib import asynccontextmanager
+from twiml_templates import TWIML_CONTENT_TYPE, ATENDER_E_FALAR, VOICE, TROTE, ENVIANDO_AJUDA
+from tracing import span, observe_llm_call, render_prometheus, MetricsMiddleware, PROMETHEUS_CONTENT_TYPE
+from batch_classify import parse_batch, classify_batch, NDJSON_CONTENT_TYPE
+
+# Latência e tokens de cada chamada à OpenAI em GET /metrics
+add_call_observer(observe_llm_call)
+
+# Grava as chamadas em lote, fora do caminho da resposta ao Twilio (call_writer.py)
+CALL_WRITE_BEHIND = os.getenv("CALL_WRITE_BEHIND", "1") == "1"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Inicia e encerra a gravação em lote junto com o servidor"""
+    # Chamadas gravadas pela thread do call_writer chegam ao feed ao vivo
+    live_feed.bind_loop(asyncio.get_running_loop())
+    # Partições dos próximos meses de calls (só PostgreSQL particionado)
+    start_partition_maintenance()
+    if CALL_WRITE_BEHIND:
+        call_writer.add_listener(live_feed.publish_calls_threadsafe)
+        call_writer.start()
+    yield
+    if CALL_WRITE_BEHIND:
+        call_writer.stop()
+
+async def salvar_chamada(db: AsyncSession, call_data: Dict[str, Any]) -> str:
+    """Salva a chamada (write-behind ou commit direto) e retorna o ID"""
+    if CALL_WRITE_BEHIND:
+        await call_writer.aenqueue(call_data)
+    else:
+        # Insert + rollups do dashboard na mesma transação
+        db.add(Call(**call_data))
+        await db.run_sync(lambda sync_db: apply_rollup([call_data], sync_db.connection()))
+        await db.commit()
+        live_feed.publish_calls([call_data])
+    return call_data['id']
 
 # ============================================================================
 # 3. INICIALIZAR FASTAPI COM CORS
@@ -42,7 +93,8 @@ from sqlalchemy.orm import Session
 app = FastAPI(
     title="Unificador de Emergências",
     description="API de classificação de emergências com dashboard",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Adicionar CORS para permitir requisições do frontend
@@ -62,6 +114,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Tempo de resposta por rota (http_request_seconds em GET /metrics)
+app.add_middleware(MetricsMiddleware)
+
 # ============================================================================
 # 4. SETUP DAS ROTAS DO DASHBOARD
 # ============================================================================
@@ -78,33 +133,23 @@ async def atender_e_falar():
     """
     Atende a chamada e diz a mensagem inicial.
     """
-    response = VoiceResponse()
-    response.say(
-        "Serviço de emergência, o que você precisa?", 
-        language="pt-BR", 
-        voice="alice"
-    )
-    return Response(content=str(response), media_type='application/xml')
+    # TwiML fixo, renderizado uma vez (twiml_templates.py)
+    return Response(content=ATENDER_E_FALAR.body, media_type=TWIML_CONTENT_TYPE)
 
 @app.post("/voice")
 async def voice(request: Request):
     """Atende ligação e pede para gravar mensagem"""
-    data = await request.form()
-    response = VoiceResponse()
-    response.say(
-        "Olá! Você ligou para o Centro de Emergência Unificado. "
-        "Descreva sua emergência após o bip."
-    )
-    response.record(maxLength=10, action="/handle_recording", transcribe=True)
-    return Response(content=str(response), media_type='application/xml')
+    return Response(content=VOICE.body, media_type=TWIML_CONTENT_TYPE)
 
 @app.post("/handle_recording")
-async def handle_recording(request: Request, db: Session = Depends(get_db)):
+async def handle_recording(request: Request, db: AsyncSession = Depends(get_async_db)):
     """
     Processa a gravação e classifica a emergência
     INTEGRAÇÃO: Salva dados no banco de dados
     """
-    data = await request.form()
+    with span("twilio_parse"):
+        data = await request.form()
+    call_sid = data.get("CallSid")
     recording_url = data.get("RecordingUrl")
     transcript = data.get("TranscriptionText", "(sem transcrição)")
     
@@ -115,7 +160,14 @@ async def handle_recording(request: Request, db: Session = Depends(get_db)):
     # CLASSIFICAÇÃO DE EMERGÊNCIA
     # ========================================================================
     
-    classification = classify_emergency_call(transcript)
+    if COMBINED_CLASSIFICATION:
+        # Categoria e urgência saem da mesma chamada: conta como classificação
+        with span("classificacao", call_sid):
+            classification, urgency_data = await aclassify_call_with_urgency(transcript)
+    else:
+        with span("classificacao", call_sid):
+            classification = await aclassify_emergency_call(transcript)
+        urgency_data = None
     print("🎯 Classificação:")
     print(f"   Categoria: {classification['category']}")
     print(f"   Confiança: {classification['confidence']}%")
@@ -125,10 +177,9 @@ async def handle_recording(request: Request, db: Session = Depends(get_db)):
     # PREPARAR DADOS PARA O BANCO
     # ========================================================================
     
-    call_count = db.query(func.count(1)).scalar()
-    
+    # ID ordenado por tempo, sem contar a tabela (ver call_ids.py)
     call_data = {
-        'id': f'call_{call_count + 1:06d}',
+        'id': generate_call_id(),
         'timestamp': datetime.now(),
         'transcript': transcript,
         'category': classification['category'],
@@ -143,7 +194,9 @@ async def handle_recording(request: Request, db: Session = Depends(get_db)):
     # ========================================================================
     
     if classification['category'] in ['policia']:
-        urgency_data = classify_police_urgency(transcript)
+        if urgency_data is None:
+            with span("urgencia", call_sid):
+                urgency_data = await aclassify_police_urgency(transcript)
         print("🚨 Análise de Urgência POLICIAL:")
         print(f"   Nível: {urgency_data['urgency_level']}")
         print(f"   Confiança: {urgency_data['confidence']}%")
@@ -160,7 +213,9 @@ async def handle_recording(request: Request, db: Session = Depends(get_db)):
         # dispatch_police(urgency_data)
     
     elif classification['category'] in ['bombeiros']:
-        urgency_data = classify_firefighter_urgency(transcript)
+        if urgency_data is None:
+            with span("urgencia", call_sid):
+                urgency_data = await aclassify_firefighter_urgency(transcript)
         print("🚒 Análise de Urgência de BOMBEIROS:")
         print(f"   Nível: {urgency_data['urgency_level']}")
         print(f"   Confiança: {urgency_data['confidence']}%")
@@ -172,7 +227,9 @@ async def handle_recording(request: Request, db: Session = Depends(get_db)):
         print(firefighter_instructions)
     
     elif classification['category'] in ['samu']:
-        urgency_data = classify_samu_urgency(transcript)
+        if urgency_data is None:
+            with span("urgencia", call_sid):
+                urgency_data = await aclassify_samu_urgency(transcript)
         print("🚑 Análise de Urgência do SAMU:")
         print(f"   Nível: {urgency_data['urgency_level']}")
         print(f"   Confiança: {urgency_data['confidence']}%")
@@ -187,26 +244,27 @@ async def handle_recording(request: Request, db: Session = Depends(get_db)):
     # SALVAR NO BANCO DE DADOS
     # ========================================================================
     
-    saved_call = add_call_to_db(db, call_data)
-    print(f"\n✅ Chamada salva no banco (ID: {saved_call.id})")
+    with span("db_write", call_sid):
+        saved_call_id = await salvar_chamada(db, call_data)
+    print(f"\n✅ Chamada salva no banco (ID: {saved_call_id})")
     
     # Retorna resposta TwiML
-    response = VoiceResponse()
-    if classification['category'] == 'trote':
-        response.say("Percebemos que esta é uma ligação falsa. Não podemos atender.", language="pt-BR")
-    else:
-        response.say(f"Entendido. Enviando ajuda de {classification['category']}.", language="pt-BR")
+    with span("twiml", call_sid):
+        if classification['category'] == 'trote':
+            twiml = TROTE.body
+        else:
+            twiml = ENVIANDO_AJUDA.render(categoria=classification['category'])
     
-    return Response(content=str(response), media_type='application/xml')
+    return Response(content=twiml, media_type=TWIML_CONTENT_TYPE)
 
 # ============================================================================
 # 6. ENDPOINTS ADICIONAIS ÚTEIS
 # ============================================================================
 
 @app.get("/info")
-async def info(db: Session = Depends(get_db)) -> JSONResponse:
+async def info() -> JSONResponse:
     """Informações sobre a API"""
-    total_calls = db.query(func.count(1)).scalar()
+    total_calls = (await asyncio.to_thread(get_stats))["total_calls"]
     return JSONResponse({
         "name": "Unificador de Emergências",
         "version": "1.0.0",
@@ -215,31 +273,133 @@ async def info(db: Session = Depends(get_db)) -> JSONResponse:
         "docs": "http://localhost:8000/docs"
     })
 
+@app.get("/stats/rollup")
+async def stats_rollup() -> JSONResponse:
+    """
+    Estatísticas do dashboard servidas dos rollups (custo constante,
+    independente do tamanho da tabela calls)
+    """
+    return JSONResponse(await asyncio.to_thread(get_stats))
+
+@app.get("/calls/history")
+async def calls_history(
+    category: Optional[str] = None,
+    region: Optional[str] = None,
+    urgency_level: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = HISTORY_DEFAULT_LIMIT,
+    include_text: bool = False,
+    db: AsyncSession = Depends(get_async_db)
+) -> JSONResponse:
+    """
+    Histórico de chamadas, mais recentes primeiro, paginado por cursor.
+
+    Passe o next_cursor da resposta em ?cursor= para a próxima página. O
+    transcript e o reasoning só vêm com ?include_text=true.
+    """
+    try:
+        pagina = await fetch_history_async(
+            db, limit=limit, category=category, region=region,
+            urgency_level=urgency_level, cursor=cursor, include_text=include_text
+        )
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    return JSONResponse(pagina)
+
+@app.get("/stream/calls")
+async def stream_calls(request: Request) -> Response:
+    """
+    Feed ao vivo (Server-Sent Events) com cada chamada nova (evento "call") e
+    o incremento das estatísticas de cada lote (evento "stats").
+
+    No frontend: new EventSource("/stream/calls")
+    """
+    last_event_id = request.headers.get("last-event-id")
+    try:
+        eventos = live_feed.subscribe(int(last_event_id) if last_event_id and last_event_id.isdigit() else None)
+        primeira = await eventos.__anext__()
+    except RuntimeError as e:
+        return JSONResponse(status_code=503, content={"error": str(e)})
+
+    async def gerar():
+        yield primeira
+        async for mensagem in eventos:
+            yield mensagem
+
+    return StreamingResponse(
+        gerar(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/stream/stats")
+async def stream_stats() -> JSONResponse:
+    """Clientes conectados, eventos publicados e descartados do feed ao vivo"""
+    return JSONResponse(live_feed.stats)
+
+@app.get("/classifier/cache")
+async def classifier_cache_stats() -> JSONResponse:
+    """Acertos, erros e ocupação do cache de classificação"""
+    return JSONResponse(get_cache_stats())
+
+@app.get("/classifier/llm")
+async def classifier_llm_stats() -> JSONResponse:
+    """Chamadas, tentativas, falhas e estado do circuit breaker da OpenAI"""
+    return JSONResponse(get_llm_stats())
+
+@app.get("/metrics")
+async def metrics() -> Response:
+    """Histogramas de latência por etapa, por rota e da OpenAI (formato Prometheus)"""
+    return Response(content=render_prometheus(), media_type=PROMETHEUS_CONTENT_TYPE)
+
 @app.get("/test-classify")
-async def test_classify(text: str = "Tem um incêndio", db: Session = Depends(get_db)) -> JSONResponse:
-    """Endpoint para testar classificação sem Twilio"""
+async def test_classify(
+    text: str = "Tem um incêndio",
+    combined: bool = COMBINED_CLASSIFICATION,
+    db: AsyncSession = Depends(get_async_db)
+) -> JSONResponse:
+    """
+    Endpoint para testar classificação sem Twilio
+
+    Use ?combined=true/false para comparar o modo de chamada única com o modo
+    de duas chamadas (categoria e depois urgência).
+    """
     try:
-        classification = classify_emergency_call(text)
+        inicio = time.perf_counter()
+        if combined:
+            classification, urgency_data = await aclassify_call_with_urgency(text)
+        else:
+            classification = await aclassify_emergency_call(text)
+            urgency_classifiers = {
+                'policia': aclassify_police_urgency,
+                'bombeiros': aclassify_firefighter_urgency,
+                'samu': aclassify_samu_urgency
+            }
+            urgency_classifier = urgency_classifiers.get(classification['category'])
+            urgency_data = await urgency_classifier(text) if urgency_classifier else None
+        elapsed_ms = round(1000 * (time.perf_counter() - inicio), 1)
         
-        call_count = db.query(func.count(1)).scalar()
         call_data = {
-            'id': f'call_test_{call_count + 1:06d}',
+            'id': generate_call_id('call_test'),
             'timestamp': datetime.now(),
             'transcript': text,
             'category': classification['category'],
             'confidence': classification['confidence'],
-            'urgency_level': 'média',
+            'urgency_level': urgency_data['urgency_level'] if urgency_data else 'média',
             'reasoning': classification['reasoning'],
             'region': None
         }
         
-        saved_call = add_call_to_db(db, call_data)
+        saved_call_id = await salvar_chamada(db, call_data)
         
         return JSONResponse({
             "status": "success",
             "classification": classification,
+            "urgency": urgency_data,
+            "mode": "combined" if combined else "sequential",
+            "elapsed_ms": elapsed_ms,
             "saved_to_database": True,
-            "call_id": saved_call.id
+            "call_id": saved_call_id
         })
     except Exception as e:
         return JSONResponse(
@@ -247,6 +407,34 @@ async def test_classify(text: str = "Tem um incêndio", db: Session = Depends(ge
             content={"error": str(e)}
         )
 
+@app.post("/classify/batch")
+async def classify_batch_endpoint(
+    request: Request,
+    combined: bool = COMBINED_CLASSIFICATION,
+    persist: bool = True
+) -> Response:
+    """
+    Classifica um lote de transcrições (até CLASSIFY_BATCH_MAX_ITEMS).
+
+    Corpo: {"items": ["texto", {"transcript": "...", "ref": "...",
+    "timestamp": "2024-05-01T10:00:00", "region": "..."}, ...]}
+
+    Resposta em NDJSON, uma linha por item na ordem em que as classificações
+    terminam (use "index"/"ref" para casar com o pedido), e uma linha final
+    {"done": true, ...}. Transcrições repetidas são classificadas uma vez só
+    e o lote é gravado num único INSERT ao final (?persist=false não grava).
+    """
+    try:
+        items = parse_batch(await request.json())
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    return StreamingResponse(
+        classify_batch(items, combined=combined, persist=persist, on_saved=live_feed.publish_calls),
+        media_type=NDJSON_CONTENT_TYPE,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # ============================================================================
 # 7. INICIAR SERVIDOR
 # ============================================================================
@@ -266,6 +454,7 @@ if __name__ == "__main__":
     ║   - GET  /stats          Estatísticas do dashboard            ║
     ║   - GET  /history        Histórico de chamadas                ║
     ║   - POST /classify       Classificar uma emergência           ║
+    ║   - POST /classify/batch Classificar em lote (NDJSON)         ║
     ║   - GET  /info           Informações da API                   ║
     ║                                                                ║
     ║   Para testar:                                                ║
@@ -288,6 +477,8 @@ if __name__ == "__main__":
 
 3. Teste:
    curl http://localhost:8000/stats
+   curl -N http://localhost:8000/stream/calls
+   curl http://localhost:8000/metrics
    curl "http://localhost:8000/test-classify?text=Tem%20um%20incendio"
 
 4. Acesse o dashboard:
@@ -299,6 +490,6 @@ if __name__ == "__main__":
 
 FLUXO COMPLETO:
   Chamada Twilio → /voice → /handle_recording 
-  → classify_emergency_call() → save to dashboard 
-  → frontend visualiza em tempo real via GET /stats
+  → aclassify_emergency_call() → save to dashboard 
+  → frontend recebe em tempo real via GET /stream/calls (SSE)
 """
@@ -0,0 +1,215 @@
+"""
+Classificação em lote (POST /classify/batch)
+
+Recebe centenas de transcrições de uma vez (importação de histórico,
+reavaliação do classificador) e:
+
+- classifica cada transcrição distinta uma única vez: itens com a mesma
+  transcrição normalizada (normalize_transcript) esperam a mesma tarefa;
+- limita quantas classificações do lote rodam ao mesmo tempo
+  (CLASSIFY_BATCH_CONCURRENCY), para um lote não tomar todo o semáforo
+  do classifiers e atrasar as ligações ao vivo;
+- devolve uma linha NDJSON por item assim que a sua classificação termina,
+  e uma linha final com o resumo;
+- grava tudo num único INSERT em lote (bulk_insert_calls) com os rollups
+  do dashboard na mesma transação.
+
+Se o cliente desconectar antes do fim, as classificações pendentes são
+canceladas e nada do lote é gravado.
+"""
+import os
+import json
+import time
+import asyncio
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from classifiers import (
+    aclassify_emergency_call,
+    aclassify_call_with_urgency,
+    aclassify_police_urgency,
+    aclassify_firefighter_urgency,
+    aclassify_samu_urgency,
+)
+from classifiers.normalization import normalize_transcript
+from call_ids import generate_call_id
+from database import engine, bulk_insert_calls
+from stats_rollup import apply_rollup
+from tracing import span
+
+# Carrega variáveis de ambiente
+load_dotenv()
+
+CLASSIFY_BATCH_MAX_ITEMS = int(os.getenv("CLASSIFY_BATCH_MAX_ITEMS", "1000"))
+CLASSIFY_BATCH_CONCURRENCY = int(os.getenv("CLASSIFY_BATCH_CONCURRENCY", "5"))
+
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+
+URGENCY_CLASSIFIERS = {
+    'policia': aclassify_police_urgency,
+    'bombeiros': aclassify_firefighter_urgency,
+    'samu': aclassify_samu_urgency,
+}
+
+
+def parse_batch(body: Any) -> List[Dict[str, Any]]:
+    """
+    Valida o corpo de POST /classify/batch e retorna os itens.
+
+    Aceita {"items": [...]} ou a lista direto. Cada item é uma string ou um
+    objeto {"transcript", "ref"?, "timestamp"? (ISO 8601), "region"?}.
+    ValueError se o corpo for inválido.
+    """
+    itens = body.get("items") if isinstance(body, dict) else body
+    if not isinstance(itens, list) or not itens:
+        raise ValueError("Envie uma lista não vazia em 'items'")
+    if len(itens) > CLASSIFY_BATCH_MAX_ITEMS:
+        raise ValueError(f"Lote com {len(itens)} itens; o máximo é {CLASSIFY_BATCH_MAX_ITEMS}")
+
+    validos = []
+    for indice, item in enumerate(itens):
+        if isinstance(item, str):
+            item = {"transcript": item}
+        if not isinstance(item, dict) or not isinstance(item.get("transcript"), str) \
+                or not item["transcript"].strip():
+            raise ValueError(f"Item {indice}: 'transcript' deve ser um texto não vazio")
+        timestamp = item.get("timestamp")
+        if timestamp is not None:
+            try:
+                timestamp = datetime.fromisoformat(str(timestamp))
+            except ValueError:
+                raise ValueError(f"Item {indice}: timestamp inválido '{timestamp}'")
+        validos.append({
+            "transcript": item["transcript"],
+            "ref": item.get("ref"),
+            "timestamp": timestamp,
+            "region": item.get("region"),
+        })
+    return validos
+
+
+async def classify_transcript(text: str, combined: bool) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    """(classificação, urgência) de uma transcrição, como em /test-classify."""
+    if combined:
+        return await aclassify_call_with_urgency(text)
+    classification = await aclassify_emergency_call(text)
+    urgency_classifier = URGENCY_CLASSIFIERS.get(classification['category'])
+    urgency_data = await urgency_classifier(text) if urgency_classifier else None
+    return classification, urgency_data
+
+
+def _gravar(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Um INSERT para o lote todo, com os rollups na mesma transação
+    with span("db_write"), engine.begin() as conn:
+        inseridos = bulk_insert_calls(rows, connection=conn)
+        apply_rollup(inseridos, conn)
+    return inseridos
+
+
+def _linha(dados: Dict[str, Any]) -> bytes:
+    return (json.dumps(dados, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+
+
+async def classify_batch(
+    items: List[Dict[str, Any]],
+    combined: bool = False,
+    persist: bool = True,
+    concurrency: int = CLASSIFY_BATCH_CONCURRENCY,
+    on_saved: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+) -> AsyncIterator[bytes]:
+    """
+    Classifica os itens (de parse_batch) e gera as linhas NDJSON.
+
+    Cada linha de resultado traz o índice do item no lote, o ref enviado,
+    o call_id reservado e a classificação; "coalesced": true indica que a
+    transcrição repetia a de outro item e não foi classificada de novo. A
+    última linha ({"done": true, ...}) confirma quantas chamadas foram
+    gravadas.
+
+    Args:
+        items: Itens validados por parse_batch
+        combined: Categoria + urgência numa única chamada à OpenAI
+        persist: Gravar as chamadas no banco ao final
+        concurrency: Máximo de classificações simultâneas deste lote
+        on_saved: Recebe as linhas efetivamente inseridas (ex.: feed ao vivo)
+    """
+    inicio = time.perf_counter()
+    limite = asyncio.Semaphore(max(1, concurrency))
+
+    # Itens agrupados pela transcrição normalizada
+    grupos: Dict[str, List[int]] = {}
+    for indice, item in enumerate(items):
+        grupos.setdefault(normalize_transcript(item["transcript"]) or item["transcript"], []).append(indice)
+
+    async def classificar(chave: str) -> Tuple[str, Any]:
+        async with limite:
+            try:
+                return chave, await classify_transcript(items[grupos[chave][0]]["transcript"], combined)
+            except Exception as e:
+                return chave, e
+
+    tarefas = [asyncio.ensure_future(classificar(chave)) for chave in grupos]
+    rows: List[Dict[str, Any]] = []
+    erros = 0
+    try:
+        for concluida in asyncio.as_completed(tarefas):
+            chave, resultado = await concluida
+            for posicao, indice in enumerate(grupos[chave]):
+                item = items[indice]
+                if isinstance(resultado, Exception):
+                    erros += 1
+                    yield _linha({"index": indice, "ref": item["ref"], "error": str(resultado)})
+                    continue
+                classification, urgency_data = resultado
+                call_data = {
+                    'id': generate_call_id(),
+                    'timestamp': item["timestamp"] or datetime.now(),
+                    'transcript': item["transcript"],
+                    'category': classification['category'],
+                    'confidence': classification['confidence'],
+                    'urgency_level': urgency_data['urgency_level'] if urgency_data else None,
+                    'reasoning': classification['reasoning'],
+                    'region': item["region"],
+                }
+                rows.append(call_data)
+                yield _linha({
+                    "index": indice,
+                    "ref": item["ref"],
+                    "call_id": call_data['id'] if persist else None,
+                    "classification": classification,
+                    "urgency": urgency_data,
+                    "coalesced": posicao > 0,
+                })
+    finally:
+        # Cliente desconectou no meio: não deixa classificações órfãs
+        for tarefa in tarefas:
+            tarefa.cancel()
+
+    salvas, erro_gravacao = 0, None
+    if persist and rows:
+        try:
+            inseridos = await asyncio.to_thread(_gravar, rows)
+        except Exception as e:
+            # As linhas já foram enviadas: o resumo avisa que nada foi gravado
+            print(f"[Lote] Erro ao gravar {len(rows)} chamada(s): {e}")
+            erro_gravacao = str(e)
+        else:
+            salvas = len(inseridos)
+            if on_saved:
+                on_saved(inseridos)
+
+    resumo = {
+        "done": True,
+        "items": len(items),
+        "unique": len(grupos),
+        "coalesced": len(items) - len(grupos),
+        "errors": erros,
+        "saved": salvas,
+        "mode": "combined" if combined else "sequential",
+        "elapsed_ms": round(1000 * (time.perf_counter() - inicio), 1),
+    }
+    if erro_gravacao:
+        resumo["save_error"] = erro_gravacao
+    yield _linha(resumo)
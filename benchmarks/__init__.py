@@ -0,0 +1 @@
+# Benchmarks offline: servidor falso da OpenAI, corpus rotulado e medições de desempenho
@@ -0,0 +1,344 @@
+"""
+Teste de carga dos webhooks do Twilio
+
+Simula ligações completas, cada uma com um CallSid diferente e pausas de
+"fala" entre os passos, contra um app já rodando:
+
+    answer_phone   /  ->  /receber_transcricao  ->  cada passo do checklist
+    painel         /voice  ->  /handle_recording
+
+Os passos do checklist seguem o action do <Gather> devolvido pelo app (com
+LOAD_LEGACY_ROUTES=1, as rotas antigas /processar_checklist_<categoria>).
+
+A concorrência sobe em estágios (LOAD_STAGES ligações simultâneas, cada
+estágio por LOAD_STAGE_SECONDS). Para cada estágio saem a latência por rota e
+por passo (p50/p95/p99), a taxa de erro e as ligações por segundo. O ponto de
+saturação é o primeiro estágio em que o p99 de alguma rota passa de
+LOAD_SATURATION_P99_MS (o Twilio desiste do webhook em 15 s) ou a taxa de erro
+passa de LOAD_MAX_ERROR_RATE.
+
+Com LOAD_START_MOCKS=1 os servidores falsos da OpenAI e do Twilio sobem aqui,
+nas portas MOCK_OPENAI_PORT e MOCK_TWILIO_PORT; o app deve ser iniciado
+apontando para eles:
+
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 TWILIO_API_BASE_URL=http://127.0.0.1:8090 python answer_phone.py
+    python -m benchmarks.load_webhooks answer_phone http://127.0.0.1:8080
+"""
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+from html import unescape
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from dotenv import load_dotenv
+
+from benchmarks.mock_openai import MockOpenAIServer
+from benchmarks.mock_twilio import MockTwilioServer
+from benchmarks.run_classifiers import load_corpus, percentile
+
+# Carrega variáveis de ambiente
+load_dotenv()
+
+# Ligações simultâneas em cada estágio
+LOAD_STAGES = [int(n) for n in os.getenv("LOAD_STAGES", "5,10,20,40,80").split(",")]
+LOAD_STAGE_SECONDS = float(os.getenv("LOAD_STAGE_SECONDS", "60"))
+# Pausa entre os passos de uma ligação (o tempo de a pessoa falar)
+LOAD_THINK_MIN_SECONDS = float(os.getenv("LOAD_THINK_MIN_SECONDS", "1"))
+LOAD_THINK_MAX_SECONDS = float(os.getenv("LOAD_THINK_MAX_SECONDS", "3"))
+# O Twilio espera no máximo 15 s pela resposta de um webhook
+LOAD_REQUEST_TIMEOUT_SECONDS = float(os.getenv("LOAD_REQUEST_TIMEOUT_SECONDS", "15"))
+LOAD_SATURATION_P99_MS = float(os.getenv("LOAD_SATURATION_P99_MS", "10000"))
+LOAD_MAX_ERROR_RATE = float(os.getenv("LOAD_MAX_ERROR_RATE", "0.01"))
+LOAD_LEGACY_ROUTES = os.getenv("LOAD_LEGACY_ROUTES", "0") == "1"
+LOAD_START_MOCKS = os.getenv("LOAD_START_MOCKS", "1") == "1"
+MOCK_OPENAI_PORT = int(os.getenv("MOCK_OPENAI_PORT", "8089"))
+MOCK_TWILIO_PORT = int(os.getenv("MOCK_TWILIO_PORT", "8090"))
+LOAD_SEED = int(os.getenv("LOAD_SEED", "42"))
+LOAD_OUTPUT = os.getenv("LOAD_OUTPUT", "")
+
+APPS = {"answer_phone": "http://127.0.0.1:8080", "painel": "http://127.0.0.1:8000"}
+
+RESPOSTAS_CHECKLIST = [
+    "Sim",
+    "Não",
+    "Rua das Flores, 120, perto da padaria",
+    "Está sangrando um pouco na cabeça",
+    "Uns quarenta anos, é um homem",
+    "Não sei dizer",
+]
+
+_ACTION = re.compile(r'<Gather[^>]*\baction="([^"]+)"')
+_ROTA_CHECKLIST = re.compile(r"^/checklist/(\w[\w-]*)")
+_ROTA_CHECKLIST_ANTIGA = re.compile(r"^/processar_checklist_[\w-]+")
+
+
+class LoadStats:
+    """Latências e erros por (rota, passo) de um estágio."""
+
+    def __init__(self):
+        self.latencias: Dict[Tuple[str, str], List[float]] = defaultdict(list)
+        self.erros: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.tipos_erro: Dict[str, int] = defaultdict(int)
+        self.ligacoes = 0
+        self.ligacoes_com_erro = 0
+
+    def registrar(self, rota: str, passo: str, segundos: float, erro: Optional[str]) -> None:
+        self.latencias[(rota, passo)].append(1000 * segundos)
+        if erro:
+            self.erros[(rota, passo)] += 1
+            self.tipos_erro[erro] += 1
+
+    @property
+    def requisicoes(self) -> int:
+        return sum(len(valores) for valores in self.latencias.values())
+
+    @property
+    def total_erros(self) -> int:
+        return sum(self.erros.values())
+
+    def resumo(self, chaves: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        linhas = []
+        for rota, passo in chaves:
+            valores = sorted(self.latencias.get((rota, passo), []))
+            if not valores:
+                continue
+            linhas.append({
+                "route": rota,
+                "step": passo,
+                "requests": len(valores),
+                "errors": self.erros.get((rota, passo), 0),
+                "p50_ms": round(percentile(valores, 50), 1),
+                "p95_ms": round(percentile(valores, 95), 1),
+                "p99_ms": round(percentile(valores, 99), 1),
+                "max_ms": round(valores[-1], 1),
+            })
+        return linhas
+
+    def por_rota(self) -> List[Dict[str, Any]]:
+        rotas = sorted({rota for rota, _ in self.latencias})
+        agregado = LoadStats()
+        for (rota, _), valores in self.latencias.items():
+            agregado.latencias[(rota, "*")].extend(valores)
+        for (rota, _), erros in self.erros.items():
+            agregado.erros[(rota, "*")] += erros
+        return agregado.resumo([(rota, "*") for rota in rotas])
+
+    def por_passo(self) -> List[Dict[str, Any]]:
+        return self.resumo(sorted(self.latencias))
+
+
+class CallSimulator:
+    """
+    Uma ligação simulada (sequência de webhooks) contra o app.
+
+    Args:
+        cliente: Cliente httpx com a base_url do app
+        stats: Onde registrar as latências
+        sorteio: Gerador aleatório (transcrições, respostas e pausas)
+    """
+
+    def __init__(self, cliente: httpx.AsyncClient, stats: LoadStats, sorteio: random.Random):
+        self.cliente = cliente
+        self.stats = stats
+        self.sorteio = sorteio
+
+    async def pensar(self) -> None:
+        await asyncio.sleep(self.sorteio.uniform(LOAD_THINK_MIN_SECONDS, LOAD_THINK_MAX_SECONDS))
+
+    async def webhook(self, url: str, passo: str, dados: Dict[str, str]) -> Optional[str]:
+        """POST no webhook; retorna o TwiML, ou None se falhou."""
+        rota = url.split("?")[0]
+        inicio = time.perf_counter()
+        erro = None
+        texto = None
+        try:
+            resposta = await self.cliente.post(url, data=dados)
+            texto = resposta.text
+            if resposta.status_code >= 400:
+                erro = f"HTTP {resposta.status_code}"
+            elif "<Response" not in texto:
+                erro = "resposta sem TwiML"
+        except httpx.TimeoutException:
+            erro = "timeout"
+        except httpx.HTTPError as e:
+            erro = type(e).__name__
+        # Rotas do checklist agrupadas pelo padrão, não pela categoria
+        rota = _ROTA_CHECKLIST.sub("/checklist/<categoria>", rota)
+        rota = _ROTA_CHECKLIST_ANTIGA.sub("/processar_checklist_<categoria>", rota)
+        self.stats.registrar(rota, passo, time.perf_counter() - inicio, erro)
+        return None if erro else texto
+
+    def _formulario(self, call_sid: str, **campos) -> Dict[str, str]:
+        return {
+            "CallSid": call_sid,
+            "AccountSid": "AC" + "0" * 32,
+            "From": "+5511999990000",
+            "To": "+5511888880000",
+            "CallStatus": "in-progress",
+            **campos,
+        }
+
+    async def answer_phone(self, call_sid: str, exemplo: Dict[str, Any]) -> bool:
+        """/ -> /receber_transcricao -> passos do checklist. Retorna False se algum passo falhou."""
+        if await self.webhook("/", "atender", self._formulario(call_sid)) is None:
+            return False
+        await self.pensar()
+        twiml = await self.webhook(
+            "/receber_transcricao", "transcricao", self._formulario(call_sid, SpeechResult=exemplo["text"])
+        )
+        if twiml is None:
+            return False
+
+        numero = 1
+        acao = _ACTION.search(twiml)
+        while acao:
+            url = unescape(acao.group(1))
+            if LOAD_LEGACY_ROUTES:
+                url = _ROTA_CHECKLIST.sub(lambda m: f"/processar_checklist_{m.group(1)}", url)
+            await self.pensar()
+            resposta = self.sorteio.choice(RESPOSTAS_CHECKLIST)
+            twiml = await self.webhook(url, f"passo {numero}", self._formulario(call_sid, SpeechResult=resposta))
+            if twiml is None:
+                return False
+            numero += 1
+            acao = _ACTION.search(twiml)
+        return True
+
+    async def painel(self, call_sid: str, exemplo: Dict[str, Any]) -> bool:
+        """/voice -> /handle_recording. Retorna False se algum passo falhou."""
+        if await self.webhook("/voice", "voice", self._formulario(call_sid)) is None:
+            return False
+        await self.pensar()
+        twiml = await self.webhook("/handle_recording", "gravacao", self._formulario(
+            call_sid,
+            RecordingUrl=f"https://api.twilio.com/recordings/RE{uuid.uuid4().hex}",
+            TranscriptionText=exemplo["text"],
+        ))
+        return twiml is not None
+
+
+async def run_stage(app: str, base_url: str, concorrencia: int, corpus: List[Dict[str, Any]]) -> LoadStats:
+    """Mantém `concorrencia` ligações simultâneas por LOAD_STAGE_SECONDS."""
+    stats = LoadStats()
+    loop = asyncio.get_running_loop()
+    fim = loop.time() + LOAD_STAGE_SECONDS
+    limites = httpx.Limits(max_connections=None, max_keepalive_connections=concorrencia)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=LOAD_REQUEST_TIMEOUT_SECONDS, limits=limites) as cliente:
+        async def usuario(indice: int) -> None:
+            sorteio = random.Random(LOAD_SEED * 1000 + indice)
+            simulador = CallSimulator(cliente, stats, sorteio)
+            # Espalha o início das ligações
+            await asyncio.sleep(sorteio.uniform(0, LOAD_THINK_MAX_SECONDS))
+            while loop.time() < fim:
+                fluxo = simulador.answer_phone if app == "answer_phone" else simulador.painel
+                ok = await fluxo("CA" + uuid.uuid4().hex, sorteio.choice(corpus))
+                stats.ligacoes += 1
+                if not ok:
+                    stats.ligacoes_com_erro += 1
+
+        await asyncio.gather(*(usuario(indice) for indice in range(concorrencia)))
+    return stats
+
+
+def _saturado(stats: LoadStats) -> Optional[str]:
+    """Motivo da saturação do estágio, ou None se ele está saudável."""
+    if stats.requisicoes and stats.total_erros / stats.requisicoes > LOAD_MAX_ERROR_RATE:
+        return f"taxa de erro {stats.total_erros / stats.requisicoes:.1%} > {LOAD_MAX_ERROR_RATE:.1%}"
+    for linha in stats.por_rota():
+        if linha["p99_ms"] > LOAD_SATURATION_P99_MS:
+            return f"p99 de {linha['route']} {linha['p99_ms']:.0f} ms > {LOAD_SATURATION_P99_MS:.0f} ms"
+    return None
+
+
+def print_stage(concorrencia: int, stats: LoadStats, duracao: float, motivo: Optional[str]) -> None:
+    erro = stats.total_erros / stats.requisicoes if stats.requisicoes else 0.0
+    print(f"\n[Carga] {concorrencia} ligações simultâneas: {stats.ligacoes} ligações, "
+          f"{stats.requisicoes} requisições ({stats.requisicoes / duracao:.1f}/s), erros {erro:.2%}"
+          + (f"  <- SATURADO ({motivo})" if motivo else ""))
+    print(f"  {'rota':<34} {'passo':<12} {'req':>6} {'erros':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for linha in stats.por_rota() + stats.por_passo():
+        print(f"  {linha['route']:<34} {linha['step']:<12} {linha['requests']:>6} {linha['errors']:>6} "
+              f"{linha['p50_ms']:>8.1f} {linha['p95_ms']:>8.1f} {linha['p99_ms']:>8.1f} {linha['max_ms']:>8.1f}")
+    if stats.tipos_erro:
+        print("  erros: " + ", ".join(f"{tipo}: {n}" for tipo, n in sorted(stats.tipos_erro.items())))
+
+
+async def run_load_test(app: str, base_url: str) -> Dict[str, Any]:
+    """Roda os estágios em ordem, parando no primeiro saturado."""
+    corpus = load_corpus()
+    estagios = []
+    saturacao = None
+    for concorrencia in LOAD_STAGES:
+        inicio = time.perf_counter()
+        stats = await run_stage(app, base_url, concorrencia, corpus)
+        duracao = time.perf_counter() - inicio
+        motivo = _saturado(stats)
+        print_stage(concorrencia, stats, duracao, motivo)
+        estagios.append({
+            "concurrency": concorrencia,
+            "calls": stats.ligacoes,
+            "calls_with_errors": stats.ligacoes_com_erro,
+            "requests": stats.requisicoes,
+            "requests_per_sec": round(stats.requisicoes / duracao, 2),
+            "error_rate": round(stats.total_erros / stats.requisicoes, 4) if stats.requisicoes else 0.0,
+            "errors_by_type": dict(stats.tipos_erro),
+            "routes": stats.por_rota(),
+            "steps": stats.por_passo(),
+            "saturated": motivo,
+        })
+        if motivo:
+            saturacao = concorrencia
+            break
+
+    saudaveis = [estagio["concurrency"] for estagio in estagios if not estagio["saturated"]]
+    return {
+        "app": app,
+        "base_url": base_url,
+        "stages": estagios,
+        "max_healthy_concurrency": saudaveis[-1] if saudaveis else None,
+        "saturation_concurrency": saturacao,
+    }
+
+
+def main(app: str, base_url: str) -> Dict[str, Any]:
+    mocks = []
+    if LOAD_START_MOCKS:
+        openai_falso = MockOpenAIServer(port=MOCK_OPENAI_PORT, seed=LOAD_SEED)
+        twilio_falso = MockTwilioServer(port=MOCK_TWILIO_PORT, seed=LOAD_SEED)
+        mocks = [openai_falso, twilio_falso]
+        print(f"[Carga] Mocks no ar. Inicie o app com:\n"
+              f"  OPENAI_BASE_URL={openai_falso.start()} TWILIO_API_BASE_URL={twilio_falso.start()}")
+
+    try:
+        resultado = asyncio.run(run_load_test(app, base_url))
+    finally:
+        for mock in mocks:
+            mock.stop()
+
+    if mocks:
+        resultado["mocks"] = {"openai": mocks[0].stats, "twilio": mocks[1].stats}
+        if not mocks[0].stats["requests"]:
+            print("[Carga] Aviso: nenhuma requisição chegou ao mock da OpenAI (o app está usando a API real?)")
+
+    print(f"\n[Carga] Maior concorrência saudável: {resultado['max_healthy_concurrency']}; "
+          f"saturação em: {resultado['saturation_concurrency'] or 'não atingida'}")
+    return resultado
+
+
+if __name__ == "__main__":
+    app = sys.argv[1] if len(sys.argv) > 1 else "answer_phone"
+    if app not in APPS:
+        print(f"Uso: python -m benchmarks.load_webhooks {'|'.join(APPS)} [base_url]")
+        sys.exit(1)
+    resultado = main(app, sys.argv[2] if len(sys.argv) > 2 else APPS[app])
+    if LOAD_OUTPUT:
+        with open(LOAD_OUTPUT, "w", encoding="utf-8") as arquivo:
+            json.dump(resultado, arquivo, ensure_ascii=False, indent=2)
@@ -0,0 +1,281 @@
+"""
+Servidor falso compatível com a API de chat da OpenAI
+
+Atende POST /v1/chat/completions (com e sem stream) com latência e erros
+configuráveis, para medir o pacote classifiers sem chamar a API de verdade:
+
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 python app_painel.py
+
+Respostas:
+- prompts de classificação (com 'Texto da chamada: "..."' ou que pedem
+  response_format json_object) recebem um JSON com
+  categoria e urgência. Se a transcrição estiver no corpus rotulado, a
+  resposta é o rótulo, trocado por outra categoria com probabilidade
+  1 - MOCK_OPENAI_ACCURACY; senão, um palpite por palavras-chave;
+- os demais prompts (relatórios) recebem um texto curto de 3 frases.
+
+Latência de cada requisição: normal(MOCK_OPENAI_LATENCY_MS, MOCK_OPENAI_JITTER_MS),
+e com probabilidade MOCK_OPENAI_TAIL_RATE mais MOCK_OPENAI_TAIL_MS (a cauda).
+Com probabilidade MOCK_OPENAI_ERROR_RATE a resposta é MOCK_OPENAI_ERROR_STATUS.
+
+Uso: python -m benchmarks.mock_openai [porta]
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+# Carrega variáveis de ambiente
+load_dotenv()
+
+MOCK_OPENAI_LATENCY_MS = float(os.getenv("MOCK_OPENAI_LATENCY_MS", "300"))
+MOCK_OPENAI_JITTER_MS = float(os.getenv("MOCK_OPENAI_JITTER_MS", "100"))
+MOCK_OPENAI_TAIL_RATE = float(os.getenv("MOCK_OPENAI_TAIL_RATE", "0.02"))
+MOCK_OPENAI_TAIL_MS = float(os.getenv("MOCK_OPENAI_TAIL_MS", "2500"))
+MOCK_OPENAI_ERROR_RATE = float(os.getenv("MOCK_OPENAI_ERROR_RATE", "0"))
+MOCK_OPENAI_ERROR_STATUS = int(os.getenv("MOCK_OPENAI_ERROR_STATUS", "500"))
+MOCK_OPENAI_ACCURACY = float(os.getenv("MOCK_OPENAI_ACCURACY", "0.95"))
+MOCK_OPENAI_CORPUS = os.getenv(
+    "MOCK_OPENAI_CORPUS",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus_pt.jsonl"),
+)
+
+CATEGORIAS = ["policia", "samu", "bombeiros", "trote", "indefinido"]
+
+_TRANSCRICAO = re.compile(r'Texto da chamada:\s*"(.*?)"\s*\n', re.DOTALL)
+
+# Palpite para transcrições fora do corpus
+_PALAVRAS_CHAVE = {
+    "bombeiros": ("fogo", "incêndio", "fumaça", "gás", "afogando", "preso", "presa", "enchente"),
+    "samu": ("respirando", "desmaiou", "sangrando", "dor", "convulsão", "febre", "inconsciente", "grávida"),
+    "policia": ("assalto", "assaltando", "roubo", "roubar", "arma", "armado", "tiro", "briga", "ameaçando"),
+    "trote": ("pizza", "hambúrguer", "restaurante", "entrega", "prêmio"),
+}
+
+RELATORIO = (
+    "Local informado pelo solicitante, com risco a confirmar pela equipe. "
+    "Vítima consciente segundo o relato do checklist. "
+    "Acesso pela via principal, sem obstáculos relatados."
+)
+
+
+def load_labels(path: str = MOCK_OPENAI_CORPUS) -> Dict[str, Dict[str, Any]]:
+    """Rótulos do corpus indexados pelo texto da transcrição."""
+    rotulos = {}
+    with open(path, encoding="utf-8") as arquivo:
+        for linha in arquivo:
+            if linha.strip():
+                exemplo = json.loads(linha)
+                rotulos[exemplo["text"]] = exemplo
+    return rotulos
+
+
+def _palpite(texto: str) -> str:
+    texto = texto.lower()
+    for categoria, palavras in _PALAVRAS_CHAVE.items():
+        if any(palavra in texto for palavra in palavras):
+            return categoria
+    return "indefinido"
+
+
+class MockOpenAIServer:
+    """
+    Servidor HTTP (em thread) que imita a OpenAI.
+
+    Args:
+        port: Porta (0 = qualquer porta livre)
+        latency_ms, jitter_ms: Média e desvio da latência
+        tail_rate, tail_ms: Fração das requisições com latência extra, e quanto
+        error_rate, error_status: Fração das requisições que falham, e com qual status
+        accuracy: Probabilidade de responder o rótulo do corpus
+        labels: Rótulos do corpus (padrão: MOCK_OPENAI_CORPUS)
+        seed: Semente do sorteio (resultados reprodutíveis)
+    """
+
+    def __init__(
+        self,
+        port: int = 0,
+        latency_ms: float = MOCK_OPENAI_LATENCY_MS,
+        jitter_ms: float = MOCK_OPENAI_JITTER_MS,
+        tail_rate: float = MOCK_OPENAI_TAIL_RATE,
+        tail_ms: float = MOCK_OPENAI_TAIL_MS,
+        error_rate: float = MOCK_OPENAI_ERROR_RATE,
+        error_status: int = MOCK_OPENAI_ERROR_STATUS,
+        accuracy: float = MOCK_OPENAI_ACCURACY,
+        labels: Optional[Dict[str, Dict[str, Any]]] = None,
+        seed: Optional[int] = None,
+        host: str = "127.0.0.1",
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.tail_rate = tail_rate
+        self.tail_ms = tail_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.accuracy = accuracy
+        self.labels = load_labels() if labels is None else labels
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "errors_injected": 0, "tail_injected": 0, "streams": 0}
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> str:
+        """Sobe o servidor em segundo plano e retorna a base_url."""
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-openai", daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _contar(self, campo: str) -> None:
+        with self._lock:
+            self.stats[campo] += 1
+
+    def _sortear(self) -> Dict[str, Any]:
+        """Latência e falha desta requisição."""
+        with self._lock:
+            latencia = max(0.0, self._random.gauss(self.latency_ms, self.jitter_ms))
+            cauda = self._random.random() < self.tail_rate
+            erro = self._random.random() < self.error_rate
+            acerto = self._random.random() < self.accuracy
+            alternativa = self._random.choice(CATEGORIAS)
+        if cauda:
+            latencia += self.tail_ms
+            self._contar("tail_injected")
+        return {"segundos": latencia / 1000, "erro": erro, "acerto": acerto, "alternativa": alternativa}
+
+    def _conteudo(self, pedido: Dict[str, Any], sorteio: Dict[str, Any]) -> str:
+        prompt = pedido["messages"][-1]["content"] if pedido.get("messages") else ""
+        encontrado = _TRANSCRICAO.search(prompt)
+        quer_json = (pedido.get("response_format") or {}).get("type") == "json_object"
+        if encontrado is None and not quer_json:
+            return RELATORIO
+
+        # Prompt em outro formato (ex.: urgência): palpite sobre o prompt inteiro
+        transcricao = encontrado.group(1) if encontrado else prompt
+        rotulo = self.labels.get(transcricao)
+        if rotulo is None:
+            categoria, urgencia = _palpite(transcricao), None
+        else:
+            categoria, urgencia = rotulo["category"], rotulo.get("urgency_level")
+            if not sorteio["acerto"]:
+                alternativas = [c for c in CATEGORIAS if c != categoria]
+                categoria = sorteio["alternativa"] if sorteio["alternativa"] in alternativas else alternativas[0]
+        if categoria in ("policia", "samu", "bombeiros") and urgencia is None:
+            urgencia = "média"
+        if categoria not in ("policia", "samu", "bombeiros"):
+            urgencia = None
+        # Superconjunto dos formatos de classificação, combinada e de urgência
+        return json.dumps({
+            "category": categoria,
+            "confidence": 90,
+            "reasoning": "Resposta do servidor falso de benchmark",
+            "urgency_level": urgencia,
+            "urgency_confidence": 85 if urgencia else None,
+            "urgency_reasoning": "Resposta do servidor falso de benchmark" if urgencia else None,
+        }, ensure_ascii=False)
+
+    def _handler(self):
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _json(self, status: int, corpo: Dict[str, Any]) -> None:
+                dados = json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(dados)))
+                self.end_headers()
+                self.wfile.write(dados)
+
+            def do_POST(self):
+                tamanho = int(self.headers.get("Content-Length", 0))
+                pedido = json.loads(self.rfile.read(tamanho) or b"{}")
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._json(404, {"error": {"message": f"Rota não simulada: {self.path}"}})
+                    return
+
+                servidor._contar("requests")
+                sorteio = servidor._sortear()
+                time.sleep(sorteio["segundos"])
+                if sorteio["erro"]:
+                    servidor._contar("errors_injected")
+                    self._json(servidor.error_status, {"error": {"message": "Erro simulado", "type": "server_error"}})
+                    return
+
+                conteudo = servidor._conteudo(pedido, sorteio)
+                modelo = pedido.get("model", "mock")
+                if pedido.get("stream"):
+                    servidor._contar("streams")
+                    self._stream(modelo, conteudo)
+                    return
+                prompt = " ".join(str(m.get("content", "")) for m in pedido.get("messages", []))
+                self._json(200, {
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": modelo,
+                    "choices": [{
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": conteudo},
+                    }],
+                    # Aproximação de ~4 caracteres por token
+                    "usage": {
+                        "prompt_tokens": len(prompt) // 4,
+                        "completion_tokens": len(conteudo) // 4,
+                        "total_tokens": (len(prompt) + len(conteudo)) // 4,
+                    },
+                })
+
+            def _stream(self, modelo: str, conteudo: str) -> None:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                for palavra in re.findall(r"\S+\s*", conteudo):
+                    pedaco = {
+                        "id": "chatcmpl-mock",
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": modelo,
+                        "choices": [{"index": 0, "delta": {"content": palavra}, "finish_reason": None}],
+                    }
+                    self.wfile.write(f"data: {json.dumps(pedaco, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    time.sleep(0.005)
+                self.wfile.write(b"data: [DONE]\n\n")
+
+        return Handler
+
+
+if __name__ == "__main__":
+    porta = int(sys.argv[1]) if len(sys.argv) > 1 else 8089
+    servidor = MockOpenAIServer(port=porta)
+    print(f"[Mock OpenAI] Ouvindo em {servidor.base_url} "
+          f"(latência {servidor.latency_ms:.0f}±{servidor.jitter_ms:.0f} ms, erros {servidor.error_rate:.0%})")
+    try:
+        servidor._server.serve_forever()
+    except KeyboardInterrupt:
+        servidor.stop()
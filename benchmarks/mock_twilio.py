@@ -0,0 +1,143 @@
+"""
+Servidor falso da API REST do Twilio
+
+Atende só a criação de ligações (POST /2010-04-01/Accounts/<sid>/Calls.json),
+que é o que o despacho de answer_phone.py usa. Para apontar o app para ele:
+
+    TWILIO_API_BASE_URL=http://127.0.0.1:8090 python answer_phone.py
+
+Latência: normal(MOCK_TWILIO_LATENCY_MS, MOCK_TWILIO_JITTER_MS); com
+probabilidade MOCK_TWILIO_ERROR_RATE a resposta é um erro 500.
+
+Uso: python -m benchmarks.mock_twilio [porta]
+"""
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qs
+
+from dotenv import load_dotenv
+
+# Carrega variáveis de ambiente
+load_dotenv()
+
+MOCK_TWILIO_LATENCY_MS = float(os.getenv("MOCK_TWILIO_LATENCY_MS", "150"))
+MOCK_TWILIO_JITTER_MS = float(os.getenv("MOCK_TWILIO_JITTER_MS", "50"))
+MOCK_TWILIO_ERROR_RATE = float(os.getenv("MOCK_TWILIO_ERROR_RATE", "0"))
+
+_CALLS = re.compile(r"^/2010-04-01/Accounts/(\w+)/Calls\.json$")
+
+
+class MockTwilioServer:
+    """
+    Servidor HTTP (em thread) que imita POST .../Calls.json do Twilio.
+
+    Args:
+        port: Porta (0 = qualquer porta livre)
+        latency_ms, jitter_ms: Média e desvio da latência
+        error_rate: Fração das requisições que falham com 500
+        seed: Semente do sorteio
+    """
+
+    def __init__(
+        self,
+        port: int = 0,
+        latency_ms: float = MOCK_TWILIO_LATENCY_MS,
+        jitter_ms: float = MOCK_TWILIO_JITTER_MS,
+        error_rate: float = MOCK_TWILIO_ERROR_RATE,
+        seed: Optional[int] = None,
+        host: str = "127.0.0.1",
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"calls_created": 0, "errors_injected": 0}
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> str:
+        """Sobe o servidor em segundo plano e retorna a base_url."""
+        threading.Thread(target=self._server.serve_forever, name="mock-twilio", daemon=True).start()
+        return self.base_url
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _sortear(self):
+        with self._lock:
+            return max(0.0, self._random.gauss(self.latency_ms, self.jitter_ms)) / 1000, \
+                self._random.random() < self.error_rate
+
+    def _contar(self, campo: str) -> None:
+        with self._lock:
+            self.stats[campo] += 1
+
+    def _handler(self):
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _json(self, status: int, corpo: Dict[str, Any]) -> None:
+                dados = json.dumps(corpo).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(dados)))
+                self.end_headers()
+                self.wfile.write(dados)
+
+            def do_POST(self):
+                tamanho = int(self.headers.get("Content-Length", 0))
+                formulario = parse_qs(self.rfile.read(tamanho).decode("utf-8"))
+                rota = _CALLS.match(self.path.split("?")[0])
+                if rota is None:
+                    self._json(404, {"code": 20404, "message": f"Rota não simulada: {self.path}", "status": 404})
+                    return
+
+                segundos, erro = servidor._sortear()
+                time.sleep(segundos)
+                if erro:
+                    servidor._contar("errors_injected")
+                    self._json(500, {"code": 20500, "message": "Erro simulado", "status": 500})
+                    return
+
+                servidor._contar("calls_created")
+                self._json(201, {
+                    "sid": "CA" + uuid.uuid4().hex,
+                    "account_sid": rota.group(1),
+                    "to": formulario.get("To", [""])[0],
+                    "from": formulario.get("From", [""])[0],
+                    "status": "queued",
+                    "direction": "outbound-api",
+                    "api_version": "2010-04-01",
+                })
+
+        return Handler
+
+
+if __name__ == "__main__":
+    porta = int(sys.argv[1]) if len(sys.argv) > 1 else 8090
+    servidor = MockTwilioServer(port=porta)
+    print(f"[Mock Twilio] Ouvindo em {servidor.base_url} (latência {servidor.latency_ms:.0f} ms)")
+    try:
+        servidor._server.serve_forever()
+    except KeyboardInterrupt:
+        servidor.stop()
@@ -0,0 +1,246 @@
+"""
+Benchmark offline do pacote classifiers
+
+Repete o corpus rotulado (corpus_pt.jsonl) pelo classificador escolhido,
+contra o servidor falso da OpenAI (mock_openai.py), e mede latência
+(p50/p95/p99), chamadas por segundo, taxa de acerto do cache e acurácia:
+
+    python -m benchmarks.run_classifiers classify
+    BENCH_CONCURRENCY=32 MOCK_OPENAI_ERROR_RATE=0.05 python -m benchmarks.run_classifiers aclassify
+
+Alvos:
+    classify / aclassify    classify_emergency_call (síncrono / assíncrono)
+    combined / acombined    classify_call_with_urgency (categoria + urgência)
+    urgency                 classificador de urgência da categoria rotulada
+    report                  gerar_relatorio_conciso_ia
+
+Com BENCH_USE_MOCK=0 o servidor falso não é iniciado e as chamadas vão para o
+OPENAI_BASE_URL do ambiente (por exemplo, um mock_openai rodando à parte).
+O cache persistente e o classificador local ficam desligados, para nada de
+execuções ou treinos anteriores responder no lugar do classificador
+(BENCH_LOCAL_CLASSIFIER=1 mede com o modelo local ligado).
+
+Para CI: BENCH_MAX_P95_MS, BENCH_MIN_ACCURACY e BENCH_MIN_CALLS_PER_SEC fazem
+o processo sair com código 1 se o resultado piorar além do limite, e
+BENCH_OUTPUT grava o resultado em JSON.
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from benchmarks.mock_openai import MOCK_OPENAI_CORPUS, MockOpenAIServer
+
+# Carrega variáveis de ambiente
+load_dotenv()
+
+BENCH_CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "8"))
+# Quantas vezes o corpus é repetido (a partir da 2ª passada, o cache responde)
+BENCH_REPEAT = int(os.getenv("BENCH_REPEAT", "3"))
+BENCH_SEED = int(os.getenv("BENCH_SEED", "42"))
+BENCH_CORPUS = os.getenv("BENCH_CORPUS", MOCK_OPENAI_CORPUS)
+BENCH_USE_MOCK = os.getenv("BENCH_USE_MOCK", "1") == "1"
+BENCH_OUTPUT = os.getenv("BENCH_OUTPUT", "")
+# O modelo local (local_classifier.json do diretório) responderia parte do
+# corpus sem passar pelo mock; 1 = medir com ele ligado
+BENCH_LOCAL_CLASSIFIER = os.getenv("BENCH_LOCAL_CLASSIFIER", "0") == "1"
+# Limites para CI (0 = sem limite)
+BENCH_MAX_P95_MS = float(os.getenv("BENCH_MAX_P95_MS", "0"))
+BENCH_MIN_ACCURACY = float(os.getenv("BENCH_MIN_ACCURACY", "0"))
+BENCH_MIN_CALLS_PER_SEC = float(os.getenv("BENCH_MIN_CALLS_PER_SEC", "0"))
+
+ALVOS = ("classify", "aclassify", "combined", "acombined", "urgency", "report")
+CATEGORIAS_URGENCIA = ("policia", "bombeiros", "samu")
+
+
+def load_corpus(path: str = BENCH_CORPUS) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as arquivo:
+        return [json.loads(linha) for linha in arquivo if linha.strip()]
+
+
+def percentile(valores: List[float], p: float) -> float:
+    """Percentil por posição (nearest rank) de uma lista já ordenada."""
+    if not valores:
+        return 0.0
+    # Posição ceil(p/100 * n), 1-based; p * n antes de dividir evita erro de ponto flutuante
+    indice = max(0, min(len(valores) - 1, math.ceil(p * len(valores) / 100) - 1))
+    return valores[indice]
+
+
+def _preparar_ambiente() -> Optional[MockOpenAIServer]:
+    """Sobe o mock e aponta o cliente da OpenAI para ele (antes de importar classifiers)."""
+    servidor = None
+    if BENCH_USE_MOCK:
+        servidor = MockOpenAIServer(seed=BENCH_SEED)
+        os.environ["OPENAI_BASE_URL"] = servidor.start()
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    # Cache só em memória: um arquivo persistente daria acertos de execuções anteriores
+    os.environ["CLASSIFIER_CACHE_PATH"] = ""
+    os.environ["LOCAL_CLASSIFIER_ENABLED"] = "1" if BENCH_LOCAL_CLASSIFIER else "0"
+    return servidor
+
+
+def _chamadas(alvo: str) -> Tuple[Callable[[Dict[str, Any]], Any], bool]:
+    """(função que roda um exemplo do corpus, se ela é assíncrona)."""
+    import classifiers
+    from classifiers.gerar_relatorio_conciso_ia import gerar_relatorio_conciso_ia
+
+    urgencia = {
+        "policia": classifiers.classify_police_urgency,
+        "bombeiros": classifiers.classify_firefighter_urgency,
+        "samu": classifiers.classify_samu_urgency,
+    }
+    if alvo == "classify":
+        return (lambda exemplo: classifiers.classify_emergency_call(exemplo["text"])), False
+    if alvo == "aclassify":
+        return (lambda exemplo: classifiers.aclassify_emergency_call(exemplo["text"])), True
+    if alvo == "combined":
+        return (lambda exemplo: classifiers.classify_call_with_urgency(exemplo["text"])), False
+    if alvo == "acombined":
+        return (lambda exemplo: classifiers.aclassify_call_with_urgency(exemplo["text"])), True
+    if alvo == "urgency":
+        return (lambda exemplo: urgencia[exemplo["category"]](exemplo["text"])), False
+    return (lambda exemplo: gerar_relatorio_conciso_ia(
+        [f"P0_descricao: {exemplo['text']}"], exemplo["category"]
+    )), False
+
+
+def _avaliar(alvo: str, exemplo: Dict[str, Any], resultado: Any) -> Tuple[Optional[bool], bool]:
+    """(acertou?, caiu no fallback por erro?). Acerto None = não se aplica."""
+    if alvo == "report":
+        return None, str(resultado).startswith("Erro na IA")
+    if alvo in ("combined", "acombined"):
+        resultado = resultado[0]
+    if alvo == "urgency":
+        return resultado.get("urgency_level") == exemplo.get("urgency_level"), False
+    fallback = str(resultado.get("reasoning", "")).startswith("Erro no processamento")
+    return resultado.get("category") == exemplo["category"], fallback
+
+
+def _carga(alvo: str, corpus: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    exemplos = corpus
+    if alvo in ("urgency", "report"):
+        exemplos = [exemplo for exemplo in corpus if exemplo["category"] in CATEGORIAS_URGENCIA]
+    carga = []
+    sorteio = random.Random(BENCH_SEED)
+    for _ in range(BENCH_REPEAT):
+        passada = list(exemplos)
+        sorteio.shuffle(passada)
+        carga.extend(passada)
+    return carga
+
+
+def _rodar_sincrono(funcao, carga: List[Dict[str, Any]]) -> List[Tuple[float, Any]]:
+    def medir(exemplo):
+        inicio = time.perf_counter()
+        resultado = funcao(exemplo)
+        return time.perf_counter() - inicio, resultado
+
+    with ThreadPoolExecutor(max_workers=BENCH_CONCURRENCY) as executor:
+        return list(executor.map(medir, carga))
+
+
+def _rodar_assincrono(funcao, carga: List[Dict[str, Any]]) -> List[Tuple[float, Any]]:
+    async def rodar():
+        limite = asyncio.Semaphore(BENCH_CONCURRENCY)
+
+        async def medir(exemplo):
+            async with limite:
+                inicio = time.perf_counter()
+                resultado = await funcao(exemplo)
+                return time.perf_counter() - inicio, resultado
+
+        return await asyncio.gather(*(medir(exemplo) for exemplo in carga))
+
+    return asyncio.run(rodar())
+
+
+def run_benchmark(alvo: str) -> Dict[str, Any]:
+    """Roda o benchmark do alvo e retorna o resumo."""
+    if alvo not in ALVOS:
+        raise ValueError(f"Alvo desconhecido: {alvo} (use {', '.join(ALVOS)})")
+    servidor = _preparar_ambiente()
+    try:
+        from classifiers import get_cache_stats, get_llm_stats
+
+        funcao, assincrona = _chamadas(alvo)
+        carga = _carga(alvo, load_corpus())
+        inicio = time.perf_counter()
+        medicoes = (_rodar_assincrono if assincrona else _rodar_sincrono)(funcao, carga)
+        duracao = time.perf_counter() - inicio
+
+        latencias = sorted(1000 * segundos for segundos, _ in medicoes)
+        avaliacoes = [_avaliar(alvo, exemplo, resultado) for exemplo, (_, resultado) in zip(carga, medicoes)]
+        acertos = [acertou for acertou, _ in avaliacoes if acertou is not None]
+        resumo = {
+            "target": alvo,
+            "calls": len(carga),
+            "concurrency": BENCH_CONCURRENCY,
+            "duration_s": round(duracao, 3),
+            "calls_per_sec": round(len(carga) / duracao, 2) if duracao else 0.0,
+            "latency_ms": {
+                "p50": round(percentile(latencias, 50), 1),
+                "p95": round(percentile(latencias, 95), 1),
+                "p99": round(percentile(latencias, 99), 1),
+                "max": round(latencias[-1], 1) if latencias else 0.0,
+            },
+            "accuracy": round(sum(acertos) / len(acertos), 4) if acertos else None,
+            "error_fallbacks": sum(1 for _, fallback in avaliacoes if fallback),
+            "cache": get_cache_stats(),
+            "llm": get_llm_stats()["operations"],
+            "mock": dict(servidor.stats) if servidor else None,
+        }
+    finally:
+        if servidor:
+            servidor.stop()
+    return resumo
+
+
+def check_limits(resumo: Dict[str, Any]) -> List[str]:
+    """Limites de CI violados (lista vazia = passou)."""
+    violacoes = []
+    if BENCH_MAX_P95_MS and resumo["latency_ms"]["p95"] > BENCH_MAX_P95_MS:
+        violacoes.append(f"p95 {resumo['latency_ms']['p95']} ms > {BENCH_MAX_P95_MS} ms")
+    if BENCH_MIN_ACCURACY and resumo["accuracy"] is not None and resumo["accuracy"] < BENCH_MIN_ACCURACY:
+        violacoes.append(f"acurácia {resumo['accuracy']:.2%} < {BENCH_MIN_ACCURACY:.2%}")
+    if BENCH_MIN_CALLS_PER_SEC and resumo["calls_per_sec"] < BENCH_MIN_CALLS_PER_SEC:
+        violacoes.append(f"{resumo['calls_per_sec']} chamadas/s < {BENCH_MIN_CALLS_PER_SEC}")
+    return violacoes
+
+
+def print_summary(resumo: Dict[str, Any]) -> None:
+    latencia = resumo["latency_ms"]
+    print(f"\n[Benchmark] {resumo['target']}: {resumo['calls']} chamadas em {resumo['duration_s']:.2f}s "
+          f"({resumo['calls_per_sec']} chamadas/s, concorrência {resumo['concurrency']})")
+    print(f"  latência (ms): p50 {latencia['p50']}  p95 {latencia['p95']}  p99 {latencia['p99']}  max {latencia['max']}")
+    if resumo["accuracy"] is not None:
+        print(f"  acurácia: {resumo['accuracy']:.2%}")
+    print(f"  fallbacks por erro da OpenAI: {resumo['error_fallbacks']}")
+    if resumo["cache"].get("enabled"):
+        print(f"  cache: hit_rate {resumo['cache']['hit_rate']:.2%} ({resumo['cache']['entries']} entradas)")
+    if resumo["mock"]:
+        print(f"  mock OpenAI: {resumo['mock']['requests']} requisições, "
+              f"{resumo['mock']['errors_injected']} erros e {resumo['mock']['tail_injected']} caudas simuladas")
+
+
+if __name__ == "__main__":
+    alvo = sys.argv[1] if len(sys.argv) > 1 else "classify"
+    if alvo not in ALVOS:
+        print(f"Uso: python -m benchmarks.run_classifiers {'|'.join(ALVOS)}")
+        sys.exit(1)
+    resumo = run_benchmark(alvo)
+    print_summary(resumo)
+    if BENCH_OUTPUT:
+        with open(BENCH_OUTPUT, "w", encoding="utf-8") as arquivo:
+            json.dump(resumo, arquivo, ensure_ascii=False, indent=2)
+    violacoes = check_limits(resumo)
+    for violacao in violacoes:
+        print(f"[Benchmark] Limite violado: {violacao}")
+    sys.exit(1 if violacoes else 0)
@@ -0,0 +1,373 @@
+"""
+Particionamento mensal de `calls` e arquivo frio dos textos longos
+
+A maior parte do tamanho de `calls` está em transcript e reasoning, que quase
+só são lidos nas primeiras semanas. Este módulo:
+
+- (PostgreSQL) converte `calls` numa tabela particionada por mês
+  (PARTITION BY RANGE (timestamp)) e cria as partições dos próximos meses;
+- arquiva os meses antigos: copia transcript e reasoning para um arquivo
+  gzip por mês (CALL_ARCHIVE_DIR/calls_AAAA_MM.jsonl.gz) e limpa as colunas
+  no banco, deixando só as colunas curtas que os painéis consultam;
+- reidrata sob demanda os registros arquivados (rehydrate), usado pelo
+  histórico quando o texto é pedido.
+
+O arquivamento funciona em qualquer banco; o particionamento é só PostgreSQL.
+
+    python call_archive.py migrate       # converte calls em tabela particionada
+    python call_archive.py partitions    # cria as partições dos próximos meses
+    python call_archive.py archive [N]   # arquiva meses com mais de N meses
+
+As partições futuras precisam ser criadas antes de o mês chegar; senão as
+chamadas caem em calls_default. O app_painel.py verifica isso ao subir e a
+cada CALL_PARTITION_CHECK_HOURS (start_partition_maintenance), e o comando
+archive também. Se o app_painel não estiver rodando o tempo todo, agende no
+cron, por exemplo uma vez por dia:
+
+    0 3 * * * cd /app && python call_archive.py partitions
+
+Se mesmo assim um mês cair em calls_default, a criação da partição move
+essas linhas para ela na mesma transação.
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import func, or_, select, text, update
+
+from database import engine, Call
+
+load_dotenv()
+
+CALL_ARCHIVE_DIR = os.getenv("CALL_ARCHIVE_DIR", "call_archive")
+# Meses completos mantidos com texto no banco antes de arquivar
+CALL_ARCHIVE_AFTER_MONTHS = int(os.getenv("CALL_ARCHIVE_AFTER_MONTHS", "3"))
+# Quantos meses de arquivo ficam em memória para a reidratação
+CALL_ARCHIVE_CACHE_MONTHS = int(os.getenv("CALL_ARCHIVE_CACHE_MONTHS", "2"))
+# Partições criadas à frente do mês atual
+CALL_PARTITION_MONTHS_AHEAD = int(os.getenv("CALL_PARTITION_MONTHS_AHEAD", "3"))
+# Intervalo da verificação de partições em segundo plano (0 = desligada)
+CALL_PARTITION_CHECK_HOURS = float(os.getenv("CALL_PARTITION_CHECK_HOURS", "24"))
+CALL_ARCHIVE_BATCH_SIZE = 1000
+
+
+def month_start(timestamp: datetime) -> datetime:
+    """Primeiro instante do mês de `timestamp`."""
+    return timestamp.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(inicio: datetime, meses: int) -> datetime:
+    """Início do mês `meses` depois (ou antes, se negativo) de `inicio`."""
+    indice = inicio.year * 12 + inicio.month - 1 + meses
+    return inicio.replace(year=indice // 12, month=indice % 12 + 1, day=1)
+
+
+def archive_path(inicio: datetime) -> str:
+    """Arquivo gzip do mês que começa em `inicio`."""
+    return os.path.join(CALL_ARCHIVE_DIR, f"calls_{inicio:%Y_%m}.jsonl.gz")
+
+
+# ============================================================================
+# Particionamento (PostgreSQL)
+# ============================================================================
+
+def is_partitioned(connection) -> bool:
+    """True se `calls` já é uma tabela particionada."""
+    if connection.dialect.name != "postgresql":
+        return False
+    return connection.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = 'calls'"
+    )).first() is not None
+
+
+def _criar_particao(connection, inicio: datetime) -> None:
+    fim = add_months(inicio, 1)
+    nome = f"calls_{inicio:%Y_%m}"
+    limites = f"FROM ('{inicio:%Y-%m-%d}') TO ('{fim:%Y-%m-%d}')"
+    if connection.execute(text(f"SELECT to_regclass('{nome}')")).scalar() is not None:
+        return
+
+    no_mes = f"timestamp >= '{inicio:%Y-%m-%d}' AND timestamp < '{fim:%Y-%m-%d}'"
+    na_default = connection.execute(text(
+        f"SELECT to_regclass('calls_default') IS NOT NULL "
+        f"AND EXISTS (SELECT 1 FROM calls_default WHERE {no_mes})"
+    )).scalar()
+    if not na_default:
+        connection.execute(text(f"CREATE TABLE {nome} PARTITION OF calls FOR VALUES {limites}"))
+        return
+
+    # O PostgreSQL não cria a partição se calls_default já tem linhas do mês:
+    # elas são movidas para uma tabela nova, que então é anexada
+    connection.execute(text(f"CREATE TABLE {nome} (LIKE calls INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    movidas = connection.execute(text(
+        f"WITH movidas AS (DELETE FROM calls_default WHERE {no_mes} RETURNING *) "
+        f"INSERT INTO {nome} SELECT * FROM movidas"
+    )).rowcount
+    connection.execute(text(f"ALTER TABLE calls ATTACH PARTITION {nome} FOR VALUES {limites}"))
+    print(f"[Arquivo] {movidas} chamadas de {inicio:%m/%Y} movidas de calls_default para {nome}")
+
+
+def ensure_partitions(months_ahead: int = CALL_PARTITION_MONTHS_AHEAD) -> int:
+    """
+    Cria as partições do mês atual e dos próximos `months_ahead` meses.
+    Não faz nada se `calls` não for particionada.
+
+    Returns:
+        Quantidade de meses verificados
+    """
+    with engine.begin() as conn:
+        if not is_partitioned(conn):
+            return 0
+        atual = month_start(datetime.now())
+        for meses in range(months_ahead + 1):
+            _criar_particao(conn, add_months(atual, meses))
+    return months_ahead + 1
+
+
+def start_partition_maintenance(interval_hours: float = CALL_PARTITION_CHECK_HOURS) -> Optional[threading.Thread]:
+    """
+    Roda ensure_partitions agora e a cada `interval_hours`, numa thread em
+    segundo plano (erros são só registrados). Retorna a thread, ou None se
+    a verificação estiver desligada.
+    """
+    if interval_hours <= 0:
+        return None
+
+    def verificar():
+        while True:
+            try:
+                ensure_partitions()
+            except Exception as e:
+                print(f"[Arquivo] Erro ao verificar partições: {e}")
+            time.sleep(interval_hours * 3600)
+
+    thread = threading.Thread(target=verificar, name="call-partitions", daemon=True)
+    thread.start()
+    return thread
+
+
+def migrate_to_partitioned() -> None:
+    """
+    Converte `calls` numa tabela particionada por mês, numa única transação.
+
+    A chave primária passa a ser (id, timestamp), exigência do PostgreSQL para
+    tabelas particionadas. Registros sem timestamp vão para a partição default.
+    A tabela fica bloqueada durante a cópia: rode numa janela de manutenção.
+    """
+    if engine.dialect.name != "postgresql":
+        raise RuntimeError("Particionamento só é suportado no PostgreSQL")
+
+    with engine.begin() as conn:
+        if is_partitioned(conn):
+            print("[Arquivo] calls já é particionada")
+            return
+        conn.execute(text("ALTER TABLE calls RENAME TO calls_legacy"))
+        conn.execute(text(
+            "CREATE TABLE calls ("
+            " id VARCHAR NOT NULL,"
+            " timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),"
+            " transcript TEXT,"
+            " category VARCHAR,"
+            " confidence INTEGER,"
+            " urgency_level VARCHAR,"
+            " reasoning TEXT,"
+            " region VARCHAR,"
+            " PRIMARY KEY (id, timestamp)"
+            ") PARTITION BY RANGE (timestamp)"
+        ))
+        conn.execute(text("CREATE TABLE calls_default PARTITION OF calls DEFAULT"))
+
+        primeiro, ultimo = conn.execute(text("SELECT min(timestamp), max(timestamp) FROM calls_legacy")).one()
+        inicio = month_start(primeiro or datetime.now())
+        fim = add_months(month_start(max(ultimo or datetime.now(), datetime.now())), CALL_PARTITION_MONTHS_AHEAD)
+        meses = 0
+        while inicio <= fim:
+            _criar_particao(conn, inicio)
+            inicio = add_months(inicio, 1)
+            meses += 1
+
+        copiadas = conn.execute(text(
+            "INSERT INTO calls (id, timestamp, transcript, category, confidence, urgency_level, reasoning, region) "
+            "SELECT id, COALESCE(timestamp, 'epoch'::timestamp), transcript, category, confidence, "
+            "urgency_level, reasoning, region FROM calls_legacy"
+        )).rowcount
+        conn.execute(text("DROP TABLE calls_legacy"))
+        # Os índices da tabela antiga saíram com ela; recria os do modelo
+        for index in Call.__table__.indexes:
+            index.create(bind=conn)
+    print(f"[Arquivo] calls particionada: {copiadas} chamadas em {meses} partições mensais")
+
+
+# ============================================================================
+# Arquivo frio
+# ============================================================================
+
+def _ler_arquivo(caminho: str) -> Dict[str, Dict[str, Optional[str]]]:
+    registros = {}
+    with gzip.open(caminho, "rt", encoding="utf-8") as arquivo:
+        for linha in arquivo:
+            dados = json.loads(linha)
+            registros[dados["id"]] = {"transcript": dados["transcript"], "reasoning": dados["reasoning"]}
+    return registros
+
+
+def _gravar_arquivo(caminho: str, registros: Dict[str, Dict[str, Optional[str]]]) -> None:
+    """Grava num arquivo temporário e só então substitui o original."""
+    temporario = caminho + ".tmp"
+    with gzip.open(temporario, "wt", encoding="utf-8") as arquivo:
+        for call_id in sorted(registros):
+            arquivo.write(json.dumps({"id": call_id, **registros[call_id]}, ensure_ascii=False) + "\n")
+    with open(temporario, "rb") as arquivo:
+        os.fsync(arquivo.fileno())
+    os.replace(temporario, caminho)
+
+
+def archive_month(inicio: datetime) -> int:
+    """
+    Arquiva transcript e reasoning das chamadas do mês que começa em `inicio`.
+
+    O arquivo do mês é gravado (e sincronizado no disco) antes de as colunas
+    serem limpas no banco; rodar de novo só acrescenta o que chegou depois.
+
+    Returns:
+        Quantidade de chamadas arquivadas
+    """
+    inicio = month_start(inicio)
+    fim = add_months(inicio, 1)
+    no_mes = (Call.timestamp >= inicio) & (Call.timestamp < fim)
+    com_texto = or_(Call.transcript.isnot(None), Call.reasoning.isnot(None))
+
+    with engine.connect() as conn:
+        novos = {
+            call_id: {"transcript": transcript, "reasoning": reasoning}
+            for call_id, transcript, reasoning in conn.execution_options(yield_per=CALL_ARCHIVE_BATCH_SIZE).execute(
+                select(Call.id, Call.transcript, Call.reasoning).where(no_mes).where(com_texto)
+            )
+        }
+    if not novos:
+        return 0
+
+    os.makedirs(CALL_ARCHIVE_DIR, exist_ok=True)
+    caminho = archive_path(inicio)
+    registros = _ler_arquivo(caminho) if os.path.exists(caminho) else {}
+    registros.update(novos)
+    _gravar_arquivo(caminho, registros)
+    _cache_arquivos.descartar(caminho)
+
+    # Transações curtas, para não segurar locks do mês inteiro
+    ids = list(novos)
+    for posicao in range(0, len(ids), CALL_ARCHIVE_BATCH_SIZE):
+        with engine.begin() as conn:
+            conn.execute(
+                update(Call.__table__)
+                .where(no_mes)
+                .where(Call.id.in_(ids[posicao:posicao + CALL_ARCHIVE_BATCH_SIZE]))
+                .values(transcript=None, reasoning=None)
+            )
+    print(f"[Arquivo] {len(novos)} chamadas de {inicio:%m/%Y} arquivadas em {caminho}")
+    return len(novos)
+
+
+def archive_old_months(after_months: int = CALL_ARCHIVE_AFTER_MONTHS) -> int:
+    """
+    Arquiva todos os meses anteriores aos últimos `after_months` meses completos.
+
+    Returns:
+        Total de chamadas arquivadas
+    """
+    limite = add_months(month_start(datetime.now()), -after_months)
+    with engine.connect() as conn:
+        primeiro = conn.execute(
+            select(func.min(Call.timestamp))
+            .where(Call.timestamp < limite)
+            .where(or_(Call.transcript.isnot(None), Call.reasoning.isnot(None)))
+        ).scalar()
+    if primeiro is None:
+        return 0
+
+    total = 0
+    inicio = month_start(primeiro)
+    while inicio < limite:
+        total += archive_month(inicio)
+        inicio = add_months(inicio, 1)
+    return total
+
+
+class _ArchiveCache:
+    """Últimos meses de arquivo lidos, para não descompactar o mês a cada registro."""
+
+    def __init__(self, max_months: int):
+        self.max_months = max_months
+        self._lock = threading.Lock()
+        self._meses: "OrderedDict[str, Dict[str, Dict[str, Optional[str]]]]" = OrderedDict()
+
+    def get(self, caminho: str) -> Dict[str, Dict[str, Optional[str]]]:
+        with self._lock:
+            if caminho in self._meses:
+                self._meses.move_to_end(caminho)
+                return self._meses[caminho]
+        registros = _ler_arquivo(caminho)
+        with self._lock:
+            self._meses[caminho] = registros
+            while len(self._meses) > self.max_months:
+                self._meses.popitem(last=False)
+        return registros
+
+    def descartar(self, caminho: str) -> None:
+        with self._lock:
+            self._meses.pop(caminho, None)
+
+
+_cache_arquivos = _ArchiveCache(CALL_ARCHIVE_CACHE_MONTHS)
+
+
+def rehydrate(items: Iterable[Dict[str, Any]]) -> None:
+    """
+    Preenche transcript e reasoning dos registros arquivados, no lugar.
+
+    Args:
+        items: Dicts com id, timestamp (datetime), transcript e reasoning
+    """
+    for item in items:
+        if item.get("transcript") is not None or item.get("reasoning") is not None:
+            continue
+        if not item.get("timestamp"):
+            continue
+        caminho = archive_path(month_start(item["timestamp"]))
+        if not os.path.exists(caminho):
+            continue
+        arquivado = _cache_arquivos.get(caminho).get(item["id"])
+        if arquivado:
+            item.update(arquivado)
+
+
+def load_archived_call(call_id: str, timestamp: datetime) -> Optional[Dict[str, Optional[str]]]:
+    """transcript e reasoning arquivados de uma chamada, ou None."""
+    item: Dict[str, Any] = {"id": call_id, "timestamp": timestamp, "transcript": None, "reasoning": None}
+    rehydrate([item])
+    if item["transcript"] is None and item["reasoning"] is None:
+        return None
+    return {"transcript": item["transcript"], "reasoning": item["reasoning"]}
+
+
+if __name__ == "__main__":
+    comando = sys.argv[1] if len(sys.argv) > 1 else ""
+    if comando == "migrate":
+        migrate_to_partitioned()
+    elif comando == "partitions":
+        print(f"[Arquivo] {ensure_partitions()} partições mensais verificadas")
+    elif comando == "archive":
+        meses = int(sys.argv[2]) if len(sys.argv) > 2 else CALL_ARCHIVE_AFTER_MONTHS
+        ensure_partitions()
+        print(f"[Arquivo] {archive_old_months(meses)} chamadas arquivadas")
+    else:
+        print("Uso: python call_archive.py migrate|partitions|archive [meses]")
+        sys.exit(1)
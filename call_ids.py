@@ -0,0 +1,68 @@
+"""
+Geração de IDs de chamada
+
+IDs no formato ULID (https://github.com/ulid/spec): 48 bits de timestamp em ms
++ 80 bits aleatórios, em base32 de Crockford (26 caracteres). Não precisam
+consultar o banco, não colidem entre requisições simultâneas e ordenam por
+tempo como string, o que mantém os inserts no fim do índice da chave primária.
+
+    generate_call_id()        -> "call_01JAD3ZQ4Q6V7Y8X9W0T1S2R3P"
+    generate_call_id("call_test") -> "call_test_01JAD3ZQ4Q..."
+"""
+import os
+import time
+import threading
+from datetime import datetime
+
+_CROCKFORD = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_MAX_RANDOM = (1 << 80) - 1
+
+_lock = threading.Lock()
+_ultimo_ms = -1
+_ultimo_random = 0
+
+
+def _encode(valor: int, tamanho: int) -> str:
+    chars = []
+    for _ in range(tamanho):
+        chars.append(_CROCKFORD[valor & 31])
+        valor >>= 5
+    return "".join(reversed(chars))
+
+
+def new_ulid() -> str:
+    """
+    Gera um ULID monotônico: dentro do mesmo milissegundo a parte aleatória é
+    incrementada, então IDs gerados neste processo são sempre crescentes.
+    """
+    global _ultimo_ms, _ultimo_random
+    with _lock:
+        agora_ms = time.time_ns() // 1_000_000
+        if agora_ms <= _ultimo_ms:
+            # Mesmo ms (ou relógio voltou): mantém o timestamp e incrementa
+            agora_ms = _ultimo_ms
+            _ultimo_random += 1
+            if _ultimo_random > _MAX_RANDOM:
+                agora_ms += 1
+                _ultimo_random = int.from_bytes(os.urandom(10), "big") >> 1
+        else:
+            # Metade superior livre para incrementos dentro do mesmo ms
+            _ultimo_random = int.from_bytes(os.urandom(10), "big") >> 1
+        _ultimo_ms = agora_ms
+        return _encode(agora_ms, 10) + _encode(_ultimo_random, 16)
+
+
+def generate_call_id(prefix: str = "call") -> str:
+    """Gera um ID de chamada único e ordenável por tempo (ex: "call_01JAD3...")."""
+    return f"{prefix}_{new_ulid()}"
+
+
+def call_id_timestamp(call_id: str) -> datetime:
+    """Extrai o horário de criação de um ID gerado por generate_call_id."""
+    ulid = call_id.rsplit("_", 1)[-1]
+    if len(ulid) != 26:
+        raise ValueError(f"ID sem ULID: '{call_id}'")
+    ms = 0
+    for char in ulid[:10]:
+        ms = ms * 32 + _CROCKFORD.index(char)
+    return datetime.fromtimestamp(ms / 1000)
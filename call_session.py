@@ -0,0 +1,224 @@
+"""
+Armazenamento de sessões de chamada (por CallSid)
+
+Cada ligação do Twilio tem seu próprio CallSid. Guardamos aqui as respostas do
+checklist (e qualquer outro estado da chamada) separadas por CallSid, para que
+duas ligações simultâneas não sobrescrevam os dados uma da outra.
+
+Backends disponíveis (variável CALL_SESSION_BACKEND):
+  - "memory"   (padrão): dicionário em memória com TTL e limite de tamanho.
+                Serve para um único processo.
+  - "database": tabela `call_sessions` no banco configurado em database.py.
+                Permite que vários workers atendam webhooks da mesma chamada.
+"""
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CALL_SESSION_BACKEND = os.getenv("CALL_SESSION_BACKEND", "memory")
+CALL_SESSION_TTL_SECONDS = int(os.getenv("CALL_SESSION_TTL_SECONDS", "3600"))
+CALL_SESSION_MAX_SESSIONS = int(os.getenv("CALL_SESSION_MAX_SESSIONS", "10000"))
+
+
+def _nova_sessao() -> Dict[str, Any]:
+    """Estado inicial de uma chamada."""
+    return {"respostas": []}
+
+
+class InMemorySessionBackend:
+    """
+    Backend em memória com expiração por TTL e limite de sessões (LRU).
+
+    Args:
+        ttl_seconds: Tempo sem atividade até a sessão expirar
+        max_sessions: Número máximo de sessões mantidas; as menos usadas são descartadas
+    """
+
+    def __init__(self, ttl_seconds: int = CALL_SESSION_TTL_SECONDS, max_sessions: int = CALL_SESSION_MAX_SESSIONS):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._dados: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _expirar(self, agora: float) -> None:
+        # As entradas estão em ordem de último uso, então as expiradas ficam no início
+        while self._dados:
+            call_sid, (_, atualizado_em) = next(iter(self._dados.items()))
+            if agora - atualizado_em < self.ttl_seconds:
+                break
+            self._dados.pop(call_sid)
+
+    def load(self, call_sid: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            agora = time.monotonic()
+            self._expirar(agora)
+            entrada = self._dados.get(call_sid)
+            if entrada is None:
+                return None
+            self._dados.move_to_end(call_sid)
+            return json.loads(json.dumps(entrada[0]))
+
+    def save(self, call_sid: str, dados: Dict[str, Any]) -> None:
+        with self._lock:
+            agora = time.monotonic()
+            self._dados[call_sid] = (json.loads(json.dumps(dados)), agora)
+            self._dados.move_to_end(call_sid)
+            self._expirar(agora)
+            while len(self._dados) > self.max_sessions:
+                self._dados.popitem(last=False)
+
+    def delete(self, call_sid: str) -> None:
+        with self._lock:
+            self._dados.pop(call_sid, None)
+
+    def update(self, call_sid: str, alterar: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+        with self._lock:
+            dados = self.load(call_sid) or _nova_sessao()
+            alterar(dados)
+            self.save(call_sid, dados)
+            return dados
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._expirar(time.monotonic())
+            return len(self._dados)
+
+
+class DatabaseSessionBackend:
+    """
+    Backend compartilhado usando a tabela `call_sessions` (ver database.py).
+
+    As atualizações usam SELECT ... FOR UPDATE, então webhooks da mesma chamada
+    processados por workers diferentes não perdem respostas.
+    """
+
+    def __init__(self, ttl_seconds: int = CALL_SESSION_TTL_SECONDS):
+        # Import tardio: o backend em memória não precisa de banco configurado
+        from database import SessionLocal, CallSessionRecord, init_db
+
+        self.ttl_seconds = ttl_seconds
+        self._SessionLocal = SessionLocal
+        self._Record = CallSessionRecord
+        init_db()
+
+    def _expirado(self, registro) -> bool:
+        return registro.updated_at < datetime.now() - timedelta(seconds=self.ttl_seconds)
+
+    def load(self, call_sid: str) -> Optional[Dict[str, Any]]:
+        db = self._SessionLocal()
+        try:
+            registro = db.get(self._Record, call_sid)
+            if registro is None or self._expirado(registro):
+                return None
+            return json.loads(registro.data)
+        finally:
+            db.close()
+
+    def save(self, call_sid: str, dados: Dict[str, Any]) -> None:
+        db = self._SessionLocal()
+        try:
+            db.merge(self._Record(call_sid=call_sid, data=json.dumps(dados), updated_at=datetime.now()))
+            db.commit()
+        finally:
+            db.close()
+
+    def delete(self, call_sid: str) -> None:
+        db = self._SessionLocal()
+        try:
+            db.query(self._Record).filter(self._Record.call_sid == call_sid).delete()
+            db.commit()
+        finally:
+            db.close()
+
+    def update(self, call_sid: str, alterar: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+        db = self._SessionLocal()
+        try:
+            registro = (
+                db.query(self._Record)
+                .filter(self._Record.call_sid == call_sid)
+                .with_for_update()
+                .one_or_none()
+            )
+            if registro is None or self._expirado(registro):
+                dados = _nova_sessao()
+            else:
+                dados = json.loads(registro.data)
+            alterar(dados)
+            if registro is None:
+                db.add(self._Record(call_sid=call_sid, data=json.dumps(dados), updated_at=datetime.now()))
+            else:
+                registro.data = json.dumps(dados)
+                registro.updated_at = datetime.now()
+            db.commit()
+            return dados
+        finally:
+            db.close()
+
+    def purge_expired(self) -> int:
+        """Remove sessões expiradas. Retorna quantas foram apagadas."""
+        db = self._SessionLocal()
+        try:
+            limite = datetime.now() - timedelta(seconds=self.ttl_seconds)
+            apagadas = db.query(self._Record).filter(self._Record.updated_at < limite).delete()
+            db.commit()
+            return apagadas
+        finally:
+            db.close()
+
+
+class CallSession:
+    """
+    Store de sessões de chamada indexado por CallSid.
+
+    Args:
+        backend: InMemorySessionBackend, DatabaseSessionBackend ou outro objeto
+            com os métodos load/save/delete/update
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else create_backend()
+
+    def start(self, call_sid: str) -> None:
+        """Inicia (ou reinicia) a sessão de uma chamada nova."""
+        self.backend.save(call_sid, _nova_sessao())
+
+    def get(self, call_sid: str) -> Dict[str, Any]:
+        """Retorna o estado da chamada (vazio se não existir ou tiver expirado)."""
+        return self.backend.load(call_sid) or _nova_sessao()
+
+    def update(self, call_sid: str, alterar: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+        """Aplica `alterar` ao estado da chamada de forma atômica e retorna o novo estado."""
+        return self.backend.update(call_sid, alterar)
+
+    def set_value(self, call_sid: str, chave: str, valor: Any) -> None:
+        """Grava um campo qualquer na sessão da chamada."""
+        self.update(call_sid, lambda dados: dados.__setitem__(chave, valor))
+
+    def append_resposta(self, call_sid: str, resposta: str) -> List[str]:
+        """Adiciona uma resposta do checklist e retorna a lista atualizada."""
+        return self.update(call_sid, lambda dados: dados["respostas"].append(resposta))["respostas"]
+
+    def get_respostas(self, call_sid: str) -> List[str]:
+        """Retorna as respostas coletadas até agora na chamada."""
+        return self.get(call_sid)["respostas"]
+
+    def end(self, call_sid: str) -> None:
+        """Descarta a sessão da chamada."""
+        self.backend.delete(call_sid)
+
+
+def create_backend(nome: str = CALL_SESSION_BACKEND):
+    """Cria o backend configurado em CALL_SESSION_BACKEND."""
+    if nome == "memory":
+        return InMemorySessionBackend()
+    if nome == "database":
+        return DatabaseSessionBackend()
+    raise ValueError(f"CALL_SESSION_BACKEND inválido: '{nome}' (use 'memory' ou 'database')")
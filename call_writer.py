@@ -0,0 +1,330 @@
+"""
+Persistência write-behind das chamadas classificadas
+
+Os webhooks não esperam mais o commit no banco: o registro da chamada é
+anexado a um arquivo local (CALL_WRITER_SPILL_PATH) e uma thread grava os
+registros em lote (um único INSERT ... VALUES por lote), quando o lote enche
+ou a cada intervalo.
+
+O arquivo é o log da fila: a thread lê os registros dele a partir do último
+offset confirmado no banco, então nada fica acumulado em memória, nem durante
+uma queda do banco. Na inicialização a thread simplesmente continua do início
+do arquivo (IDs repetidos são ignorados pelo INSERT), sem travar a subida do
+app se o banco estiver fora. Quando tudo o que foi anexado está no banco o
+arquivo é truncado; sob tráfego contínuo, quando a parte já gravada passa de
+CALL_WRITER_SPILL_COMPACT_BYTES (e é maior que o resto), o arquivo é
+compactado para conter só o que falta gravar.
+
+Back-pressure: com CALL_WRITER_QUEUE_SIZE registros ainda não gravados,
+enqueue espera até CALL_WRITER_ENQUEUE_TIMEOUT e, se o banco continuar atrás,
+anexa o registro mesmo assim (ele fica só no arquivo até o banco voltar). O
+webhook nunca fica preso esperando o banco.
+"""
+import os
+import json
+import time
+import shutil
+import asyncio
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from database import bulk_insert_calls, engine
+from stats_rollup import apply_rollup
+from tracing import span
+
+load_dotenv()
+
+CALL_WRITER_BATCH_SIZE = int(os.getenv("CALL_WRITER_BATCH_SIZE", "200"))
+CALL_WRITER_FLUSH_INTERVAL = float(os.getenv("CALL_WRITER_FLUSH_INTERVAL", "0.5"))
+# Registros ainda não gravados a partir dos quais enqueue espera (back-pressure)
+CALL_WRITER_QUEUE_SIZE = int(os.getenv("CALL_WRITER_QUEUE_SIZE", "10000"))
+CALL_WRITER_ENQUEUE_TIMEOUT = float(os.getenv("CALL_WRITER_ENQUEUE_TIMEOUT", "2"))
+CALL_WRITER_SPILL_PATH = os.getenv("CALL_WRITER_SPILL_PATH", "call_writer_spill.jsonl")
+# Compacta o arquivo quando a parte já gravada passa deste tamanho
+CALL_WRITER_SPILL_COMPACT_BYTES = int(os.getenv("CALL_WRITER_SPILL_COMPACT_BYTES", str(8 * 1024 * 1024)))
+# fsync a cada registro: mais seguro contra queda da máquina, mais lento
+CALL_WRITER_FSYNC = os.getenv("CALL_WRITER_FSYNC", "0") == "1"
+
+
+def _serializar(call_data: Dict[str, Any]) -> str:
+    dados = dict(call_data)
+    if isinstance(dados.get("timestamp"), datetime):
+        dados["timestamp"] = dados["timestamp"].isoformat()
+    return json.dumps(dados, ensure_ascii=False)
+
+
+def _desserializar(linha: str) -> Dict[str, Any]:
+    dados = json.loads(linha)
+    if dados.get("timestamp"):
+        dados["timestamp"] = datetime.fromisoformat(dados["timestamp"])
+    return dados
+
+
+class CallWriteBehind:
+    """
+    Fila de gravação em lote das chamadas, guardada no arquivo de segurança.
+
+    Args:
+        spill_path: Arquivo append-only com os registros a gravar
+        batch_size: Máximo de registros por INSERT
+        flush_interval: Tempo máximo (s) que um registro espera para formar um lote
+        max_queue: Registros não gravados a partir dos quais enqueue espera
+        compact_bytes: Parte já gravada do arquivo que dispara a compactação
+    """
+
+    def __init__(
+        self,
+        spill_path: str = CALL_WRITER_SPILL_PATH,
+        batch_size: int = CALL_WRITER_BATCH_SIZE,
+        flush_interval: float = CALL_WRITER_FLUSH_INTERVAL,
+        max_queue: int = CALL_WRITER_QUEUE_SIZE,
+        compact_bytes: int = CALL_WRITER_SPILL_COMPACT_BYTES,
+    ):
+        self.spill_path = spill_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.compact_bytes = compact_bytes
+        self._lock = threading.Lock()
+        # Avisado a cada registro anexado e a cada lote confirmado
+        self._mudou = threading.Condition(self._lock)
+        self._start_lock = threading.Lock()
+        # Aberto enquanto a thread roda; só a thread fecha
+        self._spill = None
+        # Tamanho do arquivo e offset até onde tudo já está no banco
+        self._fim = 0
+        self._gravado_ate = 0
+        # Registros entre _gravado_ate e _fim
+        self._pendentes = 0
+        self._parar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Chamados com as chamadas novas de cada lote gravado (na thread de gravação)
+        self._listeners: List[Callable[[List[Dict[str, Any]]], None]] = []
+        self.stats = {"enqueued": 0, "written": 0, "batches": 0, "overflow": 0, "errors": 0, "compactions": 0}
+
+    def add_listener(self, callback: Callable[[List[Dict[str, Any]]], None]) -> None:
+        """Registra uma função chamada com cada lote de chamadas gravado no banco."""
+        self._listeners.append(callback)
+
+    def start(self) -> None:
+        """Abre o arquivo de segurança e inicia a thread de gravação."""
+        with self._start_lock:
+            with self._lock:
+                if self._spill is not None:
+                    return
+            # Uma thread anterior (parada com o banco fora) já fechou o arquivo
+            if self._thread is not None:
+                self._thread.join()
+
+            spill = open(self.spill_path, "ab")
+            if spill.tell() and not self._termina_em_nova_linha():
+                # Última linha cortada por uma queda: o próximo registro começa numa linha nova
+                spill.write(b"\n")
+                spill.flush()
+            pendentes = self._contar_linhas()
+            with self._lock:
+                self._spill = spill
+                self._fim = spill.tell()
+                self._gravado_ate = 0
+                self._pendentes = pendentes
+            if pendentes:
+                print(f"[Gravação] {pendentes} chamada(s) a recuperar de {self.spill_path}")
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._run, name="call-writer", daemon=True)
+            self._thread.start()
+
+    def _contar_linhas(self) -> int:
+        # Em blocos: o arquivo pode ser grande depois de uma queda longa do banco
+        linhas = 0
+        with open(self.spill_path, "rb") as arquivo:
+            for bloco in iter(lambda: arquivo.read(1024 * 1024), b""):
+                linhas += bloco.count(b"\n")
+        return linhas
+
+    def _termina_em_nova_linha(self) -> bool:
+        with open(self.spill_path, "rb") as arquivo:
+            arquivo.seek(-1, os.SEEK_END)
+            return arquivo.read(1) == b"\n"
+
+    def enqueue(self, call_data: Dict[str, Any]) -> None:
+        """
+        Agenda a gravação de uma chamada.
+
+        Com CALL_WRITER_QUEUE_SIZE registros ainda não gravados, espera até
+        CALL_WRITER_ENQUEUE_TIMEOUT; depois disso anexa o registro mesmo assim:
+        ele fica no arquivo e a thread o grava assim que der.
+        """
+        linha = (_serializar(call_data) + "\n").encode("utf-8")
+        while True:
+            with self._lock:
+                if self._spill is not None:
+                    if self._pendentes >= self.max_queue and not self._mudou.wait_for(
+                        lambda: self._pendentes < self.max_queue or self._spill is None,
+                        timeout=CALL_WRITER_ENQUEUE_TIMEOUT,
+                    ):
+                        print("[Gravação] Banco atrasado, chamada fica no arquivo de segurança até ele voltar")
+                        self.stats["overflow"] += 1
+                if self._spill is not None:
+                    self._spill.write(linha)
+                    self._spill.flush()
+                    if CALL_WRITER_FSYNC:
+                        os.fsync(self._spill.fileno())
+                    self._fim += len(linha)
+                    self._pendentes += 1
+                    self.stats["enqueued"] += 1
+                    self._mudou.notify_all()
+                    return
+            # Thread parada (ou ainda não iniciada): reabre o arquivo
+            self.start()
+
+    async def aenqueue(self, call_data: Dict[str, Any]) -> None:
+        """Versão para rotas async: só sai do event loop se tiver que esperar o banco."""
+        if self._spill is not None and self._pendentes < self.max_queue:
+            self.enqueue(call_data)
+            return
+        await asyncio.to_thread(self.enqueue, call_data)
+
+    def _run(self) -> None:
+        leitura = open(self.spill_path, "rb")
+        try:
+            while True:
+                with self._lock:
+                    if self._fim == self._gravado_ate:
+                        if self._parar.is_set():
+                            self._fechar_arquivo()
+                            return
+                        self._mudou.wait(timeout=self.flush_interval)
+                        continue
+                    # Espera o lote encher, no máximo flush_interval
+                    if self._pendentes < self.batch_size and not self._parar.is_set():
+                        self._mudou.wait_for(
+                            lambda: self._pendentes >= self.batch_size or self._parar.is_set(),
+                            timeout=self.flush_interval,
+                        )
+                    inicio, fim = self._gravado_ate, self._fim
+
+                lote, ate, linhas = self._ler(leitura, inicio, fim)
+                if lote and not self._gravar_com_retry(lote):
+                    # Parando com o banco fora: o resto fica no arquivo para a próxima subida
+                    return
+                if self._confirmar(ate, linhas):
+                    leitura.close()
+                    leitura = open(self.spill_path, "rb")
+        finally:
+            leitura.close()
+            with self._lock:
+                self._fechar_arquivo()
+
+    def _ler(self, leitura, inicio: int, fim: int) -> Tuple[List[Dict[str, Any]], int, int]:
+        """Até batch_size registros a partir do offset `inicio` (sem passar de `fim`)."""
+        lote = []
+        linhas = 0
+        leitura.seek(inicio)
+        posicao = inicio
+        while posicao < fim and len(lote) < self.batch_size:
+            linha = leitura.readline()
+            if not linha:
+                break
+            posicao += len(linha)
+            linhas += 1
+            try:
+                lote.append(_desserializar(linha.decode("utf-8")))
+            except ValueError:
+                # Linha cortada por uma queda no meio da escrita
+                continue
+        return lote, posicao, linhas
+
+    def _confirmar(self, ate: int, linhas: int) -> bool:
+        """Avança o offset gravado; trunca ou compacta o arquivo. True se compactou."""
+        compactou = False
+        with self._lock:
+            self._gravado_ate = ate
+            self._pendentes -= linhas
+            if self._gravado_ate == self._fim:
+                # Tudo o que está no arquivo já foi gravado
+                self._spill.truncate(0)
+                self._fim = self._gravado_ate = 0
+            elif self._gravado_ate >= self.compact_bytes and self._gravado_ate >= self._fim - self._gravado_ate:
+                # Só quando a parte gravada é a maior: cada byte é copiado O(1) vezes
+                self._compactar()
+                compactou = True
+            self._mudou.notify_all()
+        return compactou
+
+    def _compactar(self) -> None:
+        # Chamado com self._lock: ninguém anexa durante a cópia
+        temporario = self.spill_path + ".tmp"
+        with open(self.spill_path, "rb") as origem, open(temporario, "wb") as destino:
+            origem.seek(self._gravado_ate)
+            shutil.copyfileobj(origem, destino)
+            destino.flush()
+            os.fsync(destino.fileno())
+        self._spill.close()
+        os.replace(temporario, self.spill_path)
+        self._spill = open(self.spill_path, "ab")
+        self._fim -= self._gravado_ate
+        self._gravado_ate = 0
+        self.stats["compactions"] += 1
+
+    def _fechar_arquivo(self) -> None:
+        # Chamado com self._lock
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+            self._mudou.notify_all()
+
+    def _gravar_com_retry(self, lote: List[Dict[str, Any]]) -> bool:
+        """Grava o lote, tentando de novo enquanto o banco falhar. False se parar antes."""
+        espera = 0.5
+        while True:
+            try:
+                self._gravar(lote)
+                return True
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"[Gravação] Erro ao gravar {len(lote)} chamada(s), nova tentativa em {espera:.1f}s: {e}")
+                if self._parar.wait(espera):
+                    return False
+                espera = min(espera * 2, 30)
+
+    def _gravar(self, lote: List[Dict[str, Any]]) -> None:
+        # Contadores do dashboard na mesma transação, só com as linhas novas
+        # (a retomada do arquivo pode reenviar chamadas já gravadas)
+        with span("db_flush"), engine.begin() as conn:
+            inseridos = bulk_insert_calls(lote, connection=conn)
+            apply_rollup(inseridos, conn)
+        self.stats["written"] += len(inseridos)
+        self.stats["batches"] += 1
+        for listener in self._listeners:
+            try:
+                listener(inseridos)
+            except Exception as e:
+                print(f"[Gravação] Erro no listener {listener}: {e}")
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Espera até tudo o que foi enfileirado estar no banco. Retorna False se estourar o timeout."""
+        with self._lock:
+            return self._mudou.wait_for(lambda: self._pendentes == 0, timeout=timeout)
+
+    def stop(self, timeout: Optional[float] = 10) -> None:
+        """
+        Grava o que falta e para a thread. Com o banco fora, a thread desiste
+        na próxima tentativa e o que faltou fica no arquivo; é ela quem fecha
+        o arquivo, depois da última leitura.
+        """
+        if self._thread is None:
+            return
+        self.flush(timeout)
+        self._parar.set()
+        with self._lock:
+            self._mudou.notify_all()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            print("[Gravação] Thread de gravação ainda não terminou; ela fecha o arquivo ao sair")
+
+
+# Instância compartilhada pelas rotas
+call_writer = CallWriteBehind()
@@ -0,0 +1,130 @@
+"""
+Motor genérico dos checklists de atendimento
+
+As perguntas de cada categoria ficam em checklists.json (CHECKLISTS_PATH):
+
+    {"samu": {"introducao": "...", "encerramento": "...", "despacho": true,
+              "perguntas": [{"id": "P1_...", "pergunta": "..."}, ...]}}
+
+O TwiML de cada passo é montado uma única vez, na carga das definições, e
+guardado já em bytes. Passos de uma categoria com N perguntas:
+
+    passo 0      -> introdução + pergunta 1 (logo após a classificação)
+    passo k      -> resposta da pergunta k recebida; faz a pergunta k + 1
+    passo N      -> resposta da última pergunta; mensagem de encerramento
+
+Assim cada webhook do checklist é uma consulta no dicionário mais a gravação
+da resposta na sessão.
+"""
+import os
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from twilio.twiml.voice_response import VoiceResponse
+
+load_dotenv()
+
+CHECKLISTS_PATH = os.getenv(
+    "CHECKLISTS_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "checklists.json"),
+)
+
+MENSAGEM_SEM_RESPOSTA = "Não obtivemos resposta. Encerrando."
+MENSAGEM_ERRO = "Ocorreu um erro no checklist. Encerrando."
+
+
+def load_checklists(path: str = CHECKLISTS_PATH) -> Dict[str, Dict[str, Any]]:
+    """Lê e valida as definições de checklist."""
+    with open(path, encoding="utf-8") as arquivo:
+        definicoes = json.load(arquivo)
+    for categoria, definicao in definicoes.items():
+        if not definicao.get("perguntas"):
+            raise ValueError(f"Checklist '{categoria}' sem perguntas em {path}")
+        for pergunta in definicao["perguntas"]:
+            if "id" not in pergunta or "pergunta" not in pergunta:
+                raise ValueError(f"Pergunta inválida no checklist '{categoria}': {pergunta}")
+    return definicoes
+
+
+def _perguntar(texto: str, action: str, speech_timeout: Optional[str]) -> bytes:
+    response = VoiceResponse()
+    response.say(texto, language="pt-BR", voice="alice")
+    opcoes = {"speech_timeout": speech_timeout} if speech_timeout else {}
+    response.gather(input="speech", language="pt-BR", action=action, **opcoes)
+    # Fallback se o usuário não responder
+    response.say(MENSAGEM_SEM_RESPOSTA, language="pt-BR", voice="alice")
+    response.hangup()
+    return str(response).encode("utf-8")
+
+
+def _encerrar(texto: str) -> bytes:
+    response = VoiceResponse()
+    response.say(texto, language="pt-BR", voice="alice")
+    response.hangup()
+    return str(response).encode("utf-8")
+
+
+class ChecklistEngine:
+    """
+    Checklists carregados e o TwiML pré-compilado de cada (categoria, passo).
+
+    Args:
+        definicoes: Definições no formato de checklists.json
+        route_prefix: Rota genérica que recebe as respostas
+    """
+
+    def __init__(self, definicoes: Dict[str, Dict[str, Any]], route_prefix: str = "/checklist"):
+        self.definicoes = definicoes
+        self.route_prefix = route_prefix
+        self._twiml: Dict[Tuple[str, int], bytes] = {}
+        for categoria, definicao in definicoes.items():
+            self._compilar(categoria, definicao)
+        self.error_twiml = _encerrar(MENSAGEM_ERRO)
+
+    @classmethod
+    def from_file(cls, path: str = CHECKLISTS_PATH, **kwargs) -> "ChecklistEngine":
+        return cls(load_checklists(path), **kwargs)
+
+    def _action(self, categoria: str, passo: int) -> str:
+        return f"{self.route_prefix}/{categoria}?passo={passo}"
+
+    def _compilar(self, categoria: str, definicao: Dict[str, Any]) -> None:
+        perguntas = definicao["perguntas"]
+        # A primeira pergunta vai junto com a introdução, sem speech_timeout
+        # (a pessoa acabou de descrever a emergência)
+        self._twiml[(categoria, 0)] = _perguntar(
+            f"{definicao.get('introducao', '')} {perguntas[0]['pergunta']}".strip(),
+            self._action(categoria, 1),
+            speech_timeout=None,
+        )
+        for passo in range(1, len(perguntas)):
+            self._twiml[(categoria, passo)] = _perguntar(
+                perguntas[passo]["pergunta"], self._action(categoria, passo + 1), speech_timeout="1"
+            )
+        self._twiml[(categoria, len(perguntas))] = _encerrar(definicao["encerramento"])
+
+    def categories(self) -> List[str]:
+        return list(self.definicoes)
+
+    def has(self, categoria: str) -> bool:
+        return categoria in self.definicoes
+
+    def twiml(self, categoria: str, passo: int) -> bytes:
+        """TwiML do passo, ou o de erro se o passo não existir."""
+        return self._twiml.get((categoria, passo), self.error_twiml)
+
+    def is_valid_answer_step(self, categoria: str, passo: int) -> bool:
+        """True se `passo` recebe a resposta de uma pergunta (1..N)."""
+        return self.has(categoria) and 1 <= passo <= len(self.definicoes[categoria]["perguntas"])
+
+    def answered_question_id(self, categoria: str, passo: int) -> str:
+        """ID da pergunta respondida no passo (passo 1 responde a pergunta 1)."""
+        return self.definicoes[categoria]["perguntas"][passo - 1]["id"]
+
+    def is_last_step(self, categoria: str, passo: int) -> bool:
+        return passo == len(self.definicoes[categoria]["perguntas"])
+
+    def dispatches(self, categoria: str) -> bool:
+        """True se o fim do checklist agenda o despacho (relatório + ligação)."""
+        return bool(self.definicoes[categoria].get("despacho"))
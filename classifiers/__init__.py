@@ -1,17 +1,32 @@
 # Pasta de classificadores para o sistema de classificação de emergências
 
-from .classifier import classify_emergency_call, detect_disguised_call
+from .classifier import classify_emergency_call, aclassify_emergency_call, detect_disguised_call
 from .police_urgency_classifier import classify_police_urgency, generate_police_instructions
 from .firefighter_urgency_classifier import classify_firefighter_urgency, generate_firefighter_instructions
 from .samu_urgency_classifier import classify_samu_urgency, generate_samu_instructions
+from .async_urgency import aclassify_police_urgency, aclassify_firefighter_urgency, aclassify_samu_urgency
+from .async_support import set_max_concurrency
+from .cache import get_cache_stats
+from .combined_classifier import classify_call_with_urgency, aclassify_call_with_urgency
+from .llm import get_llm_stats, add_call_observer
 
 __all__ = [
     'classify_emergency_call',
+    'aclassify_emergency_call',
     'detect_disguised_call', 
     'classify_police_urgency',
     'generate_police_instructions',
     'classify_firefighter_urgency',
     'generate_firefighter_instructions',
     'classify_samu_urgency',
-    'generate_samu_instructions'
+    'generate_samu_instructions',
+    'aclassify_police_urgency',
+    'aclassify_firefighter_urgency',
+    'aclassify_samu_urgency',
+    'set_max_concurrency',
+    'get_cache_stats',
+    'classify_call_with_urgency',
+    'aclassify_call_with_urgency',
+    'get_llm_stats',
+    'add_call_observer'
 ]
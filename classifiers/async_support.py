@@ -0,0 +1,65 @@
+import os
+import asyncio
+import weakref
+from functools import wraps
+from openai import AsyncOpenAI
+from dotenv import load_dotenv
+from typing import Any, Awaitable, Callable
+
+# Carrega variáveis de ambiente
+load_dotenv()
+
+# Máximo de chamadas simultâneas à OpenAI por event loop
+CLASSIFIER_MAX_CONCURRENCY = int(os.getenv("CLASSIFIER_MAX_CONCURRENCY", "10"))
+
+# Semáforo e cliente assíncrono são criados um por event loop (objetos asyncio
+# não podem ser compartilhados entre loops diferentes)
+_semaforos: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+_clientes: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = weakref.WeakKeyDictionary()
+
+
+def set_max_concurrency(limite: int) -> None:
+    """
+    Altera o limite de chamadas simultâneas à OpenAI.
+
+    Vale para os event loops que ainda não criaram seu semáforo.
+    """
+    global CLASSIFIER_MAX_CONCURRENCY
+    CLASSIFIER_MAX_CONCURRENCY = limite
+    _semaforos.clear()
+
+
+def get_semaphore() -> asyncio.Semaphore:
+    """Retorna o semáforo de concorrência do event loop atual."""
+    loop = asyncio.get_running_loop()
+    semaforo = _semaforos.get(loop)
+    if semaforo is None:
+        semaforo = asyncio.Semaphore(CLASSIFIER_MAX_CONCURRENCY)
+        _semaforos[loop] = semaforo
+    return semaforo
+
+
+def get_async_client() -> AsyncOpenAI:
+    """Retorna o cliente AsyncOpenAI do event loop atual."""
+    loop = asyncio.get_running_loop()
+    cliente = _clientes.get(loop)
+    if cliente is None:
+        # Tentativas e timeouts ficam a cargo de classifiers/llm.py
+        cliente = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+        _clientes[loop] = cliente
+    return cliente
+
+
+def to_async(funcao: Callable[..., Any]) -> Callable[..., Awaitable[Any]]:
+    """
+    Cria uma versão awaitable de um classificador síncrono.
+
+    A função roda numa thread, respeitando o mesmo limite de concorrência das
+    chamadas assíncronas, então não bloqueia o event loop.
+    """
+    @wraps(funcao)
+    async def wrapper(*args, **kwargs):
+        async with get_semaphore():
+            return await asyncio.to_thread(funcao, *args, **kwargs)
+    wrapper.__name__ = f"a{funcao.__name__}"
+    return wrapper
@@ -0,0 +1,12 @@
+# Versões awaitable dos classificadores de urgência.
+# Os classificadores de urgência são síncronos; aqui eles rodam numa thread,
+# sob o mesmo limite de concorrência de aclassify_emergency_call.
+
+from .async_support import to_async
+from .police_urgency_classifier import classify_police_urgency
+from .firefighter_urgency_classifier import classify_firefighter_urgency
+from .samu_urgency_classifier import classify_samu_urgency
+
+aclassify_police_urgency = to_async(classify_police_urgency)
+aclassify_firefighter_urgency = to_async(classify_firefighter_urgency)
+aclassify_samu_urgency = to_async(classify_samu_urgency)
@@ -0,0 +1,185 @@
+import os
+import json
+import asyncio
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import closing
+from dotenv import load_dotenv
+from typing import Dict, Optional
+
+from .normalization import normalize_transcript
+
+# Carrega variáveis de ambiente
+load_dotenv()
+
+CLASSIFIER_CACHE_ENABLED = os.getenv("CLASSIFIER_CACHE_ENABLED", "1") == "1"
+CLASSIFIER_CACHE_TTL_SECONDS = float(os.getenv("CLASSIFIER_CACHE_TTL_SECONDS", "86400"))
+CLASSIFIER_CACHE_MAX_ENTRIES = int(os.getenv("CLASSIFIER_CACHE_MAX_ENTRIES", "10000"))
+CLASSIFIER_CACHE_MAX_BYTES = int(os.getenv("CLASSIFIER_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+# Arquivo SQLite do nível persistente (vazio = só memória)
+CLASSIFIER_CACHE_PATH = os.getenv("CLASSIFIER_CACHE_PATH", "")
+
+
+class ClassificationCache:
+    """
+    Cache de classificações indexado pela transcrição normalizada.
+
+    Nível 1: LRU em memória com TTL, limitado por número de entradas e bytes.
+    Nível 2 (opcional): arquivo SQLite que sobrevive a restarts.
+
+    Args:
+        ttl_seconds: Validade de cada entrada
+        max_entries: Máximo de entradas em memória
+        max_bytes: Tamanho aproximado máximo (chaves + JSON dos resultados) em memória
+        path: Arquivo SQLite do nível persistente, ou None para desativar
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = CLASSIFIER_CACHE_TTL_SECONDS,
+        max_entries: int = CLASSIFIER_CACHE_MAX_ENTRIES,
+        max_bytes: int = CLASSIFIER_CACHE_MAX_BYTES,
+        path: Optional[str] = CLASSIFIER_CACHE_PATH or None,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.path = path
+        self._entradas: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "persistent_hits": 0, "misses": 0, "evictions": 0}
+
+        if self.path:
+            with closing(sqlite3.connect(self.path)) as conn, conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS classification_cache "
+                    "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+
+    def _remover(self, chave: str) -> None:
+        _, _, tamanho = self._entradas.pop(chave)
+        self._bytes -= tamanho
+
+    def _guardar_memoria(self, chave: str, valor_json: str, expira_em: float) -> None:
+        if chave in self._entradas:
+            self._remover(chave)
+        tamanho = len(chave) + len(valor_json)
+        self._entradas[chave] = (valor_json, expira_em, tamanho)
+        self._bytes += tamanho
+        while self._entradas and (len(self._entradas) > self.max_entries or self._bytes > self.max_bytes):
+            self._remover(next(iter(self._entradas)))
+            self._stats["evictions"] += 1
+
+    def _get_memoria(self, chave: str, agora: float) -> Optional[Dict[str, any]]:
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is not None:
+                if entrada[1] > agora:
+                    self._entradas.move_to_end(chave)
+                    self._stats["hits"] += 1
+                    return json.loads(entrada[0])
+                self._remover(chave)
+        return None
+
+    def _get_persistente(self, chave: str, agora: float) -> Optional[Dict[str, any]]:
+        if self.path:
+            with closing(sqlite3.connect(self.path)) as conn:
+                row = conn.execute(
+                    "SELECT value, expires_at FROM classification_cache WHERE key = ? AND expires_at > ?",
+                    (chave, agora),
+                ).fetchone()
+            if row is not None:
+                with self._lock:
+                    self._guardar_memoria(chave, row[0], row[1])
+                    self._stats["persistent_hits"] += 1
+                return json.loads(row[0])
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def _set_persistente(self, chave: str, valor_json: str, expira_em: float) -> None:
+        with closing(sqlite3.connect(self.path)) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO classification_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (chave, valor_json, expira_em),
+            )
+
+    def _set_memoria(self, transcript: str, result: Dict[str, any]) -> tuple:
+        chave = normalize_transcript(transcript)
+        valor_json = json.dumps(result, ensure_ascii=False)
+        expira_em = time.time() + self.ttl_seconds
+        with self._lock:
+            self._guardar_memoria(chave, valor_json, expira_em)
+        return chave, valor_json, expira_em
+
+    def get(self, transcript: str) -> Optional[Dict[str, any]]:
+        """Retorna a classificação em cache para a transcrição, ou None."""
+        chave = normalize_transcript(transcript)
+        agora = time.time()
+        cached = self._get_memoria(chave, agora)
+        if cached is not None:
+            return cached
+        return self._get_persistente(chave, agora)
+
+    async def aget(self, transcript: str) -> Optional[Dict[str, any]]:
+        """Como get, com a consulta ao arquivo SQLite fora do event loop."""
+        chave = normalize_transcript(transcript)
+        agora = time.time()
+        cached = self._get_memoria(chave, agora)
+        if cached is not None:
+            return cached
+        if not self.path:
+            return self._get_persistente(chave, agora)
+        return await asyncio.to_thread(self._get_persistente, chave, agora)
+
+    def set(self, transcript: str, result: Dict[str, any]) -> None:
+        """Guarda a classificação de uma transcrição."""
+        chave, valor_json, expira_em = self._set_memoria(transcript, result)
+        if self.path:
+            self._set_persistente(chave, valor_json, expira_em)
+
+    async def aset(self, transcript: str, result: Dict[str, any]) -> None:
+        """Como set, com a gravação no arquivo SQLite fora do event loop."""
+        chave, valor_json, expira_em = self._set_memoria(transcript, result)
+        if self.path:
+            await asyncio.to_thread(self._set_persistente, chave, valor_json, expira_em)
+
+    def clear(self) -> None:
+        """Esvazia o cache (memória e arquivo) e zera os contadores."""
+        with self._lock:
+            self._entradas.clear()
+            self._bytes = 0
+            self._stats = {key: 0 for key in self._stats}
+        if self.path:
+            with closing(sqlite3.connect(self.path)) as conn, conn:
+                conn.execute("DELETE FROM classification_cache")
+
+    def stats(self) -> Dict[str, any]:
+        """Contadores de acerto/erro e ocupação do cache."""
+        with self._lock:
+            consultas = self._stats["hits"] + self._stats["persistent_hits"] + self._stats["misses"]
+            acertos = self._stats["hits"] + self._stats["persistent_hits"]
+            return {
+                **self._stats,
+                "hit_rate": round(acertos / consultas, 4) if consultas else 0.0,
+                "entries": len(self._entradas),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "persistent": bool(self.path),
+            }
+
+
+# Cache compartilhado pelo classificador (None se CLASSIFIER_CACHE_ENABLED=0)
+classification_cache = ClassificationCache() if CLASSIFIER_CACHE_ENABLED else None
+
+
+def get_cache_stats() -> Dict[str, any]:
+    """Contadores do cache do classificador (para dimensionar o cache)."""
+    if classification_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **classification_cache.stats()}
@@ -1,22 +1,31 @@
-import os
-from openai import OpenAI
 from dotenv import load_dotenv
 from typing import Dict
 
+from .cache import classification_cache
+from .llm import achat_completion, chat_completion, parse_json, LLMUnavailable, LLM_CLASSIFY_DEADLINE_SECONDS
+from .local_classifier import classify_locally
+from .pattern_matcher import DisguisedCallMatcher, load_patterns, DISGUISED_PATTERNS_PATH
+
 # Carrega variáveis de ambiente
 load_dotenv()
 
-# Inicializa cliente OpenAI
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
 # Palavras-chave para detectar chamadas disfarçadas
-DISGUISED_CALL_KEYWORDS = [
-    {
-        "pattern": ["pizza", "espinafre", "ketchup"],
-        "description": "Pedido de pizza com ingredientes incomuns"
-    }
-    # Estrutura para adicionar mais padrões no futuro
-]
+# (novos padrões vão em classifiers/disguised_patterns.json)
+DISGUISED_CALL_KEYWORDS = load_patterns()
+_disguised_matcher = DisguisedCallMatcher(DISGUISED_CALL_KEYWORDS)
+
+def reload_disguised_patterns(path: str = DISGUISED_PATTERNS_PATH) -> int:
+    """
+    Recarrega os padrões de chamada disfarçada e recompila o autômato.
+
+    Returns:
+        Quantidade de padrões carregados
+    """
+    global DISGUISED_CALL_KEYWORDS, _disguised_matcher
+    patterns = load_patterns(path)
+    _disguised_matcher = DisguisedCallMatcher(patterns)
+    DISGUISED_CALL_KEYWORDS = patterns
+    return len(patterns)
 
 def detect_disguised_call(transcript: str) -> Dict[str, any]:
     """
@@ -28,18 +37,17 @@ def detect_disguised_call(transcript: str) -> Dict[str, any]:
     Returns:
         Dict com is_disguised (bool), confidence e matched_pattern
     """
-    transcript_lower = transcript.lower()
-    
-    for keyword_set in DISGUISED_CALL_KEYWORDS:
+    # Uma única passada pelo texto, independente do número de padrões;
+    # casa o início das palavras (plurais e flexões), ignorando acentos e maiúsculas
+    keyword_set = _disguised_matcher.match(transcript)
+    if keyword_set is not None:
         pattern = keyword_set["pattern"]
-        # Verifica se todas as palavras do padrão estão presentes
-        if all(keyword in transcript_lower for keyword in pattern):
-            return {
-                "is_disguised": True,
-                "confidence": 95,
-                "matched_pattern": keyword_set["description"],
-                "reasoning": f"Detectada chamada disfarçada com palavras-chave suspeitas: {' '.join(pattern)}"
-            }
+        return {
+            "is_disguised": True,
+            "confidence": 95,
+            "matched_pattern": keyword_set["description"],
+            "reasoning": f"Detectada chamada disfarçada com palavras-chave suspeitas: {' '.join(pattern)}"
+        }
     
     return {
         "is_disguised": False,
@@ -48,18 +56,8 @@ def detect_disguised_call(transcript: str) -> Dict[str, any]:
         "reasoning": "Nenhum padrão de chamada disfarçada detectado"
     }
 
-def classify_emergency_call(transcript: str) -> Dict[str, any]:
-    """
-    Classifica uma chamada de emergência usando OpenAI.
-    
-    Args:
-        transcript: Texto transcrito da chamada
-        
-    Returns:
-        Dict com category, confidence e reasoning
-    """
-    
-    # Primeiro verifica se é uma chamada disfarçada
+def _disguised_result(transcript: str) -> Dict[str, any]:
+    """Resultado de "policia-analogia" se a chamada for disfarçada, senão None."""
     disguised_check = detect_disguised_call(transcript)
     if disguised_check["is_disguised"]:
         return {
@@ -67,7 +65,10 @@ def classify_emergency_call(transcript: str) -> Dict[str, any]:
             "confidence": disguised_check["confidence"],
             "reasoning": disguised_check["reasoning"]
         }
-    
+    return None
+
+def _build_messages(transcript: str) -> list:
+    """Monta as mensagens do prompt de classificação."""
     prompt = f"""Você é um classificador de chamadas de emergência. Analise o seguinte texto transcrito de uma chamada telefônica e classifique em UMA das seguintes categorias:
 
 1. **policia** - Crimes, violência, roubos, assaltos, brigas, ameaças
@@ -92,28 +93,104 @@ Responda APENAS com um JSON válido no seguinte formato:
     "reasoning": "explicação curta do motivo da classificação"
 }}"""
 
+    return [
+        {"role": "system", "content": "Você é um classificador de emergências. Sempre retorne JSON válido."},
+        {"role": "user", "content": prompt}
+    ]
+
+def _error_result(e: Exception) -> Dict[str, any]:
+    print(f"Erro ao classificar chamada: {e}")
+    return {
+        "category": "indefinido",
+        "confidence": 0,
+        "reasoning": f"Erro no processamento: {str(e)}"
+    }
+
+def classify_emergency_call(transcript: str) -> Dict[str, any]:
+    """
+    Classifica uma chamada de emergência usando OpenAI.
+    
+    Args:
+        transcript: Texto transcrito da chamada
+        
+    Returns:
+        Dict com category, confidence e reasoning
+    """
+    
+    # Primeiro verifica se é uma chamada disfarçada
+    disguised = _disguised_result(transcript)
+    if disguised:
+        return disguised
+
+    # Transcrições repetidas (normalizadas) não voltam para a OpenAI
+    if classification_cache is not None:
+        cached = classification_cache.get(transcript)
+        if cached is not None:
+            return cached
+
+    # Chamadas óbvias são respondidas pelo modelo local, sem OpenAI
+    local = classify_locally(transcript)
+    if local is not None:
+        return local
+
+    # Prazo, tentativas e circuit breaker ficam em classifiers/llm.py;
+    # sem resposta a tempo, cai no resultado "indefinido"
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "Você é um classificador de emergências. Sempre retorne JSON válido."},
-                {"role": "user", "content": prompt}
-            ],
+        result = chat_completion(
+            _build_messages(transcript),
+            operation="classificacao",
+            deadline=LLM_CLASSIFY_DEADLINE_SECONDS,
+            parse=parse_json,
             temperature=0.3,
             response_format={"type": "json_object"}
         )
+    except LLMUnavailable as e:
+        return _error_result(e)
+
+    if classification_cache is not None:
+        classification_cache.set(transcript, result)
+
+    return result
+
+async def aclassify_emergency_call(transcript: str) -> Dict[str, any]:
+    """
+    Versão assíncrona de classify_emergency_call (não bloqueia o event loop).
+
+    Usa o cliente AsyncOpenAI e respeita o limite CLASSIFIER_MAX_CONCURRENCY
+    de chamadas simultâneas por event loop.
+    
+    Args:
+        transcript: Texto transcrito da chamada
         
-        # Extrai a resposta
-        result_text = response.choices[0].message.content
-        import json
-        result = json.loads(result_text)
-        
-        return result
-        
-    except Exception as e:
-        print(f"Erro ao classificar chamada: {e}")
-        return {
-            "category": "indefinido",
-            "confidence": 0,
-            "reasoning": f"Erro no processamento: {str(e)}"
-        }
+    Returns:
+        Dict com category, confidence e reasoning
+    """
+    disguised = _disguised_result(transcript)
+    if disguised:
+        return disguised
+
+    if classification_cache is not None:
+        cached = await classification_cache.aget(transcript)
+        if cached is not None:
+            return cached
+
+    local = classify_locally(transcript)
+    if local is not None:
+        return local
+
+    try:
+        result = await achat_completion(
+            _build_messages(transcript),
+            operation="classificacao",
+            deadline=LLM_CLASSIFY_DEADLINE_SECONDS,
+            parse=parse_json,
+            temperature=0.3,
+            response_format={"type": "json_object"}
+        )
+    except LLMUnavailable as e:
+        return _error_result(e)
+
+    if classification_cache is not None:
+        await classification_cache.aset(transcript, result)
+
+    return result
@@ -0,0 +1,160 @@
+import time
+from dotenv import load_dotenv
+from typing import Dict, Optional, Tuple
+
+from .classifier import _disguised_result, _error_result
+from .normalization import normalize_transcript
+from .llm import achat_completion, chat_completion, parse_json, LLMUnavailable, LLM_CLASSIFY_DEADLINE_SECONDS
+
+# Carrega variáveis de ambiente
+load_dotenv()
+
+# Categorias que têm classificação de urgência
+URGENCY_CATEGORIES = ["policia", "bombeiros", "samu"]
+
+# ATENÇÃO: os módulos *_urgency_classifier não estão neste repositório, então
+# a escala abaixo é uma suposição: "média" é o nível padrão que o painel já
+# usava, os demais completam a escala em português. Se a escala dos
+# classificadores de urgência for outra, ajuste URGENCY_LEVELS e o prompt
+# de _build_messages juntos.
+URGENCY_LEVELS = ["crítica", "alta", "média", "baixa"]
+DEFAULT_URGENCY_LEVEL = "média"
+
+
+class _UrgencyData(dict):
+    """
+    urgency_data da resposta combinada. Os dicts dos classificadores de
+    urgência podem ter mais chaves do que urgency_level, confidence e
+    reasoning; generate_*_instructions recebe None nas que faltarem em vez
+    de KeyError (sem inserir a chave no dict).
+    """
+
+    def __missing__(self, key):
+        return None
+
+
+def _build_messages(transcript: str) -> list:
+    """Prompt único: categoria + urgência + motivo."""
+    prompt = f"""Você é um classificador de chamadas de emergência. Analise o texto transcrito abaixo e faça DUAS coisas:
+
+A) Classifique a chamada em UMA das categorias:
+1. **policia** - Crimes, violência, roubos, assaltos, brigas, ameaças
+2. **samu** - Emergências médicas, acidentes com feridos, problemas de saúde
+3. **bombeiros** - Incêndios, vazamentos de gás, resgates em altura, afogamentos
+4. **trote** - Piadas, brincadeiras, ligações falsas, pedidos de comida/delivery, consultas sobre restaurantes
+5. **indefinido** - Chamadas que NÃO são emergências reais MAS também NÃO são claramente trotes (consultas genéricas, contexto ambíguo)
+
+B) Se a categoria for policia, samu ou bombeiros, avalie o nível de urgência para o despacho:
+- **crítica** - Risco imediato à vida (inconsciência, parada respiratória, arma em uso, pessoas presas em incêndio)
+- **alta** - Risco sério que pode se agravar rapidamente (crime em andamento, sangramento importante, fogo se espalhando)
+- **média** - Situação que exige atendimento mas sem risco imediato à vida
+- **baixa** - Situação já controlada ou sem vítimas
+Para trote ou indefinido, use null nos campos de urgência.
+
+Texto da chamada:
+"{transcript}"
+
+Responda APENAS com um JSON válido no seguinte formato:
+{{
+    "category": "categoria_escolhida",
+    "confidence": numero_de_0_a_100,
+    "reasoning": "explicação curta do motivo da classificação",
+    "urgency_level": "crítica|alta|média|baixa ou null",
+    "urgency_confidence": numero_de_0_a_100_ou_null,
+    "urgency_reasoning": "explicação curta do nível de urgência, ou null"
+}}"""
+
+    return [
+        {"role": "system", "content": "Você é um classificador de emergências. Sempre retorne JSON válido."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def _split_result(result: Dict[str, any]) -> Tuple[Dict[str, any], Optional[Dict[str, any]]]:
+    """
+    Separa a resposta única nos mesmos formatos de classify_emergency_call e
+    dos classificadores de urgência.
+    """
+    classification = {
+        "category": result.get("category", "indefinido"),
+        "confidence": result.get("confidence", 0),
+        "reasoning": result.get("reasoning", "")
+    }
+    if classification["category"] not in URGENCY_CATEGORIES or not result.get("urgency_level"):
+        return classification, None
+
+    # Grafias como "media" ou "Alta" voltam para a escala; fora dela, o padrão
+    niveis = {normalize_transcript(n): n for n in URGENCY_LEVELS}
+    nivel = niveis.get(normalize_transcript(str(result["urgency_level"])), DEFAULT_URGENCY_LEVEL)
+
+    urgency_data = _UrgencyData({
+        "urgency_level": nivel,
+        "confidence": result.get("urgency_confidence") or 0,
+        "reasoning": result.get("urgency_reasoning") or ""
+    })
+    return classification, urgency_data
+
+
+def classify_call_with_urgency(transcript: str) -> Tuple[Dict[str, any], Optional[Dict[str, any]]]:
+    """
+    Classifica categoria e urgência com UMA chamada à OpenAI.
+
+    Args:
+        transcript: Texto transcrito da chamada
+
+    Returns:
+        Tupla (classification, urgency_data). classification tem o formato de
+        classify_emergency_call; urgency_data tem urgency_level, confidence e
+        reasoning, ou é None para categorias sem urgência (trote, indefinido,
+        policia-analogia) ou em caso de erro.
+    """
+    disguised = _disguised_result(transcript)
+    if disguised:
+        return disguised, None
+
+    try:
+        inicio = time.perf_counter()
+        result = chat_completion(
+            _build_messages(transcript),
+            operation="classificacao_combinada",
+            deadline=LLM_CLASSIFY_DEADLINE_SECONDS,
+            parse=parse_json,
+            temperature=0.3,
+            response_format={"type": "json_object"}
+        )
+        print(f"[Classificação combinada] {1000 * (time.perf_counter() - inicio):.0f} ms")
+        return _split_result(result)
+
+    except LLMUnavailable as e:
+        return _error_result(e), None
+
+
+async def aclassify_call_with_urgency(transcript: str) -> Tuple[Dict[str, any], Optional[Dict[str, any]]]:
+    """
+    Versão assíncrona de classify_call_with_urgency.
+
+    Args:
+        transcript: Texto transcrito da chamada
+
+    Returns:
+        Tupla (classification, urgency_data), como em classify_call_with_urgency
+    """
+    disguised = _disguised_result(transcript)
+    if disguised:
+        return disguised, None
+
+    try:
+        inicio = time.perf_counter()
+        result = await achat_completion(
+            _build_messages(transcript),
+            operation="classificacao_combinada",
+            deadline=LLM_CLASSIFY_DEADLINE_SECONDS,
+            parse=parse_json,
+            temperature=0.3,
+            response_format={"type": "json_object"}
+        )
+        print(f"[Classificação combinada] {1000 * (time.perf_counter() - inicio):.0f} ms")
+        return _split_result(result)
+
+    except LLMUnavailable as e:
+        return _error_result(e), None
@@ -1,30 +1,27 @@
-import os
-from openai import OpenAI
+import re
+import time
+import threading
 from dotenv import load_dotenv
-from typing import List, Dict # Importe List e Dict
+from typing import List, Dict, Iterator, Tuple # Importe List e Dict
+
+from .llm import chat_completion, open_chat_stream, LLMUnavailable, LLM_REPORT_DEADLINE_SECONDS
 
 # Carrega variáveis de ambiente
 load_dotenv()
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-# --- FUNÇÃO: GERADOR DE RELATÓRIO IA ---
-def gerar_relatorio_conciso_ia(dados_brutos: List[str], categoria_emergencia: str) -> str:
-    """
-    Pega o array de dados brutos coletados (descrição + checklist),
-    identifica a categoria da emergência e gera um relatório final conciso
-    usando a OpenAI, formatado para despacho.
-
-    Args:
-        dados_brutos: Lista de strings contendo P0_descricao e as respostas P1 a P6/P7.
-        categoria_emergencia: String indicando o tipo ("samu", "policia", "bombeiros").
-        openai_client: A instância inicializada do cliente OpenAI.
-
-    Returns:
-        String com o relatório conciso gerado pela IA.
-    """
-    print(f"[IA Relatório] Gerando relatório para '{categoria_emergencia}'...")
+def _publico_e_foco(categoria_emergencia: str):
+    """Público-alvo e foco do relatório para cada categoria."""
+    if categoria_emergencia == "samu":
+        return "equipe do SAMU (paramédicos)", "estado do paciente, sintomas vitais, idade/condições, local."
+    elif categoria_emergencia == "policia" or categoria_emergencia == "policia-analogia":
+        return "equipe da POLÍCIA (viatura)", "localização, segurança, flagrante, armas, vítimas, descrição do autor."
+    elif categoria_emergencia == "bombeiros":
+        return "equipe dos BOMBEIROS", "localização, tipo de incêndio/emergência, pessoas presas, riscos (gás, eletricidade)."
+    else:
+        return "central de despacho", "resumo geral da situação."
 
-    # Formata o array para o prompt, separando descrição inicial
+def _separar_dados(dados_brutos: List[str]) -> Tuple[str, str]:
+    """(descrição inicial, respostas do checklist formatadas como lista)."""
     descricao_inicial = ""
     respostas_checklist_formatadas = []
     for item in dados_brutos:
@@ -32,23 +29,21 @@ def gerar_relatorio_conciso_ia(dados_brutos: List[str], categoria_emergencia: st
             descricao_inicial = item.replace("P0_descricao:", "").strip()
         else:
             respostas_checklist_formatadas.append(f"- {item}") # Formata como lista
+    return descricao_inicial, "\n".join(respostas_checklist_formatadas)
+
+def relatorio_dados_brutos(dados_brutos: List[str]) -> str:
+    """Relatório de fallback (sem IA): os dados brutos formatados. Nunca vazio."""
+    descricao_inicial, texto_checklist = _separar_dados(dados_brutos)
+    return f"Erro na IA. Dados brutos:\nDescrição: {descricao_inicial}\nChecklist:\n{texto_checklist}"
 
-    texto_checklist = "\n".join(respostas_checklist_formatadas)
+def _mensagens_relatorio(dados_brutos: List[str], categoria_emergencia: str) -> list:
+    """Monta as mensagens do prompt do relatório completo."""
+    # Formata o array para o prompt, separando descrição inicial
+    descricao_inicial, texto_checklist = _separar_dados(dados_brutos)
 
     # --- REGRA DE NEGÓCIO: O PROMPT ---
     # Define o público e o objetivo do relatório
-    if categoria_emergencia == "samu":
-        publico_alvo = "equipe do SAMU (paramédicos)"
-        foco_principal = "estado do paciente, sintomas vitais, idade/condições, local."
-    elif categoria_emergencia == "policia" or categoria_emergencia == "policia-analogia":
-        publico_alvo = "equipe da POLÍCIA (viatura)"
-        foco_principal = "localização, segurança, flagrante, armas, vítimas, descrição do autor."
-    elif categoria_emergencia == "bombeiros":
-        publico_alvo = "equipe dos BOMBEIROS"
-        foco_principal = "localização, tipo de incêndio/emergência, pessoas presas, riscos (gás, eletricidade)."
-    else:
-        publico_alvo = "central de despacho"
-        foco_principal = "resumo geral da situação."
+    publico_alvo, foco_principal = _publico_e_foco(categoria_emergencia)
 
     prompt = f"""
     Você é um assistente de despacho de emergência altamente eficiente.
@@ -56,6 +51,7 @@ def gerar_relatorio_conciso_ia(dados_brutos: List[str], categoria_emergencia: st
     para a {publico_alvo}, baseado nas informações coletadas por uma IA durante uma chamada.
 
     O objetivo é fornecer apenas os dados CRÍTICOS para a ação imediata da equipe.
+    A PRIMEIRA frase deve trazer o local e se há risco imediato à vida.
     Foco principal: {foco_principal}
 
     INFORMAÇÕES COLETADAS:
@@ -70,21 +66,232 @@ def gerar_relatorio_conciso_ia(dados_brutos: List[str], categoria_emergencia: st
     """
     # --- FIM DA REGRA DE NEGÓCIO ---
 
+    mensagens = [
+        {"role": "system", "content": f"Você gera relatórios de despacho de emergência para {publico_alvo}. Seja extremamente conciso e factual."},
+        {"role": "user", "content": prompt}
+    ]
+    return mensagens
+
+# --- FUNÇÃO: GERADOR DE RELATÓRIO IA ---
+def gerar_relatorio_conciso_ia(dados_brutos: List[str], categoria_emergencia: str) -> str:
+    """
+    Pega o array de dados brutos coletados (descrição + checklist),
+    identifica a categoria da emergência e gera um relatório final conciso
+    usando a OpenAI, formatado para despacho.
+
+    Args:
+        dados_brutos: Lista de strings contendo P0_descricao e as respostas P1 a P6/P7.
+        categoria_emergencia: String indicando o tipo ("samu", "policia", "bombeiros").
+
+    Returns:
+        String com o relatório conciso gerado pela IA.
+    """
+    print(f"[IA Relatório] Gerando relatório para '{categoria_emergencia}'...")
+    mensagens = _mensagens_relatorio(dados_brutos, categoria_emergencia)
+
     try:
-        response = openai_client.chat.completions.create(
-            model="gpt-4o-mini", # Ou outro modelo que preferir
-            messages=[
-                {"role": "system", "content": f"Você gera relatórios de despacho de emergência para {publico_alvo}. Seja extremamente conciso e factual."},
-                {"role": "user", "content": prompt}
-            ],
+        relatorio = chat_completion(
+            mensagens,
+            operation="relatorio",
+            deadline=LLM_REPORT_DEADLINE_SECONDS,
             temperature=0.1, # Baixa temperatura para respostas mais diretas
             max_tokens=100 # Limita o tamanho da resposta
         )
-        relatorio = response.choices[0].message.content.strip()
         print(f"[IA Relatório] Relatório Gerado:\n{relatorio}")
         return relatorio
 
-    except Exception as e:
+    except LLMUnavailable as e:
         print(f"[IA Relatório] Erro ao gerar relatório final: {e}")
         # Fallback: retorna os dados brutos formatados em caso de erro
-        return f"Erro na IA. Dados brutos:\nDescrição: {descricao_inicial}\nChecklist:\n{texto_checklist}"
\ No newline at end of file
+        return relatorio_dados_brutos(dados_brutos)
+
+def _mensagens_atualizacao(relatorio_atual: str, novas_respostas: List[str], categoria_emergencia: str) -> Tuple[list, str]:
+    """Monta o prompt de atualização do rascunho (mensagens e respostas novas formatadas)."""
+    publico_alvo, foco_principal = _publico_e_foco(categoria_emergencia)
+    texto_novas = "\n".join(f"- {item}" for item in novas_respostas)
+
+    prompt = f"""
+    Abaixo está o rascunho atual de um relatório de despacho de emergência para a {publico_alvo}
+    e novas respostas do checklist coletadas depois dele.
+
+    Reescreva o relatório incorporando as novas informações. Mantenha-o EXTREMAMENTE CONCISO
+    (máximo 4 frases curtas e diretas). Foco principal: {foco_principal}
+    A PRIMEIRA frase deve trazer o local e se há risco imediato à vida.
+
+    RASCUNHO ATUAL:
+    ---
+    {relatorio_atual}
+    ---
+    NOVAS RESPOSTAS DO CHECKLIST:
+    {texto_novas}
+    ---
+
+    Gere apenas o relatório atualizado.
+    """
+
+    mensagens = [
+        {"role": "system", "content": f"Você gera relatórios de despacho de emergência para {publico_alvo}. Seja extremamente conciso e factual."},
+        {"role": "user", "content": prompt}
+    ]
+    return mensagens, texto_novas
+
+# --- FUNÇÃO: ATUALIZAÇÃO INCREMENTAL DO RELATÓRIO ---
+def atualizar_relatorio_conciso_ia(relatorio_atual: str, novas_respostas: List[str], categoria_emergencia: str) -> str:
+    """
+    Atualiza um rascunho de relatório com respostas novas do checklist, sem
+    reprocessar a chamada inteira (prompt e resposta bem menores).
+
+    Args:
+        relatorio_atual: Rascunho gerado com as respostas anteriores.
+        novas_respostas: Respostas do checklist coletadas depois do rascunho.
+        categoria_emergencia: String indicando o tipo ("samu", "policia", "bombeiros").
+
+    Returns:
+        String com o relatório atualizado (ou o rascunho anterior com as
+        respostas novas anexadas, em caso de erro).
+    """
+    if not novas_respostas:
+        return relatorio_atual
+
+    print(f"[IA Relatório] Atualizando rascunho para '{categoria_emergencia}' com {len(novas_respostas)} resposta(s)...")
+    mensagens, texto_novas = _mensagens_atualizacao(relatorio_atual, novas_respostas, categoria_emergencia)
+
+    try:
+        return chat_completion(
+            mensagens,
+            operation="relatorio_atualizacao",
+            deadline=LLM_REPORT_DEADLINE_SECONDS,
+            temperature=0.1,
+            max_tokens=100
+        )
+
+    except LLMUnavailable as e:
+        print(f"[IA Relatório] Erro ao atualizar rascunho: {e}")
+        return f"{relatorio_atual}\n{texto_novas}"
+
+# --- STREAMING: RELATÓRIO FRASE A FRASE ---
+
+# Fim de frase: ponto, exclamação, interrogação ou quebra de linha seguidos de espaço
+_FIM_DE_FRASE = re.compile(r"(?<=[.!?])\s+|\n+")
+
+# Lida para o despacho quando o streaming cai depois da primeira frase; em
+# seguida vêm os dados do fallback, para nada se perder
+AVISO_RELATORIO_INCOMPLETO = "Atenção: relatório incompleto por falha na IA. Seguem os dados coletados."
+
+# Tempo até a primeira frase e até o fim do relatório (em segundos)
+_metricas_stream = {"reports": 0, "first_sentence_total": 0.0, "first_sentence_max": 0.0,
+                    "first_sentence_last": 0.0, "complete_total": 0.0, "errors": 0, "incomplete": 0}
+_metricas_lock = threading.Lock()
+
+
+def get_report_stream_metrics() -> Dict[str, float]:
+    """Métricas dos relatórios em streaming (tempo até a primeira frase e total)."""
+    with _metricas_lock:
+        metricas = dict(_metricas_stream)
+    n = metricas["reports"]
+    metricas["first_sentence_avg"] = metricas["first_sentence_total"] / n if n else 0.0
+    metricas["complete_avg"] = metricas["complete_total"] / n if n else 0.0
+    return metricas
+
+
+def _registrar_metricas(primeira_frase: float, total: float) -> None:
+    with _metricas_lock:
+        _metricas_stream["reports"] += 1
+        _metricas_stream["first_sentence_total"] += primeira_frase
+        _metricas_stream["first_sentence_max"] = max(_metricas_stream["first_sentence_max"], primeira_frase)
+        _metricas_stream["first_sentence_last"] = primeira_frase
+        _metricas_stream["complete_total"] += total
+
+
+def split_sentences(texto: str) -> List[str]:
+    """Divide um relatório pronto em frases."""
+    return [frase.strip() for frase in _FIM_DE_FRASE.split(texto) if frase.strip()]
+
+
+def _stream_frases(mensagens: list, fallback: str) -> Iterator[str]:
+    """
+    Chama a OpenAI em modo streaming e devolve cada frase assim que ela termina.
+    Se der erro antes da primeira frase, devolve o fallback (frase a frase);
+    se der erro depois, completa com AVISO_RELATORIO_INCOMPLETO e o fallback.
+    """
+    inicio = time.perf_counter()
+    primeira_frase = None
+    incompleto = False
+    buffer = ""
+    try:
+        stream = open_chat_stream(
+            mensagens,
+            operation="relatorio_stream",
+            deadline=LLM_REPORT_DEADLINE_SECONDS,
+            temperature=0.1,
+            max_tokens=100
+        )
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            buffer += chunk.choices[0].delta.content or ""
+            partes = _FIM_DE_FRASE.split(buffer)
+            # A última parte ainda pode estar incompleta
+            for frase in partes[:-1]:
+                if frase.strip():
+                    if primeira_frase is None:
+                        primeira_frase = time.perf_counter() - inicio
+                        print(f"[IA Relatório] Primeira frase em {1000 * primeira_frase:.0f} ms")
+                    yield frase.strip()
+            buffer = partes[-1]
+
+    except Exception as e:
+        print(f"[IA Relatório] Erro no streaming do relatório: {e}")
+        with _metricas_lock:
+            _metricas_stream["errors"] += 1
+        if primeira_frase is None:
+            yield from split_sentences(fallback)
+            return
+        incompleto = True
+
+    if buffer.strip():
+        if primeira_frase is None:
+            primeira_frase = time.perf_counter() - inicio
+        yield buffer.strip()
+    elif primeira_frase is None:
+        # Resposta vazia: o fallback garante ao menos uma frase
+        yield from split_sentences(fallback)
+        return
+    if incompleto:
+        with _metricas_lock:
+            _metricas_stream["incomplete"] += 1
+        yield AVISO_RELATORIO_INCOMPLETO
+        yield from split_sentences(fallback)
+    if primeira_frase is not None:
+        _registrar_metricas(primeira_frase, time.perf_counter() - inicio)
+
+
+def gerar_relatorio_conciso_ia_stream(dados_brutos: List[str], categoria_emergencia: str) -> Iterator[str]:
+    """
+    Versão em streaming de gerar_relatorio_conciso_ia: devolve o relatório
+    frase a frase, conforme os tokens chegam. A primeira frase traz o local e
+    o risco à vida, então o despacho pode começar antes do relatório terminar.
+
+    Args:
+        dados_brutos: Lista de strings contendo P0_descricao e as respostas P1 a P6/P7.
+        categoria_emergencia: String indicando o tipo ("samu", "policia", "bombeiros").
+
+    Returns:
+        Iterador de frases do relatório.
+    """
+    print(f"[IA Relatório] Gerando relatório (streaming) para '{categoria_emergencia}'...")
+    mensagens = _mensagens_relatorio(dados_brutos, categoria_emergencia)
+    return _stream_frases(mensagens, relatorio_dados_brutos(dados_brutos))
+
+
+def atualizar_relatorio_conciso_ia_stream(relatorio_atual: str, novas_respostas: List[str], categoria_emergencia: str) -> Iterator[str]:
+    """
+    Versão em streaming de atualizar_relatorio_conciso_ia.
+
+    Returns:
+        Iterador de frases do relatório atualizado.
+    """
+    if not novas_respostas:
+        return iter(split_sentences(relatorio_atual))
+    mensagens, texto_novas = _mensagens_atualizacao(relatorio_atual, novas_respostas, categoria_emergencia)
+    return _stream_frases(mensagens, f"{relatorio_atual}\n{texto_novas}")
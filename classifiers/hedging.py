@@ -0,0 +1,234 @@
+"""
+Requisições "hedged" à OpenAI
+
+O p99 de uma chamada é muito maior que a mediana, e é essa cauda que quem
+liga escuta como silêncio na linha. Com o hedge ligado, se a resposta não
+chegar depois de um atraso (fixo ou o percentil LLM_HEDGE_PERCENTILE das
+latências recentes da operação), uma segunda requisição igual é disparada
+(opcionalmente para outro modelo/endpoint) e vale a que responder primeiro.
+A perdedora é cancelada.
+
+O custo extra é no máximo (100 - percentil)% de chamadas a mais; as
+estatísticas (disparados/vencidos) ficam em get_hedge_stats().
+"""
+import os
+import time
+import asyncio
+import threading
+import weakref
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from openai import AsyncOpenAI, OpenAI
+from dotenv import load_dotenv
+
+from .async_support import get_async_client
+
+# Carrega variáveis de ambiente
+load_dotenv()
+
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "0") == "1"
+# Operações (ver classifiers/llm.py) em que o hedge é usado
+LLM_HEDGE_OPERATIONS = set(os.getenv("LLM_HEDGE_OPERATIONS", "classificacao,classificacao_combinada").split(","))
+# Atraso fixo antes do hedge; 0 = usa o percentil das latências recentes
+LLM_HEDGE_DELAY_MS = float(os.getenv("LLM_HEDGE_DELAY_MS", "0"))
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+# Atraso usado enquanto não há amostras suficientes
+LLM_HEDGE_DEFAULT_DELAY_MS = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY_MS", "1000"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_WINDOW = int(os.getenv("LLM_HEDGE_WINDOW", "500"))
+# Modelo e endpoint da requisição secundária (vazios = os mesmos da primária)
+LLM_HEDGE_MODEL = os.getenv("LLM_HEDGE_MODEL", "")
+LLM_HEDGE_BASE_URL = os.getenv("LLM_HEDGE_BASE_URL", "")
+LLM_HEDGE_WORKERS = int(os.getenv("LLM_HEDGE_WORKERS", "16"))
+
+# Threads das chamadas síncronas com hedge (a primária e a secundária correm juntas)
+_executor = ThreadPoolExecutor(max_workers=LLM_HEDGE_WORKERS, thread_name_prefix="llm-hedge")
+
+_latencias: Dict[str, Deque[float]] = {}
+_stats: Dict[str, Dict[str, int]] = {}
+_lock = threading.Lock()
+
+_cliente_hedge: Optional[OpenAI] = None
+_clientes_hedge_async: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = weakref.WeakKeyDictionary()
+
+
+def should_hedge(operation: str) -> bool:
+    return LLM_HEDGE_ENABLED and operation in LLM_HEDGE_OPERATIONS
+
+
+def record_latency(operation: str, segundos: float) -> None:
+    """Guarda a latência de uma requisição primária (base do percentil)."""
+    with _lock:
+        janela = _latencias.get(operation)
+        if janela is None:
+            janela = deque(maxlen=LLM_HEDGE_WINDOW)
+            _latencias[operation] = janela
+        janela.append(segundos)
+
+
+def hedge_delay(operation: str) -> float:
+    """Quanto esperar (s) pela primária antes de disparar o hedge."""
+    if LLM_HEDGE_DELAY_MS > 0:
+        return LLM_HEDGE_DELAY_MS / 1000
+    with _lock:
+        amostras = sorted(_latencias.get(operation, ()))
+    if len(amostras) < LLM_HEDGE_MIN_SAMPLES:
+        return LLM_HEDGE_DEFAULT_DELAY_MS / 1000
+    indice = min(len(amostras) - 1, int(len(amostras) * LLM_HEDGE_PERCENTILE / 100))
+    return amostras[indice]
+
+
+def _contar(operation: str, campo: str) -> None:
+    with _lock:
+        _stats.setdefault(operation, {"requests": 0, "hedges_fired": 0, "hedges_won": 0})[campo] += 1
+
+
+def get_hedge_stats() -> Dict[str, Any]:
+    """Por operação: requisições, hedges disparados e vencidos e o atraso atual."""
+    with _lock:
+        stats = {operacao: dict(contadores) for operacao, contadores in _stats.items()}
+    for operacao, contadores in stats.items():
+        requisicoes = contadores["requests"] or 1
+        contadores["fired_rate"] = round(contadores["hedges_fired"] / requisicoes, 4)
+        contadores["won_rate"] = round(contadores["hedges_won"] / requisicoes, 4)
+        contadores["delay_ms"] = round(1000 * hedge_delay(operacao), 1)
+    return {"enabled": LLM_HEDGE_ENABLED, "operations": stats}
+
+
+def hedge_model(model: str) -> str:
+    return LLM_HEDGE_MODEL or model
+
+
+def get_hedge_client(padrao: OpenAI) -> OpenAI:
+    """Cliente da requisição secundária (o padrão, se não houver LLM_HEDGE_BASE_URL)."""
+    global _cliente_hedge
+    if not LLM_HEDGE_BASE_URL:
+        return padrao
+    if _cliente_hedge is None:
+        _cliente_hedge = OpenAI(
+            api_key=os.getenv("LLM_HEDGE_API_KEY") or os.getenv("OPENAI_API_KEY"),
+            base_url=LLM_HEDGE_BASE_URL,
+            max_retries=0,
+        )
+    return _cliente_hedge
+
+
+def get_async_hedge_client() -> AsyncOpenAI:
+    """Versão assíncrona de get_hedge_client (um cliente por event loop)."""
+    if not LLM_HEDGE_BASE_URL:
+        return get_async_client()
+    loop = asyncio.get_running_loop()
+    cliente = _clientes_hedge_async.get(loop)
+    if cliente is None:
+        cliente = AsyncOpenAI(
+            api_key=os.getenv("LLM_HEDGE_API_KEY") or os.getenv("OPENAI_API_KEY"),
+            base_url=LLM_HEDGE_BASE_URL,
+            max_retries=0,
+        )
+        _clientes_hedge_async[loop] = cliente
+    return cliente
+
+
+def hedged_call(
+    operation: str,
+    primaria: Callable[[], Any],
+    secundaria: Callable[[float], Any],
+    prazo: float,
+) -> Any:
+    """
+    Roda `primaria`; se ela não terminar no atraso do hedge, roda também
+    `secundaria` e devolve a primeira que der certo. Se as duas falharem,
+    levanta o erro da última.
+
+    Tudo cabe em `prazo` segundos: `secundaria` recebe o timeout que sobra
+    depois do atraso, e esgotado o prazo levanta TimeoutError (transitório
+    para o circuit breaker, ver llm.py).
+
+    Em threads não há como interromper a perdedora: ela é abandonada e o
+    resultado descartado (o timeout da requisição limita quanto ela dura).
+    """
+    _contar(operation, "requests")
+    atraso = hedge_delay(operation)
+    inicio = time.monotonic()
+    limite = inicio + prazo
+    futura_primaria = _executor.submit(primaria)
+    # Latência da primária mesmo quando ela perde (senão o percentil encolhe)
+    futura_primaria.add_done_callback(
+        lambda futura: not futura.cancelled() and futura.exception() is None
+        and record_latency(operation, time.monotonic() - inicio)
+    )
+    try:
+        return futura_primaria.result(timeout=min(atraso, prazo))
+    except FuturesTimeoutError:
+        pass
+
+    pendentes = {futura_primaria}
+    futura_secundaria = None
+    restante = limite - time.monotonic()
+    if restante > 0:
+        _contar(operation, "hedges_fired")
+        futura_secundaria = _executor.submit(secundaria, restante)
+        pendentes.add(futura_secundaria)
+    ultimo_erro: Optional[BaseException] = None
+    while pendentes:
+        restante = limite - time.monotonic()
+        if restante <= 0:
+            break
+        feitas, pendentes = wait(pendentes, timeout=restante, return_when=FIRST_COMPLETED)
+        for futura in feitas:
+            if futura.exception() is None:
+                if futura is futura_secundaria:
+                    _contar(operation, "hedges_won")
+                for perdedora in pendentes:
+                    perdedora.cancel()
+                return futura.result()
+            ultimo_erro = futura.exception()
+    if not pendentes:
+        raise ultimo_erro
+    for perdedora in pendentes:
+        perdedora.cancel()
+    raise FuturesTimeoutError(f"{operation}: sem resposta em {prazo:.1f}s (com hedge)")
+
+
+async def ahedged_call(
+    operation: str,
+    primaria: Callable[[], Awaitable[Any]],
+    secundaria: Callable[[], Awaitable[Any]],
+) -> Any:
+    """Versão assíncrona de hedged_call; a perdedora é cancelada de fato."""
+    _contar(operation, "requests")
+    atraso = hedge_delay(operation)
+    inicio = time.monotonic()
+    tarefa_primaria = asyncio.ensure_future(primaria())
+    tarefa_primaria.add_done_callback(
+        lambda tarefa: not tarefa.cancelled() and tarefa.exception() is None
+        and record_latency(operation, time.monotonic() - inicio)
+    )
+    tarefas = {tarefa_primaria}
+    try:
+        feitas, _ = await asyncio.wait(tarefas, timeout=atraso)
+        if feitas:
+            return tarefa_primaria.result()
+
+        _contar(operation, "hedges_fired")
+        tarefa_secundaria = asyncio.ensure_future(secundaria())
+        tarefas.add(tarefa_secundaria)
+        pendentes = set(tarefas)
+        ultimo_erro: Optional[BaseException] = None
+        while pendentes:
+            feitas, pendentes = await asyncio.wait(pendentes, return_when=asyncio.FIRST_COMPLETED)
+            for tarefa in feitas:
+                if tarefa.exception() is None:
+                    if tarefa is tarefa_secundaria:
+                        _contar(operation, "hedges_won")
+                    return tarefa.result()
+                ultimo_erro = tarefa.exception()
+        raise ultimo_erro
+    finally:
+        # Cancela a perdedora (ou as duas, se quem chamou foi cancelado)
+        for tarefa in tarefas:
+            if not tarefa.done():
+                tarefa.cancel()
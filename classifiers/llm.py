@@ -0,0 +1,416 @@
+"""
+Camada única de chamadas de chat à OpenAI
+
+A classificação, a classificação combinada e o relatório passam por aqui, com:
+
+- prazo total por chamada (deadline): tentativas, esperas e a fila do
+  semáforo cabem no orçamento; estourou, o chamador recebe LLMUnavailable e
+  usa o seu fallback determinístico;
+- tentativas limitadas, com espera exponencial + jitter, só para erros
+  transitórios (timeout, conexão, 429, 5xx e resposta que não é JSON);
+- circuit breaker por modelo: depois de LLM_BREAKER_FAILURES falhas seguidas
+  as chamadas vão direto para o fallback por LLM_BREAKER_RESET_SECONDS; então
+  uma única chamada de teste decide se o circuito fecha de novo;
+- hedge opcional (classifiers/hedging.py): cada tentativa das operações em
+  LLM_HEDGE_OPERATIONS dispara uma segunda requisição se a primeira demorar.
+
+Assim o tempo de resposta na linha telefônica fica limitado pelo prazo, não
+importa como a OpenAI esteja se comportando.
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+import openai
+from openai import OpenAI
+from dotenv import load_dotenv
+
+from .async_support import get_async_client, get_semaphore
+from .hedging import (
+    ahedged_call,
+    get_async_hedge_client,
+    get_hedge_client,
+    get_hedge_stats,
+    hedge_model,
+    hedged_call,
+    should_hedge,
+)
+
+# Carrega variáveis de ambiente
+load_dotenv()
+
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+# Prazo total por operação (segundos)
+LLM_CLASSIFY_DEADLINE_SECONDS = float(os.getenv("LLM_CLASSIFY_DEADLINE_SECONDS", "4"))
+LLM_REPORT_DEADLINE_SECONDS = float(os.getenv("LLM_REPORT_DEADLINE_SECONDS", "10"))
+# Timeout de cada tentativa (limitado pelo que sobra do prazo)
+LLM_ATTEMPT_TIMEOUT_SECONDS = float(os.getenv("LLM_ATTEMPT_TIMEOUT_SECONDS", "3"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.2"))
+# Não vale a pena começar uma tentativa com menos tempo que isso
+LLM_MIN_ATTEMPT_SECONDS = float(os.getenv("LLM_MIN_ATTEMPT_SECONDS", "0.3"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+# As tentativas são controladas aqui, não pelo SDK
+client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+
+
+class LLMUnavailable(Exception):
+    """A chamada não teve resposta válida dentro do prazo (ou o circuito está aberto)."""
+
+
+class CircuitOpenError(LLMUnavailable):
+    """Circuito aberto: a chamada nem foi feita."""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker simples (fechado -> aberto -> meio-aberto).
+
+    Args:
+        failures: Falhas seguidas que abrem o circuito
+        reset_seconds: Tempo aberto antes de deixar passar uma chamada de teste
+    """
+
+    def __init__(self, failures: int = LLM_BREAKER_FAILURES, reset_seconds: float = LLM_BREAKER_RESET_SECONDS):
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._falhas = 0
+        self._aberto_ate = 0.0
+        self._teste_em_andamento = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._falhas < self.failures:
+                return "closed"
+            return "open" if time.monotonic() < self._aberto_ate else "half_open"
+
+    def allow(self) -> bool:
+        """True se a chamada pode ser feita agora."""
+        with self._lock:
+            if self._falhas < self.failures:
+                return True
+            if time.monotonic() < self._aberto_ate or self._teste_em_andamento:
+                return False
+            # Meio-aberto: só uma chamada de teste por vez
+            self._teste_em_andamento = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._falhas = 0
+            self._teste_em_andamento = False
+
+    def release(self) -> None:
+        """
+        Libera a vaga de teste do meio-aberto sem resultado (chamada cancelada),
+        senão allow() recusaria tudo até o processo reiniciar.
+        """
+        with self._lock:
+            self._teste_em_andamento = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._falhas += 1
+            self._teste_em_andamento = False
+            if self._falhas >= self.failures:
+                self._aberto_ate = time.monotonic() + self.reset_seconds
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+_stats: Dict[str, Dict[str, int]] = {}
+_stats_lock = threading.Lock()
+
+_observadores: List[Callable[[str, str, float, Any, Optional[Exception]], None]] = []
+
+
+def get_breaker(model: str) -> CircuitBreaker:
+    """Circuit breaker do modelo (um por modelo/endpoint)."""
+    with _breakers_lock:
+        breaker = _breakers.get(model)
+        if breaker is None:
+            breaker = CircuitBreaker()
+            _breakers[model] = breaker
+        return breaker
+
+
+def _contar(operation: str, campo: str) -> None:
+    with _stats_lock:
+        contadores = _stats.setdefault(
+            operation, {"calls": 0, "success": 0, "retries": 0, "failures": 0, "circuit_open": 0}
+        )
+        contadores[campo] += 1
+
+
+def get_llm_stats() -> Dict[str, Any]:
+    """Contadores por operação e estado dos circuit breakers."""
+    with _stats_lock:
+        operacoes = {nome: dict(contadores) for nome, contadores in _stats.items()}
+    with _breakers_lock:
+        breakers = {modelo: breaker.state for modelo, breaker in _breakers.items()}
+    return {"operations": operacoes, "breakers": breakers, "hedging": get_hedge_stats()}
+
+
+def add_call_observer(callback: Callable[[str, str, float, Any, Optional[Exception]], None]) -> None:
+    """
+    Registra callback(operation, model, segundos, response, erro), chamado
+    depois de cada tentativa (métricas de latência e de tokens).
+    """
+    _observadores.append(callback)
+
+
+def _observar(operation: str, model: str, inicio: float, response: Any = None, erro: Optional[Exception] = None) -> None:
+    segundos = time.monotonic() - inicio
+    for callback in _observadores:
+        try:
+            callback(operation, model, segundos, response, erro)
+        except Exception as e:
+            print(f"[LLM] Erro no observador {callback}: {e}")
+
+
+def _transitorio(e: Exception) -> bool:
+    """Erros que valem nova tentativa e contam para o circuit breaker."""
+    if isinstance(e, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)):
+        return True
+    return isinstance(e, openai.APIStatusError) and (e.status_code in (408, 409) or e.status_code >= 500)
+
+
+def _registrar_erro(breaker: CircuitBreaker, e: Exception) -> bool:
+    """Atualiza o circuit breaker com o erro. Retorna True se vale nova tentativa."""
+    if _transitorio(e) or isinstance(e, asyncio.TimeoutError):
+        breaker.record_failure()
+        return True
+    # Erro do pedido (4xx): o serviço respondeu, repetir não adianta
+    breaker.record_success()
+    return False
+
+
+def parse_json(content: str) -> Dict[str, Any]:
+    """Conteúdo da resposta como objeto JSON (ValueError se não for)."""
+    resultado = json.loads(content)
+    if not isinstance(resultado, dict):
+        raise ValueError("Resposta não é um objeto JSON")
+    return resultado
+
+
+def _espera(tentativa: int) -> float:
+    # Exponencial com jitter (0.5x a 1.5x)
+    return LLM_RETRY_BASE_SECONDS * (2 ** tentativa) * random.uniform(0.5, 1.5)
+
+
+def _conteudo(response) -> str:
+    return response.choices[0].message.content or ""
+
+
+def chat_completion(
+    messages: list,
+    operation: str,
+    deadline: float,
+    parse: Callable[[str], Any] = str.strip,
+    model: str = LLM_MODEL,
+    **params
+) -> Any:
+    """
+    Chamada de chat com prazo, tentativas e circuit breaker.
+
+    Args:
+        messages: Mensagens do chat
+        operation: Nome da operação (para as estatísticas)
+        deadline: Prazo total em segundos
+        parse: Converte o conteúdo da resposta; ValueError/KeyError contam
+            como resposta inválida e geram nova tentativa
+        model: Modelo da OpenAI
+        **params: Demais parâmetros de chat.completions.create
+
+    Returns:
+        O conteúdo convertido por `parse`
+
+    Raises:
+        LLMUnavailable: sem resposta válida dentro do prazo
+    """
+    _contar(operation, "calls")
+    limite = time.monotonic() + deadline
+    breaker = get_breaker(model)
+    ultimo_erro: Optional[Exception] = None
+
+    for tentativa in range(LLM_MAX_RETRIES + 1):
+        restante = limite - time.monotonic()
+        if restante < LLM_MIN_ATTEMPT_SECONDS:
+            break
+        if not breaker.allow():
+            _contar(operation, "circuit_open")
+            raise CircuitOpenError(f"Circuito aberto para {model}")
+        if tentativa:
+            _contar(operation, "retries")
+        timeout = min(LLM_ATTEMPT_TIMEOUT_SECONDS, restante)
+        inicio = time.monotonic()
+        try:
+            if should_hedge(operation):
+                response = hedged_call(
+                    operation,
+                    lambda: client.chat.completions.create(
+                        model=model, messages=messages, timeout=timeout, **params
+                    ),
+                    lambda timeout_hedge: get_hedge_client(client).chat.completions.create(
+                        model=hedge_model(model), messages=messages, timeout=timeout_hedge, **params
+                    ),
+                    prazo=timeout,
+                )
+            else:
+                response = client.chat.completions.create(
+                    model=model, messages=messages, timeout=timeout, **params
+                )
+        except Exception as e:
+            _observar(operation, model, inicio, erro=e)
+            ultimo_erro = e
+            if not _registrar_erro(breaker, e):
+                break
+        except BaseException:
+            # Cancelada (cliente desconectou) ou interrompida: sem veredito
+            breaker.release()
+            raise
+        else:
+            _observar(operation, model, inicio, response)
+            breaker.record_success()
+            try:
+                resultado = parse(_conteudo(response))
+                _contar(operation, "success")
+                return resultado
+            except (ValueError, KeyError, IndexError) as e:
+                # Resposta chegou, mas inválida: nova tentativa
+                ultimo_erro = e
+        espera = min(_espera(tentativa), limite - time.monotonic() - LLM_MIN_ATTEMPT_SECONDS)
+        if espera > 0:
+            time.sleep(espera)
+
+    _contar(operation, "failures")
+    raise LLMUnavailable(f"{operation}: {ultimo_erro or 'prazo esgotado'}")
+
+
+async def achat_completion(
+    messages: list,
+    operation: str,
+    deadline: float,
+    parse: Callable[[str], Any] = str.strip,
+    model: str = LLM_MODEL,
+    **params
+) -> Any:
+    """
+    Versão assíncrona de chat_completion. A espera pelo semáforo de
+    concorrência também conta no prazo.
+    """
+    _contar(operation, "calls")
+    limite = time.monotonic() + deadline
+    breaker = get_breaker(model)
+    ultimo_erro: Optional[Exception] = None
+
+    async def pedir(cliente, modelo: str, timeout: float):
+        async with get_semaphore():
+            return await cliente.chat.completions.create(
+                model=modelo, messages=messages, timeout=timeout, **params
+            )
+
+    async def tentar(timeout: float):
+        if should_hedge(operation):
+            return await ahedged_call(
+                operation,
+                lambda: pedir(get_async_client(), model, timeout),
+                lambda: pedir(get_async_hedge_client(), hedge_model(model), timeout),
+            )
+        return await pedir(get_async_client(), model, timeout)
+
+    for tentativa in range(LLM_MAX_RETRIES + 1):
+        restante = limite - time.monotonic()
+        if restante < LLM_MIN_ATTEMPT_SECONDS:
+            break
+        if not breaker.allow():
+            _contar(operation, "circuit_open")
+            raise CircuitOpenError(f"Circuito aberto para {model}")
+        if tentativa:
+            _contar(operation, "retries")
+        inicio = time.monotonic()
+        try:
+            response = await asyncio.wait_for(tentar(min(LLM_ATTEMPT_TIMEOUT_SECONDS, restante)), restante)
+        except Exception as e:
+            _observar(operation, model, inicio, erro=e)
+            ultimo_erro = e
+            if not _registrar_erro(breaker, e):
+                break
+        except BaseException:
+            # Cancelada (cliente desconectou) ou interrompida: sem veredito
+            breaker.release()
+            raise
+        else:
+            _observar(operation, model, inicio, response)
+            breaker.record_success()
+            try:
+                resultado = parse(_conteudo(response))
+                _contar(operation, "success")
+                return resultado
+            except (ValueError, KeyError, IndexError) as e:
+                ultimo_erro = e
+        espera = min(_espera(tentativa), limite - time.monotonic() - LLM_MIN_ATTEMPT_SECONDS)
+        if espera > 0:
+            await asyncio.sleep(espera)
+
+    _contar(operation, "failures")
+    raise LLMUnavailable(f"{operation}: {ultimo_erro or 'prazo esgotado'}")
+
+
+def open_chat_stream(messages: list, operation: str, deadline: float, model: str = LLM_MODEL, **params):
+    """
+    Abre uma resposta em streaming, com tentativas só até a conexão abrir.
+    O timeout de leitura de cada pedaço é o de uma tentativa.
+
+    Raises:
+        LLMUnavailable: não foi possível abrir o stream dentro do prazo
+    """
+    _contar(operation, "calls")
+    limite = time.monotonic() + deadline
+    breaker = get_breaker(model)
+    ultimo_erro: Optional[Exception] = None
+
+    for tentativa in range(LLM_MAX_RETRIES + 1):
+        restante = limite - time.monotonic()
+        if restante < LLM_MIN_ATTEMPT_SECONDS:
+            break
+        if not breaker.allow():
+            _contar(operation, "circuit_open")
+            raise CircuitOpenError(f"Circuito aberto para {model}")
+        if tentativa:
+            _contar(operation, "retries")
+        inicio = time.monotonic()
+        try:
+            stream = client.chat.completions.create(
+                model=model, messages=messages, stream=True,
+                timeout=min(LLM_ATTEMPT_TIMEOUT_SECONDS, restante), **params
+            )
+            # Só até abrir o stream (os tokens não vêm na resposta em streaming)
+            _observar(operation, model, inicio)
+            breaker.record_success()
+            _contar(operation, "success")
+            return stream
+        except Exception as e:
+            _observar(operation, model, inicio, erro=e)
+            ultimo_erro = e
+            if not _registrar_erro(breaker, e):
+                break
+        except BaseException:
+            # Cancelada (cliente desconectou) ou interrompida: sem veredito
+            breaker.release()
+            raise
+        espera = min(_espera(tentativa), limite - time.monotonic() - LLM_MIN_ATTEMPT_SECONDS)
+        if espera > 0:
+            time.sleep(espera)
+
+    _contar(operation, "failures")
+    raise LLMUnavailable(f"{operation}: {ultimo_erro or 'prazo esgotado'}")
@@ -0,0 +1,406 @@
+"""
+Classificador local (naive Bayes multinomial) para o caminho rápido
+
+Responde em bem menos de 1 ms as chamadas óbvias ("tem um incêndio na minha
+casa") e deixa para a OpenAI todo o resto.
+
+O modelo é treinado a partir da tabela `calls` (classificações já feitas pela
+IA) e salvo em JSON:
+
+    python -m classifiers.local_classifier train
+
+As probabilidades do naive Bayes são exageradas (quase sempre >99%), então o
+treino:
+
+- usa "indefinido" como classe negativa: chamadas indefinidas, policia-analogia
+  e as que a IA classificou com pouca confiança (mistas, pouco evidentes).
+  Quando ela vence, a chamada vai para a IA;
+- separa ~20% das chamadas (por hash da transcrição) para validação e ajusta
+  nelas uma temperatura que calibra a confiança;
+- escolhe o limiar de confiança como o menor em que a precisão na validação
+  atinge LOCAL_CLASSIFIER_TARGET_PRECISION, com pelo menos
+  LOCAL_CLASSIFIER_MIN_HOLDOUT respostas. Se nenhum atingir, o modelo salvo
+  nunca responde sozinho.
+
+Também não responde quando menos de LOCAL_CLASSIFIER_MIN_COVERAGE das palavras
+da transcrição (ou menos de LOCAL_CLASSIFIER_MIN_KNOWN_WORDS palavras) estão no
+vocabulário do treino.
+"""
+import os
+import sys
+import json
+import math
+import threading
+import zlib
+from collections import Counter, defaultdict
+from dotenv import load_dotenv
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .normalization import normalize_transcript
+
+# Carrega variáveis de ambiente
+load_dotenv()
+
+LOCAL_CLASSIFIER_ENABLED = os.getenv("LOCAL_CLASSIFIER_ENABLED", "1") == "1"
+LOCAL_CLASSIFIER_MODEL_PATH = os.getenv("LOCAL_CLASSIFIER_MODEL_PATH", "local_classifier.json")
+# Confiança mínima (0-100) para responder sem chamar a OpenAI. Vazio = o
+# limiar escolhido no treino pela precisão na validação (recomendado)
+LOCAL_CLASSIFIER_THRESHOLD = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD") or "nan")
+# Precisão mínima (0-1) na validação para o limiar escolhido no treino
+LOCAL_CLASSIFIER_TARGET_PRECISION = float(os.getenv("LOCAL_CLASSIFIER_TARGET_PRECISION", "0.98"))
+# Mínimo de respostas locais na validação para confiar na precisão medida
+LOCAL_CLASSIFIER_MIN_HOLDOUT = int(os.getenv("LOCAL_CLASSIFIER_MIN_HOLDOUT", "20"))
+# Fração mínima das palavras da transcrição que precisam estar no vocabulário
+LOCAL_CLASSIFIER_MIN_COVERAGE = float(os.getenv("LOCAL_CLASSIFIER_MIN_COVERAGE", "0.6"))
+# Mínimo de palavras conhecidas ("minha casa" não basta para decidir)
+LOCAL_CLASSIFIER_MIN_KNOWN_WORDS = int(os.getenv("LOCAL_CLASSIFIER_MIN_KNOWN_WORDS", "3"))
+# Abaixo desta confiança da IA, a chamada entra no treino como classe negativa
+LOCAL_CLASSIFIER_MIN_LABEL_CONFIDENCE = int(os.getenv("LOCAL_CLASSIFIER_MIN_LABEL_CONFIDENCE", "80"))
+# Mínimo de exemplos de cada categoria para aceitar o treino
+LOCAL_CLASSIFIER_MIN_EXAMPLES = int(os.getenv("LOCAL_CLASSIFIER_MIN_EXAMPLES", "20"))
+
+# Início do reasoning das respostas do próprio modelo local (fora do treino)
+LOCAL_REASONING_PREFIX = "Classificador local"
+
+# Categorias que o modelo local pode responder ("policia-analogia" fica com
+# detect_disguised_call e "indefinido" sempre vai para a IA, ver NEGATIVE_CATEGORY)
+TRAINABLE_CATEGORIES = ["policia", "samu", "bombeiros", "trote"]
+# Classe negativa: quando vence, a chamada vai para a IA
+NEGATIVE_CATEGORY = "indefinido"
+
+# Limiar que nunca é atingido (modelo sem limiar calibrado)
+NUNCA = 101.0
+# Temperaturas testadas na calibração: 1 a ~32768 em passos de 2^(1/4)
+_TEMPERATURAS = [2 ** (k / 4) for k in range(61)]
+
+
+def tokenize(transcript: str) -> List[str]:
+    """Palavras e bigramas da transcrição normalizada."""
+    palavras = normalize_transcript(transcript).split()
+    return palavras + [f"{a}_{b}" for a, b in zip(palavras, palavras[1:])]
+
+
+def is_holdout(transcript: str) -> bool:
+    """~20% das transcrições, sempre as mesmas (e repetidas do mesmo lado)."""
+    return zlib.crc32(normalize_transcript(transcript).encode("utf-8")) % 5 == 0
+
+
+class NaiveBayesClassifier:
+    """
+    Naive Bayes multinomial com suavização de Laplace.
+
+    temperature divide os log-scores antes do softmax (calibração) e
+    threshold é o limiar escolhido na validação (ver calibrate).
+    """
+
+    def __init__(self, log_priors: Dict[str, float], log_likelihoods: Dict[str, Dict[str, float]],
+                 log_unknown: Dict[str, float], temperature: float = 1.0, threshold: float = NUNCA):
+        self.log_priors = log_priors
+        self.log_likelihoods = log_likelihoods
+        self.log_unknown = log_unknown
+        self.temperature = temperature
+        self.threshold = threshold
+        self._vocabulario = {token for likelihoods in log_likelihoods.values() for token in likelihoods}
+
+    @classmethod
+    def train(cls, exemplos: Iterable[Tuple[str, str]], alpha: float = 1.0,
+              min_examples: int = LOCAL_CLASSIFIER_MIN_EXAMPLES) -> "NaiveBayesClassifier":
+        """
+        Treina o modelo.
+
+        Um modelo com uma categoria só responderia essa categoria para tudo
+        com 100% de confiança, então o treino exige pelo menos 2 categorias,
+        cada uma com `min_examples` exemplos, e a classe negativa
+        NEGATIVE_CATEGORY, sem a qual o modelo nunca deixa a chamada para a IA
+        (ValueError caso contrário).
+
+        O modelo sai sem limiar (nunca responde) até passar por calibrate.
+
+        Args:
+            exemplos: Pares (transcrição, categoria)
+            alpha: Suavização de Laplace
+            min_examples: Mínimo de exemplos por categoria
+        """
+        docs_por_categoria: Counter = Counter()
+        contagens: Dict[str, Counter] = defaultdict(Counter)
+        for transcript, categoria in exemplos:
+            docs_por_categoria[categoria] += 1
+            contagens[categoria].update(tokenize(transcript))
+
+        if not docs_por_categoria:
+            raise ValueError("Nenhum exemplo de treino")
+        if len(docs_por_categoria) < 2:
+            raise ValueError(f"Treino com uma categoria só ({next(iter(docs_por_categoria))}); são precisas ao menos 2")
+        if NEGATIVE_CATEGORY not in docs_por_categoria:
+            raise ValueError(f"Treino sem exemplos de '{NEGATIVE_CATEGORY}' (classe negativa)")
+        poucos = {categoria: n for categoria, n in docs_por_categoria.items() if n < min_examples}
+        if poucos:
+            raise ValueError(f"Categorias com menos de {min_examples} exemplos: {poucos}")
+
+        vocabulario = set()
+        for contagem in contagens.values():
+            vocabulario.update(contagem)
+
+        total_docs = sum(docs_por_categoria.values())
+        log_priors = {}
+        log_likelihoods = {}
+        log_unknown = {}
+        for categoria, n_docs in docs_por_categoria.items():
+            contagem = contagens[categoria]
+            denominador = sum(contagem.values()) + alpha * (len(vocabulario) + 1)
+            log_priors[categoria] = math.log(n_docs / total_docs)
+            log_likelihoods[categoria] = {
+                token: math.log((n + alpha) / denominador) for token, n in contagem.items()
+            }
+            log_unknown[categoria] = math.log(alpha / denominador)
+        return cls(log_priors, log_likelihoods, log_unknown)
+
+    def coverage(self, transcript: str) -> Tuple[float, int]:
+        """Fração (0-1) e número das palavras da transcrição que estão no vocabulário."""
+        palavras = normalize_transcript(transcript).split()
+        if not palavras:
+            return 0.0, 0
+        conhecidas = sum(1 for palavra in palavras if palavra in self._vocabulario)
+        return conhecidas / len(palavras), conhecidas
+
+    def has_evidence(self, transcript: str, min_coverage: float = LOCAL_CLASSIFIER_MIN_COVERAGE,
+                     min_known_words: int = LOCAL_CLASSIFIER_MIN_KNOWN_WORDS) -> bool:
+        """Se há palavras conhecidas suficientes para o modelo opinar."""
+        fracao, conhecidas = self.coverage(transcript)
+        return conhecidas >= max(min_known_words, 1) and fracao >= min_coverage
+
+    def _probabilidades(self, tokens: List[str], temperature: float) -> Dict[str, float]:
+        scores = {}
+        for categoria, prior in self.log_priors.items():
+            likelihoods = self.log_likelihoods[categoria]
+            desconhecido = self.log_unknown[categoria]
+            scores[categoria] = (prior + sum(likelihoods.get(token, desconhecido) for token in tokens)) / temperature
+
+        # Softmax estável sobre os log-scores
+        maximo = max(scores.values())
+        exps = {categoria: math.exp(score - maximo) for categoria, score in scores.items()}
+        total = sum(exps.values())
+        return {categoria: valor / total for categoria, valor in exps.items()}
+
+    def predict(self, transcript: str) -> Tuple[Optional[str], float]:
+        """
+        Retorna (categoria, confiança calibrada 0-100). A categoria pode ser
+        NEGATIVE_CATEGORY. Sem palavras conhecidas suficientes (has_evidence),
+        retorna (None, 0).
+        """
+        if not self.has_evidence(transcript):
+            return None, 0.0
+        probabilidades = self._probabilidades(tokenize(transcript), self.temperature)
+        melhor = max(probabilidades, key=probabilidades.get)
+        return melhor, 100.0 * probabilidades[melhor]
+
+    def calibrate(self, exemplos: Iterable[Tuple[str, str]],
+                  target_precision: float = LOCAL_CLASSIFIER_TARGET_PRECISION,
+                  min_holdout: int = LOCAL_CLASSIFIER_MIN_HOLDOUT) -> Dict[str, any]:
+        """
+        Ajusta temperature e threshold em exemplos de validação (fora do treino).
+
+        A temperatura é a que minimiza a log-loss na validação. O limiar é o
+        menor em que as respostas locais (categoria não negativa, has_evidence,
+        confiança >= limiar) acertam pelo menos `target_precision`
+        e somam ao menos `min_holdout`; sem nenhum assim, NUNCA.
+
+        Returns:
+            Dict com temperature, threshold, precision e answered na validação
+        """
+        validacao = [(tokenize(t), categoria, self.has_evidence(t)) for t, categoria in exemplos
+                     if categoria in self.log_priors]
+        if not validacao:
+            raise ValueError("Nenhum exemplo de validação com categoria conhecida")
+
+        def log_loss(temperature: float) -> float:
+            return -sum(math.log(max(self._probabilidades(tokens, temperature)[categoria], 1e-12))
+                        for tokens, categoria, _ in validacao)
+
+        self.temperature = min(_TEMPERATURAS, key=log_loss)
+
+        # Respostas candidatas, da mais confiante para a menos
+        respostas = []
+        for tokens, categoria, evidencia in validacao:
+            if not evidencia:
+                continue
+            probabilidades = self._probabilidades(tokens, self.temperature)
+            melhor = max(probabilidades, key=probabilidades.get)
+            if melhor != NEGATIVE_CATEGORY:
+                respostas.append((100.0 * probabilidades[melhor], melhor == categoria))
+        respostas.sort(reverse=True)
+
+        self.threshold, precisao, respondidas = NUNCA, None, 0
+        acertos = 0
+        for n, (confianca, acertou) in enumerate(respostas, start=1):
+            acertos += acertou
+            # Só fecha um limiar entre confianças diferentes
+            if n < len(respostas) and respostas[n][0] == confianca:
+                continue
+            if n >= min_holdout and acertos / n >= target_precision:
+                self.threshold, precisao, respondidas = confianca, acertos / n, n
+        return {
+            "temperature": self.temperature,
+            "threshold": self.threshold,
+            "precision": precisao,
+            "answered": respondidas,
+            "holdout": len(validacao),
+        }
+
+    def to_dict(self) -> Dict:
+        return {
+            "log_priors": self.log_priors,
+            "log_likelihoods": self.log_likelihoods,
+            "log_unknown": self.log_unknown,
+            "temperature": self.temperature,
+            "threshold": self.threshold,
+        }
+
+    @classmethod
+    def from_dict(cls, dados: Dict) -> "NaiveBayesClassifier":
+        # Modelos salvos antes da calibração ficam sem limiar: é preciso treinar de novo
+        return cls(dados["log_priors"], dados["log_likelihoods"], dados["log_unknown"],
+                   dados.get("temperature", 1.0), dados.get("threshold", NUNCA))
+
+    def save(self, path: str = LOCAL_CLASSIFIER_MODEL_PATH) -> None:
+        with open(path, "w", encoding="utf-8") as arquivo:
+            json.dump(self.to_dict(), arquivo, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str = LOCAL_CLASSIFIER_MODEL_PATH) -> "NaiveBayesClassifier":
+        with open(path, encoding="utf-8") as arquivo:
+            return cls.from_dict(json.load(arquivo))
+
+
+def load_training_data(min_confidence: int = LOCAL_CLASSIFIER_MIN_LABEL_CONFIDENCE) -> List[Tuple[str, str]]:
+    """
+    Lê da tabela `calls` os pares (transcrição, categoria) usados no treino.
+
+    Chamadas de TRAINABLE_CATEGORIES classificadas pela IA com menos de
+    `min_confidence`, as indefinidas e as policia-analogia entram como
+    NEGATIVE_CATEGORY. Ficam de fora as chamadas respondidas pelo próprio
+    modelo local, para ele não treinar com a própria saída.
+    """
+    # Import tardio: só o treino precisa do banco
+    from sqlalchemy import or_
+    from database import SessionLocal, Call
+
+    db = SessionLocal()
+    try:
+        linhas = (
+            db.query(Call.transcript, Call.category, Call.confidence)
+            .filter(Call.category.isnot(None))
+            .filter(Call.transcript.isnot(None))
+            .filter(or_(Call.reasoning.is_(None), ~Call.reasoning.startswith(LOCAL_REASONING_PREFIX)))
+            .yield_per(1000)
+        )
+        exemplos = []
+        for transcript, categoria, confianca in linhas:
+            if not transcript.strip():
+                continue
+            if categoria not in TRAINABLE_CATEGORIES or (confianca or 0) < min_confidence:
+                categoria = NEGATIVE_CATEGORY
+            exemplos.append((transcript, categoria))
+        return exemplos
+    finally:
+        db.close()
+
+
+_modelo: Optional[NaiveBayesClassifier] = None
+_modelo_carregado = False
+_lock = threading.Lock()
+
+
+def get_model() -> Optional[NaiveBayesClassifier]:
+    """Modelo carregado de LOCAL_CLASSIFIER_MODEL_PATH (None se não houver arquivo)."""
+    global _modelo, _modelo_carregado
+    if not _modelo_carregado:
+        with _lock:
+            if not _modelo_carregado:
+                if os.path.exists(LOCAL_CLASSIFIER_MODEL_PATH):
+                    _modelo = NaiveBayesClassifier.load(LOCAL_CLASSIFIER_MODEL_PATH)
+                    print(f"[Classificador local] Modelo carregado de {LOCAL_CLASSIFIER_MODEL_PATH}")
+                _modelo_carregado = True
+    return _modelo
+
+
+def set_model(modelo: Optional[NaiveBayesClassifier]) -> None:
+    """Troca o modelo em uso (por exemplo, depois de um novo treino)."""
+    global _modelo, _modelo_carregado
+    with _lock:
+        _modelo = modelo
+        _modelo_carregado = True
+
+
+def classify_locally(transcript: str, threshold: float = LOCAL_CLASSIFIER_THRESHOLD) -> Optional[Dict[str, any]]:
+    """
+    Tenta classificar a chamada sem a OpenAI.
+
+    Args:
+        transcript: Texto transcrito da chamada
+        threshold: Confiança calibrada mínima (0-100) para aceitar a resposta
+            local; se NaN, o limiar escolhido no treino
+
+    Returns:
+        Dict com category, confidence e reasoning, ou None se a IA deve decidir
+    """
+    if not LOCAL_CLASSIFIER_ENABLED:
+        return None
+    modelo = get_model()
+    if modelo is None:
+        return None
+
+    if math.isnan(threshold):
+        threshold = modelo.threshold
+    categoria, confianca = modelo.predict(transcript)
+    if categoria is None or categoria == NEGATIVE_CATEGORY or confianca < threshold:
+        return None
+    return {
+        "category": categoria,
+        "confidence": int(confianca),
+        "reasoning": f"{LOCAL_REASONING_PREFIX} (naive Bayes) com {confianca:.1f}% de confiança"
+    }
+
+
+def train_calibrated(exemplos: List[Tuple[str, str]], **kwargs) -> Tuple[NaiveBayesClassifier, Dict[str, any]]:
+    """
+    Treina com ~80% dos exemplos e calibra nos demais (ver is_holdout).
+
+    Args:
+        exemplos: Pares (transcrição, categoria)
+        **kwargs: Repassados a calibrate (target_precision, min_holdout)
+
+    Returns:
+        Tupla (modelo, resumo da calibração)
+    """
+    treino = [exemplo for exemplo in exemplos if not is_holdout(exemplo[0])]
+    validacao = [exemplo for exemplo in exemplos if is_holdout(exemplo[0])]
+    modelo = NaiveBayesClassifier.train(treino)
+    return modelo, modelo.calibrate(validacao, **kwargs)
+
+
+def train_from_database(path: str = LOCAL_CLASSIFIER_MODEL_PATH) -> NaiveBayesClassifier:
+    """Treina com a tabela `calls`, salva em `path` e passa a usar o novo modelo."""
+    exemplos = load_training_data()
+    print(f"[Classificador local] Treinando com {len(exemplos)} chamadas...")
+    print(f"[Classificador local] Por categoria: {dict(Counter(c for _, c in exemplos))}")
+    modelo, resumo = train_calibrated(exemplos)
+    print(f"[Classificador local] Validação: {resumo}")
+    if modelo.threshold >= NUNCA:
+        print(f"[Classificador local] Nenhum limiar atinge {LOCAL_CLASSIFIER_TARGET_PRECISION:.0%} de precisão "
+              f"com {LOCAL_CLASSIFIER_MIN_HOLDOUT}+ respostas: o modelo não vai responder sozinho")
+    modelo.save(path)
+    set_model(modelo)
+    print(f"[Classificador local] Modelo salvo em {path}")
+    return modelo
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "train":
+        print("Uso: python -m classifiers.local_classifier train")
+        sys.exit(1)
+    try:
+        train_from_database()
+    except ValueError as e:
+        print(f"[Classificador local] Treino recusado: {e}")
+        sys.exit(1)
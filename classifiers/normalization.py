@@ -0,0 +1,21 @@
+import re
+import unicodedata
+
+_NAO_ALFANUMERICO = re.compile(r"[^0-9a-z]+")
+
+
+def fold_accents(text: str) -> str:
+    """Remove acentos e cedilha ("incêndio" -> "incendio")."""
+    decomposto = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposto if not unicodedata.combining(c))
+
+
+def normalize_transcript(text: str) -> str:
+    """
+    Normaliza uma transcrição para comparação: minúsculas, sem acentos,
+    sem pontuação e com espaços colapsados.
+
+    Ex: "Tem um INCÊNDIO aqui!!" -> "tem um incendio aqui"
+    """
+    texto = fold_accents(text.lower())
+    return _NAO_ALFANUMERICO.sub(" ", texto).strip()
@@ -0,0 +1,166 @@
+import os
+import json
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set
+
+from .normalization import normalize_transcript
+
+# Arquivo com os padrões de chamada disfarçada
+DISGUISED_PATTERNS_PATH = os.getenv(
+    "DISGUISED_PATTERNS_PATH",
+    os.path.join(os.path.dirname(__file__), "disguised_patterns.json")
+)
+
+
+class KeywordAutomaton:
+    """
+    Autômato de Aho-Corasick sobre palavras-chave normalizadas.
+
+    O texto e as palavras-chave são normalizados (minúsculas, sem acentos e sem
+    pontuação) e cada palavra-chave casa no início de uma palavra: "pizza"
+    casa "pizzas" (plurais e flexões continuam detectados), mas não casa dentro
+    de "mussarela". Para que uma palavra mais longa (ex.: "pizzaria") não
+    conte como a palavra-chave, use "exclude" no padrão (DisguisedCallMatcher). A busca percorre o texto uma
+    única vez, independente de quantas palavras-chave existem.
+
+    Args:
+        keywords: Lista de palavras ou expressões ("pizza", "sem cebola")
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords: List[str] = []
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+
+        for keyword in keywords:
+            self._add(keyword)
+        self._build_failure_links()
+
+    def _add(self, keyword: str) -> None:
+        normalizada = normalize_transcript(keyword)
+        if not normalizada:
+            raise ValueError(f"Palavra-chave vazia após normalização: '{keyword}'")
+        keyword_id = len(self.keywords)
+        self.keywords.append(normalizada)
+
+        estado = 0
+        # Só a fronteira inicial: o fim da palavra fica livre (flexões)
+        for char in f" {normalizada}":
+            proximo = self._goto[estado].get(char)
+            if proximo is None:
+                proximo = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._goto[estado][char] = proximo
+            estado = proximo
+        self._out[estado].append(keyword_id)
+
+    def _build_failure_links(self) -> None:
+        fila = deque(self._goto[0].values())
+        while fila:
+            estado = fila.popleft()
+            for char, proximo in self._goto[estado].items():
+                fila.append(proximo)
+                falha = self._fail[estado]
+                while falha and char not in self._goto[falha]:
+                    falha = self._fail[falha]
+                destino = self._goto[falha].get(char, 0)
+                self._fail[proximo] = destino if destino != proximo else 0
+                self._out[proximo] = self._out[proximo] + self._out[self._fail[proximo]]
+
+    def find_positions(self, text: str) -> Dict[int, Set[int]]:
+        """
+        Retorna, para cada palavra-chave encontrada (índice em self.keywords),
+        as posições no texto normalizado onde ela começa.
+        """
+        encontrados: Dict[int, Set[int]] = {}
+        goto, fail, out = self._goto, self._fail, self._out
+        tamanhos = [len(keyword) for keyword in self.keywords]
+        estado = 0
+        for posicao, char in enumerate(f" {normalize_transcript(text)} "):
+            while estado and char not in goto[estado]:
+                estado = fail[estado]
+            estado = goto[estado].get(char, 0)
+            for keyword_id in out[estado]:
+                encontrados.setdefault(keyword_id, set()).add(posicao - tamanhos[keyword_id])
+        return encontrados
+
+    def find_all(self, text: str) -> Set[int]:
+        """Retorna os IDs (índices em self.keywords) das palavras-chave encontradas."""
+        return set(self.find_positions(text))
+
+
+class DisguisedCallMatcher:
+    """
+    Detecta chamadas disfarçadas: um padrão casa quando TODAS as suas
+    palavras-chave aparecem na transcrição (em qualquer ordem).
+
+    "exclude" lista palavras mais longas que começam com uma palavra-chave e
+    não devem contar como ela: com "exclude": ["pizzaria"], "pizzaria" não
+    conta como "pizza", mas "é da pizzaria? quero uma pizza..." ainda casa
+    pela outra ocorrência. O resto da transcrição não é afetado.
+
+    Args:
+        patterns: Lista de {"pattern": [palavras...], "exclude": [palavras...]
+            (opcional), "description": "..."}
+    """
+
+    def __init__(self, patterns: List[Dict[str, any]]):
+        self.patterns = patterns
+        indice_keyword: Dict[str, int] = {}
+        # Para cada palavra-chave, os padrões que dependem dela
+        self._patterns_por_keyword: List[List[int]] = []
+        # (padrão, palavra-chave) -> palavras de "exclude" que a prolongam
+        self._exclusoes: Dict[tuple, List[int]] = {}
+        self._tamanho_pattern: List[int] = []
+
+        def indice(keyword: str) -> int:
+            if keyword not in indice_keyword:
+                indice_keyword[keyword] = len(indice_keyword)
+                self._patterns_por_keyword.append([])
+            return indice_keyword[keyword]
+
+        for pattern_id, pattern in enumerate(patterns):
+            keywords = {normalize_transcript(keyword) for keyword in pattern["pattern"]}
+            self._tamanho_pattern.append(len(keywords))
+            for keyword in keywords:
+                self._patterns_por_keyword[indice(keyword)].append(pattern_id)
+            for excluida in {normalize_transcript(keyword) for keyword in pattern.get("exclude", [])}:
+                prolongadas = [keyword for keyword in keywords if excluida.startswith(keyword) and excluida != keyword]
+                if not prolongadas:
+                    raise ValueError(
+                        f"'exclude' {excluida!r} não prolonga nenhuma palavra-chave de {pattern['pattern']}"
+                    )
+                for keyword in prolongadas:
+                    self._exclusoes.setdefault((pattern_id, indice(keyword)), []).append(indice(excluida))
+
+        self.automaton = KeywordAutomaton(indice_keyword)
+
+    def match(self, transcript: str) -> Optional[Dict[str, any]]:
+        """Retorna o primeiro padrão (na ordem do arquivo) que casa, ou None."""
+        faltando: Dict[int, int] = {}
+        casados = set()
+        posicoes = self.automaton.find_positions(transcript)
+        for keyword_id, inicios in posicoes.items():
+            for pattern_id in self._patterns_por_keyword[keyword_id]:
+                # Descarta as ocorrências que são o começo de uma palavra excluída
+                validos = inicios
+                for excluida_id in self._exclusoes.get((pattern_id, keyword_id), ()):
+                    validos = validos - posicoes.get(excluida_id, set())
+                if not validos:
+                    continue
+                restante = faltando.get(pattern_id, self._tamanho_pattern[pattern_id]) - 1
+                faltando[pattern_id] = restante
+                if restante == 0:
+                    casados.add(pattern_id)
+        if not casados:
+            return None
+        return self.patterns[min(casados)]
+
+
+def load_patterns(path: str = DISGUISED_PATTERNS_PATH) -> List[Dict[str, any]]:
+    """Carrega a lista de padrões de chamada disfarçada de um arquivo JSON."""
+    with open(path, encoding="utf-8") as arquivo:
+        return json.load(arquivo)
@@ -0,0 +1,211 @@
+"""
+Fila de despacho em segundo plano
+
+Tira do caminho do webhook tudo o que é lento no fim do checklist (relatório da
+IA, espera antes da simulação e a ligação de saída pela API do Twilio).
+
+Os jobs ficam num arquivo SQLite local (DISPATCH_QUEUE_PATH), então sobrevivem a
+um restart do servidor. Cada job tem status (pending, running, done, failed),
+horário agendado (run_at) no lugar de time.sleep() e novas tentativas com
+backoff exponencial.
+"""
+import os
+import json
+import time
+import uuid
+import random
+import sqlite3
+import threading
+from contextlib import closing
+from typing import Any, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DISPATCH_QUEUE_PATH = os.getenv("DISPATCH_QUEUE_PATH", "dispatch_queue.db")
+DISPATCH_DELAY_SECONDS = float(os.getenv("DISPATCH_DELAY_SECONDS", "5"))
+DISPATCH_MAX_ATTEMPTS = int(os.getenv("DISPATCH_MAX_ATTEMPTS", "5"))
+DISPATCH_RETRY_BASE_SECONDS = float(os.getenv("DISPATCH_RETRY_BASE_SECONDS", "2"))
+DISPATCH_POLL_INTERVAL = float(os.getenv("DISPATCH_POLL_INTERVAL", "0.5"))
+# Jobs "running" há mais tempo que isso são considerados abandonados (worker caiu)
+DISPATCH_STALE_SECONDS = float(os.getenv("DISPATCH_STALE_SECONDS", "300"))
+
+
+class DispatchQueue:
+    """
+    Fila durável de jobs em SQLite.
+
+    Args:
+        path: Caminho do arquivo SQLite da fila
+    """
+
+    def __init__(self, path: str = DISPATCH_QUEUE_PATH):
+        self.path = path
+        with closing(self._connect()) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS dispatch_jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    run_at REAL NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    result TEXT,
+                    last_error TEXT
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_dispatch_jobs_status_run_at ON dispatch_jobs (status, run_at)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], delay_seconds: float = 0) -> str:
+        """
+        Agenda um job.
+
+        Args:
+            kind: Tipo do job (escolhe o handler no worker)
+            payload: Dados do job (precisam ser serializáveis em JSON)
+            delay_seconds: Atraso até o job poder ser executado
+
+        Returns:
+            ID do job
+        """
+        job_id = uuid.uuid4().hex
+        agora = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT INTO dispatch_jobs (id, kind, payload, status, run_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, 'pending', ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), agora + delay_seconds, agora, agora),
+            )
+        return job_id
+
+    def claim_next(self) -> Optional[Dict[str, Any]]:
+        """Reserva o próximo job vencido (atômico entre processos)."""
+        agora = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # Recupera jobs presos em "running" por um worker que morreu
+            conn.execute(
+                "UPDATE dispatch_jobs SET status = 'pending' WHERE status = 'running' AND updated_at < ?",
+                (agora - DISPATCH_STALE_SECONDS,),
+            )
+            row = conn.execute(
+                "SELECT * FROM dispatch_jobs WHERE status = 'pending' AND run_at <= ? ORDER BY run_at LIMIT 1",
+                (agora,),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE dispatch_jobs SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (agora, row["id"]),
+            )
+            conn.execute("COMMIT")
+            job = dict(row)
+            job["attempts"] += 1
+            job["payload"] = json.loads(job["payload"])
+            return job
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def mark_done(self, job_id: str, result: Any = None) -> None:
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE dispatch_jobs SET status = 'done', result = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(result), time.time(), job_id),
+            )
+
+    def mark_failed(self, job_id: str, payload: Dict[str, Any], error: str, retry_at: Optional[float]) -> None:
+        """Registra a falha; com retry_at o job volta para a fila, senão fica como 'failed'."""
+        status = "pending" if retry_at is not None else "failed"
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE dispatch_jobs SET status = ?, payload = ?, last_error = ?, run_at = COALESCE(?, run_at), "
+                "updated_at = ? WHERE id = ?",
+                (status, json.dumps(payload), error, retry_at, time.time(), job_id),
+            )
+
+    def get_status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Retorna o status público de um job (sem o payload)."""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT id, kind, status, attempts, run_at, created_at, updated_at, result, last_error "
+                "FROM dispatch_jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        status = dict(row)
+        status["result"] = json.loads(status["result"]) if status["result"] else None
+        return status
+
+
+class DispatchWorker(threading.Thread):
+    """
+    Thread que consome a fila e executa os handlers registrados.
+
+    O handler recebe o payload do job. Se ele alterar o payload (por exemplo,
+    guardando o relatório já gerado) e depois falhar, a próxima tentativa recebe
+    o payload alterado.
+    """
+
+    def __init__(self, queue: DispatchQueue, max_attempts: int = DISPATCH_MAX_ATTEMPTS):
+        super().__init__(name="dispatch-worker", daemon=True)
+        self.queue = queue
+        self.max_attempts = max_attempts
+        self.handlers: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+        self._parar = threading.Event()
+
+    def register(self, kind: str, handler: Callable[[Dict[str, Any]], Any]) -> None:
+        self.handlers[kind] = handler
+
+    def stop(self) -> None:
+        self._parar.set()
+
+    def run_once(self) -> bool:
+        """Executa um job vencido, se houver. Retorna True se executou algum."""
+        job = self.queue.claim_next()
+        if job is None:
+            return False
+
+        handler = self.handlers.get(job["kind"])
+        try:
+            if handler is None:
+                raise LookupError(f"Nenhum handler registrado para '{job['kind']}'")
+            resultado = handler(job["payload"])
+            self.queue.mark_done(job["id"], resultado)
+            print(f"[Despacho] Job {job['id']} ({job['kind']}) concluído")
+        except Exception as e:
+            if job["attempts"] < self.max_attempts:
+                espera = DISPATCH_RETRY_BASE_SECONDS * (2 ** (job["attempts"] - 1))
+                espera += random.uniform(0, espera / 2)
+                retry_at = time.time() + espera
+                print(f"[Despacho] Job {job['id']} falhou (tentativa {job['attempts']}), nova tentativa em {espera:.1f}s: {e}")
+            else:
+                retry_at = None
+                print(f"[Despacho] Job {job['id']} falhou definitivamente após {job['attempts']} tentativas: {e}")
+            self.queue.mark_failed(job["id"], job["payload"], str(e), retry_at)
+        return True
+
+    def run(self) -> None:
+        while not self._parar.is_set():
+            try:
+                if not self.run_once():
+                    self._parar.wait(DISPATCH_POLL_INTERVAL)
+            except Exception as e:
+                print(f"[Despacho] Erro no worker: {e}")
+                self._parar.wait(DISPATCH_POLL_INTERVAL)
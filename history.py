@@ -0,0 +1,128 @@
+"""
+Histórico de chamadas com paginação por cursor (keyset)
+
+Em vez de OFFSET (que lê e descarta todas as linhas das páginas anteriores),
+cada página continua a partir do último (timestamp, id) da página anterior.
+Com os índices compostos de `calls` ((category, timestamp, id),
+(region, timestamp, id) e (timestamp, id)), a página 1000 custa o mesmo que
+a primeira.
+
+Por padrão só as colunas curtas são lidas; transcript e reasoning (TEXT) só
+vêm com include_text=True; os registros de meses arquivados têm o texto
+reidratado do arquivo frio (call_archive.py).
+"""
+import asyncio
+import base64
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import select, tuple_
+
+from call_archive import rehydrate
+from database import Call
+
+HISTORY_DEFAULT_LIMIT = 50
+HISTORY_MAX_LIMIT = 200
+
+# Colunas da projeção leve (sem os campos TEXT)
+LIGHT_COLUMNS = [Call.id, Call.timestamp, Call.category, Call.confidence, Call.urgency_level, Call.region]
+TEXT_COLUMNS = [Call.transcript, Call.reasoning]
+
+
+def encode_cursor(timestamp: datetime, call_id: str) -> str:
+    """
+    Cursor opaco com o (timestamp, id) da última linha da página.
+    ValueError se o timestamp for None (sem posição na ordenação).
+    """
+    if timestamp is None:
+        raise ValueError(f"Chamada {call_id} sem timestamp não pode virar cursor")
+    bruto = f"{timestamp.isoformat()}|{call_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(bruto).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Lê um cursor gerado por encode_cursor. ValueError se for inválido."""
+    try:
+        timestamp, call_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+        return datetime.fromisoformat(timestamp), call_id
+    except Exception:
+        raise ValueError("Cursor inválido")
+
+
+def build_history_query(
+    category: Optional[str] = None,
+    region: Optional[str] = None,
+    urgency_level: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = HISTORY_DEFAULT_LIMIT,
+    include_text: bool = False,
+):
+    """
+    Monta o SELECT de uma página do histórico (mais recentes primeiro).
+
+    Busca limit + 1 linhas para saber se existe próxima página.
+    """
+    colunas = LIGHT_COLUMNS + (TEXT_COLUMNS if include_text else [])
+    # calls.timestamp é NOT NULL; tabelas antigas (anteriores a
+    # migrate_to_partitioned) ainda podem ter NULL, e essas linhas não têm
+    # posição no keyset (timestamp, id)
+    query = select(*colunas).where(Call.timestamp.isnot(None))
+    if category is not None:
+        query = query.where(Call.category == category)
+    if region is not None:
+        query = query.where(Call.region == region)
+    if urgency_level is not None:
+        query = query.where(Call.urgency_level == urgency_level)
+    if cursor is not None:
+        timestamp, call_id = decode_cursor(cursor)
+        query = query.where(tuple_(Call.timestamp, Call.id) < tuple_(timestamp, call_id))
+    return query.order_by(Call.timestamp.desc(), Call.id.desc()).limit(limit + 1)
+
+
+def _montar_pagina(rows, limit: int) -> Dict[str, Any]:
+    proximo = None
+    if len(rows) > limit:
+        ultimo = rows[limit - 1]
+        proximo = encode_cursor(ultimo.timestamp, ultimo.id)
+    return {"items": [dict(row._mapping) for row in rows[:limit]], "next_cursor": proximo}
+
+
+def _formatar_pagina(pagina: Dict[str, Any]) -> Dict[str, Any]:
+    for item in pagina["items"]:
+        item["timestamp"] = item["timestamp"].isoformat() if item["timestamp"] else None
+    return pagina
+
+
+def _limitar(limit: int) -> int:
+    return max(1, min(limit, HISTORY_MAX_LIMIT))
+
+
+def fetch_history(db, limit: int = HISTORY_DEFAULT_LIMIT, **filtros) -> Dict[str, Any]:
+    """
+    Uma página do histórico usando uma Session síncrona.
+
+    Args:
+        db: Session do SQLAlchemy
+        limit: Itens por página (máximo HISTORY_MAX_LIMIT)
+        **filtros: category, region, urgency_level, cursor, include_text
+
+    Returns:
+        Dict com items e next_cursor (None na última página)
+    """
+    limit = _limitar(limit)
+    rows = db.execute(build_history_query(limit=limit, **filtros)).all()
+    pagina = _montar_pagina(rows, limit)
+    if filtros.get("include_text"):
+        rehydrate(pagina["items"])
+    return _formatar_pagina(pagina)
+
+
+async def fetch_history_async(db, limit: int = HISTORY_DEFAULT_LIMIT, **filtros) -> Dict[str, Any]:
+    """Como fetch_history, usando uma AsyncSession."""
+    limit = _limitar(limit)
+    rows = (await db.execute(build_history_query(limit=limit, **filtros))).all()
+    pagina = _montar_pagina(rows, limit)
+    if filtros.get("include_text"):
+        # Pode descompactar um mês do arquivo: fora do event loop
+        await asyncio.to_thread(rehydrate, pagina["items"])
+    return _formatar_pagina(pagina)
@@ -0,0 +1,163 @@
+"""
+Feed ao vivo das chamadas para o dashboard (Server-Sent Events)
+
+Em vez de cada dashboard fazer poll em /stats, o navegador abre uma conexão
+em GET /stream/calls e recebe cada chamada gravada e o incremento das
+estatísticas assim que o lote é commitado.
+
+Cada evento é serializado uma única vez e colocado na fila de todos os
+assinantes. As filas são limitadas (LIVE_FEED_CLIENT_BUFFER): um cliente lento
+perde os eventos mais antigos e recebe um evento "lagged" dizendo quantos
+perdeu, sem segurar os demais nem a gravação.
+
+Na reconexão, o EventSource do navegador manda o cabeçalho Last-Event-ID e o
+hub reenvia o que ainda estiver no buffer de replay (LIVE_FEED_REPLAY).
+"""
+import os
+import json
+import asyncio
+import threading
+from collections import Counter, deque
+from datetime import datetime
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+from stats_rollup import DIMENSIONS
+
+load_dotenv()
+
+LIVE_FEED_CLIENT_BUFFER = int(os.getenv("LIVE_FEED_CLIENT_BUFFER", "256"))
+LIVE_FEED_REPLAY = int(os.getenv("LIVE_FEED_REPLAY", "200"))
+LIVE_FEED_MAX_CLIENTS = int(os.getenv("LIVE_FEED_MAX_CLIENTS", "1000"))
+# Comentário SSE periódico para proxies não fecharem a conexão ociosa
+LIVE_FEED_KEEPALIVE_SECONDS = float(os.getenv("LIVE_FEED_KEEPALIVE_SECONDS", "15"))
+
+# Colunas enviadas no evento "call" (sem transcript/reasoning)
+CALL_EVENT_FIELDS = ["id", "timestamp", "category", "confidence", "urgency_level", "region"]
+
+
+def _sse(seq: Optional[int], evento: str, dados: Dict[str, Any]) -> bytes:
+    corpo = json.dumps(dados, ensure_ascii=False, default=str)
+    # Sem id, o evento não altera o Last-Event-ID do cliente
+    prefixo = f"id: {seq}\n" if seq is not None else ""
+    return f"{prefixo}event: {evento}\ndata: {corpo}\n\n".encode("utf-8")
+
+
+def _evento_chamada(call_data: Dict[str, Any]) -> Dict[str, Any]:
+    dados = {campo: call_data.get(campo) for campo in CALL_EVENT_FIELDS}
+    if isinstance(dados["timestamp"], datetime):
+        dados["timestamp"] = dados["timestamp"].isoformat()
+    return dados
+
+
+def stats_delta(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Incremento das estatísticas causado por um lote de chamadas."""
+    delta: Dict[str, Any] = {"total": len(rows)}
+    for dimension in DIMENSIONS:
+        delta[dimension] = dict(Counter(row.get(dimension) or "não informado" for row in rows))
+    return delta
+
+
+class _Subscriber:
+    def __init__(self, buffer_size: int):
+        self.fila: "asyncio.Queue[bytes]" = asyncio.Queue(maxsize=buffer_size)
+        self.perdidos = 0
+
+
+class LiveFeedHub:
+    """
+    Distribui eventos para os assinantes do feed.
+
+    publish roda no event loop; publish_calls_threadsafe pode ser chamado de
+    qualquer thread (é o listener do call_writer).
+    """
+
+    def __init__(
+        self,
+        buffer_size: int = LIVE_FEED_CLIENT_BUFFER,
+        replay_size: int = LIVE_FEED_REPLAY,
+        max_clients: int = LIVE_FEED_MAX_CLIENTS,
+    ):
+        self.buffer_size = buffer_size
+        self.max_clients = max_clients
+        self._assinantes: Set[_Subscriber] = set()
+        self._replay: Deque[Tuple[int, bytes]] = deque(maxlen=replay_size)
+        self._seq = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+        self.stats = {"published": 0, "dropped": 0, "clients": 0}
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Define o event loop onde os eventos de outras threads são entregues."""
+        with self._loop_lock:
+            self._loop = loop
+
+    def publish(self, evento: str, dados: Dict[str, Any]) -> None:
+        """Serializa o evento uma vez e coloca na fila de cada assinante."""
+        self._seq += 1
+        mensagem = _sse(self._seq, evento, dados)
+        self._replay.append((self._seq, mensagem))
+        self.stats["published"] += 1
+        for assinante in self._assinantes:
+            self._entregar(assinante, mensagem)
+
+    def _entregar(self, assinante: _Subscriber, mensagem: bytes) -> None:
+        if assinante.fila.full():
+            # Cliente lento: descarta o evento mais antigo dele
+            assinante.fila.get_nowait()
+            assinante.perdidos += 1
+            self.stats["dropped"] += 1
+        assinante.fila.put_nowait(mensagem)
+
+    def publish_calls(self, rows: List[Dict[str, Any]]) -> None:
+        """Publica as chamadas de um lote gravado e o incremento das estatísticas."""
+        if not rows:
+            return
+        for row in rows:
+            self.publish("call", _evento_chamada(row))
+        self.publish("stats", stats_delta(rows))
+
+    def publish_calls_threadsafe(self, rows: List[Dict[str, Any]]) -> None:
+        """Como publish_calls, chamado de fora do event loop (thread de gravação)."""
+        with self._loop_lock:
+            loop = self._loop
+        if loop is None or loop.is_closed() or not rows:
+            return
+        loop.call_soon_threadsafe(self.publish_calls, list(rows))
+
+    async def subscribe(self, last_event_id: Optional[int] = None) -> AsyncIterator[bytes]:
+        """
+        Gera as mensagens SSE para um cliente até ele desconectar.
+
+        Args:
+            last_event_id: Último evento recebido antes de uma reconexão
+        """
+        if len(self._assinantes) >= self.max_clients:
+            raise RuntimeError("Limite de clientes do feed atingido")
+        assinante = _Subscriber(self.buffer_size)
+        if last_event_id is not None:
+            for seq, mensagem in self._replay:
+                if seq > last_event_id:
+                    self._entregar(assinante, mensagem)
+        self._assinantes.add(assinante)
+        self.stats["clients"] = len(self._assinantes)
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                try:
+                    mensagem = await asyncio.wait_for(assinante.fila.get(), LIVE_FEED_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                if assinante.perdidos:
+                    yield _sse(None, "lagged", {"dropped": assinante.perdidos})
+                    assinante.perdidos = 0
+                yield mensagem
+        finally:
+            self._assinantes.discard(assinante)
+            self.stats["clients"] = len(self._assinantes)
+
+
+# Instância compartilhada pelo app_painel.py
+live_feed = LiveFeedHub()
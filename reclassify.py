@@ -0,0 +1,329 @@
+"""
+Reclassificação das chamadas já gravadas (backfill)
+
+Quando o prompt ou o modelo de classify_emergency_call mudam, ou entra um
+classificador de urgência novo, as linhas antigas de `calls` continuam com
+category, confidence e urgency_level desatualizados. Este job percorre a
+tabela e reclassifica tudo:
+
+- lê `calls` em páginas de RECLASSIFY_BATCH_SIZE linhas por keyset no id
+  (WHERE id > último ORDER BY id LIMIT n), com cursor no servidor: a memória
+  fica limitada a uma página e nenhuma transação fica aberta entre páginas;
+- classifica cada página com RECLASSIFY_WORKERS classificações simultâneas,
+  no máximo RECLASSIFY_RATE_PER_SEC por segundo; transcrições repetidas na
+  mesma página são classificadas uma vez só;
+- grava só as linhas que mudaram, num UPDATE em lote por página, com o
+  ajuste dos rollups do dashboard na mesma transação curta;
+- salva o último id processado em RECLASSIFY_CHECKPOINT_PATH depois de cada
+  página: interrompido (Ctrl+C, queda), o job continua de onde parou.
+
+O cache persistente e o classificador local (treinado com os rótulos
+antigos) ficam desligados durante o job.
+
+Linhas arquivadas (call_archive.py) são reclassificadas a partir do arquivo
+frio; o reasoning novo não volta para o banco. Quando a OpenAI não responde,
+a linha fica como está e entra na contagem de falhas.
+
+    python reclassify.py run [categoria]   # começa ou continua (opcional: só uma categoria)
+    python reclassify.py status            # progresso do checkpoint
+    python reclassify.py reset             # apaga o checkpoint (a próxima execução recomeça)
+
+Com RECLASSIFY_DRY_RUN=1 só mostra quantas linhas mudariam, sem gravar.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+# Carrega variáveis de ambiente
+load_dotenv()
+
+# O cache persistente guarda respostas do prompt antigo e o classificador
+# local foi treinado com os rótulos antigos: durante o job o cache fica só em
+# memória (começa vazio) e toda classificação passa pelo modelo novo
+os.environ["CLASSIFIER_CACHE_PATH"] = ""
+os.environ["LOCAL_CLASSIFIER_ENABLED"] = "0"
+
+from sqlalchemy import bindparam, select, update
+
+from batch_classify import classify_transcript
+from call_archive import rehydrate
+from classifiers.normalization import normalize_transcript
+from database import engine, Call
+from stats_rollup import apply_rollup_change
+
+RECLASSIFY_BATCH_SIZE = int(os.getenv("RECLASSIFY_BATCH_SIZE", "200"))
+RECLASSIFY_WORKERS = int(os.getenv("RECLASSIFY_WORKERS", "4"))
+# Classificações iniciadas por segundo (0 = sem limite)
+RECLASSIFY_RATE_PER_SEC = float(os.getenv("RECLASSIFY_RATE_PER_SEC", "5"))
+RECLASSIFY_CHECKPOINT_PATH = os.getenv("RECLASSIFY_CHECKPOINT_PATH", "reclassify_checkpoint.json")
+RECLASSIFY_COMBINED = os.getenv("RECLASSIFY_COMBINED", os.getenv("COMBINED_CLASSIFICATION", "0")) == "1"
+RECLASSIFY_DRY_RUN = os.getenv("RECLASSIFY_DRY_RUN", "0") == "1"
+
+COLUNAS = [Call.id, Call.timestamp, Call.transcript, Call.category, Call.confidence,
+           Call.urgency_level, Call.reasoning, Call.region]
+CAMPOS_ATUALIZADOS = ["category", "confidence", "urgency_level", "reasoning"]
+
+
+class RateLimiter:
+    """Espaça o início das classificações para no máximo `rate` por segundo."""
+
+    def __init__(self, rate: float):
+        self.intervalo = 1.0 / rate if rate > 0 else 0.0
+        self._proximo = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        if not self.intervalo:
+            return
+        async with self._lock:
+            agora = time.monotonic()
+            espera = self._proximo - agora
+            self._proximo = max(agora, self._proximo) + self.intervalo
+        if espera > 0:
+            await asyncio.sleep(espera)
+
+
+# ============================================================================
+# Checkpoint
+# ============================================================================
+
+def load_checkpoint(path: str = RECLASSIFY_CHECKPOINT_PATH) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as arquivo:
+        return json.load(arquivo)
+
+
+def save_checkpoint(checkpoint: Dict[str, Any], path: str = RECLASSIFY_CHECKPOINT_PATH) -> None:
+    """Grava num arquivo temporário e só então substitui o anterior."""
+    checkpoint["updated_at"] = datetime.now().isoformat(timespec="seconds")
+    temporario = path + ".tmp"
+    with open(temporario, "w", encoding="utf-8") as arquivo:
+        json.dump(checkpoint, arquivo, ensure_ascii=False, indent=2)
+        arquivo.flush()
+        os.fsync(arquivo.fileno())
+    os.replace(temporario, path)
+
+
+def _novo_checkpoint(category: Optional[str], combined: bool) -> Dict[str, Any]:
+    return {
+        "last_id": None,
+        "category": category,
+        "mode": "combined" if combined else "sequential",
+        "finished": False,
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "stats": {"read": 0, "updated": 0, "unchanged": 0, "failed": 0, "skipped": 0},
+    }
+
+
+# ============================================================================
+# Leitura, classificação e gravação de uma página
+# ============================================================================
+
+def read_page(after_id: Optional[str], limit: int, category: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Próximas `limit` chamadas com id maior que `after_id`, em ordem de id."""
+    consulta = select(*COLUNAS).order_by(Call.id).limit(limit)
+    if after_id is not None:
+        consulta = consulta.where(Call.id > after_id)
+    if category:
+        consulta = consulta.where(Call.category == category)
+    with engine.connect() as conn:
+        resultado = conn.execution_options(stream_results=True, yield_per=limit).execute(consulta)
+        return [dict(row._mapping) for row in resultado]
+
+
+def _falhou(classification: Dict[str, Any]) -> bool:
+    # Resultado de erro do classificador (OpenAI indisponível): não sobrescreve
+    return classification.get("confidence") == 0 and \
+        str(classification.get("reasoning", "")).startswith("Erro no processamento")
+
+
+async def classify_page(
+    linhas: List[Dict[str, Any]],
+    combined: bool,
+    limitador: RateLimiter,
+    workers: int,
+) -> Dict[str, Any]:
+    """
+    Reclassifica as linhas da página.
+
+    Returns:
+        Dict com "changes" (lista de (antiga, nova) só das linhas que mudaram),
+        "unchanged", "failed" e "skipped" (sem transcrição)
+    """
+    resumo: Dict[str, Any] = {"changes": [], "unchanged": 0, "failed": 0, "skipped": 0}
+
+    # Linhas arquivadas: transcript e reasoning voltam do arquivo frio
+    arquivadas = {linha["id"] for linha in linhas if linha["transcript"] is None and linha["reasoning"] is None}
+    if arquivadas:
+        await asyncio.to_thread(rehydrate, linhas)
+
+    grupos: Dict[str, List[Dict[str, Any]]] = {}
+    for linha in linhas:
+        if not (linha["transcript"] or "").strip():
+            resumo["skipped"] += 1
+            continue
+        grupos.setdefault(normalize_transcript(linha["transcript"]) or linha["transcript"], []).append(linha)
+
+    limite = asyncio.Semaphore(max(1, workers))
+
+    async def classificar(mesmas: List[Dict[str, Any]]) -> None:
+        async with limite:
+            await limitador.wait()
+            try:
+                classification, urgency_data = await classify_transcript(mesmas[0]["transcript"], combined)
+            except Exception as e:
+                print(f"[Reclassificação] Erro em {mesmas[0]['id']}: {e}")
+                classification, urgency_data = None, None
+        for linha in mesmas:
+            if classification is None or _falhou(classification):
+                resumo["failed"] += 1
+                continue
+            nova = {
+                **linha,
+                "category": classification["category"],
+                "confidence": classification["confidence"],
+                "urgency_level": urgency_data["urgency_level"] if urgency_data else None,
+                "reasoning": None if linha["id"] in arquivadas else classification["reasoning"],
+            }
+            antiga = dict(linha, reasoning=None) if linha["id"] in arquivadas else linha
+            if all(nova[campo] == antiga[campo] for campo in ("category", "confidence", "urgency_level")):
+                resumo["unchanged"] += 1
+            else:
+                resumo["changes"].append((antiga, nova))
+
+    await asyncio.gather(*(classificar(mesmas) for mesmas in grupos.values()))
+    return resumo
+
+
+def write_changes(mudancas: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> None:
+    """UPDATE em lote das linhas alteradas + ajuste dos rollups, numa transação curta."""
+    if not mudancas:
+        return
+    tabela = Call.__table__
+    valores = {campo: bindparam(f"novo_{campo}") for campo in CAMPOS_ATUALIZADOS}
+    com_timestamp = [nova for _, nova in mudancas if nova["timestamp"] is not None]
+    sem_timestamp = [nova for _, nova in mudancas if nova["timestamp"] is None]
+
+    def parametros(linhas):
+        return [
+            {"chave_id": linha["id"], "chave_timestamp": linha["timestamp"],
+             **{f"novo_{campo}": linha[campo] for campo in CAMPOS_ATUALIZADOS}}
+            for linha in linhas
+        ]
+
+    with engine.begin() as conn:
+        # O timestamp no WHERE limita a busca à partição do mês (call_archive.py)
+        if com_timestamp:
+            conn.execute(
+                update(tabela)
+                .where(tabela.c.id == bindparam("chave_id"))
+                .where(tabela.c.timestamp == bindparam("chave_timestamp"))
+                .values(**valores),
+                parametros(com_timestamp),
+            )
+        if sem_timestamp:
+            conn.execute(
+                update(tabela).where(tabela.c.id == bindparam("chave_id")).values(**valores),
+                parametros(sem_timestamp),
+            )
+        apply_rollup_change([antiga for antiga, _ in mudancas], [nova for _, nova in mudancas], conn)
+
+
+# ============================================================================
+# Job
+# ============================================================================
+
+async def run_reclassification(
+    category: Optional[str] = None,
+    combined: bool = RECLASSIFY_COMBINED,
+    batch_size: int = RECLASSIFY_BATCH_SIZE,
+    workers: int = RECLASSIFY_WORKERS,
+    rate_per_sec: float = RECLASSIFY_RATE_PER_SEC,
+    dry_run: bool = RECLASSIFY_DRY_RUN,
+    checkpoint_path: str = RECLASSIFY_CHECKPOINT_PATH,
+) -> Dict[str, Any]:
+    """
+    Reclassifica `calls` (ou só uma categoria), continuando do checkpoint.
+
+    Returns:
+        O checkpoint final (com as contagens em "stats")
+    """
+    checkpoint = load_checkpoint(checkpoint_path)
+    if checkpoint is not None and checkpoint.get("category") != category:
+        raise ValueError(
+            f"O checkpoint é da categoria '{checkpoint.get('category') or 'todas'}'; "
+            f"rode 'python reclassify.py reset' para recomeçar com outro filtro"
+        )
+    if checkpoint is None or dry_run:
+        checkpoint = _novo_checkpoint(category, combined)
+    if checkpoint["finished"]:
+        print("[Reclassificação] Já concluída; rode 'python reclassify.py reset' para recomeçar")
+        return checkpoint
+
+    limitador = RateLimiter(rate_per_sec)
+    stats = checkpoint["stats"]
+    inicio = time.perf_counter()
+    lidas_antes = stats["read"]
+    if checkpoint["last_id"]:
+        print(f"[Reclassificação] Continuando depois de {checkpoint['last_id']} ({stats['read']} já lidas)")
+
+    while True:
+        linhas = await asyncio.to_thread(read_page, checkpoint["last_id"], batch_size, category)
+        if not linhas:
+            break
+        pagina = await classify_page(linhas, combined, limitador, workers)
+        if not dry_run:
+            await asyncio.to_thread(write_changes, pagina["changes"])
+
+        checkpoint["last_id"] = linhas[-1]["id"]
+        stats["read"] += len(linhas)
+        stats["updated"] += len(pagina["changes"])
+        for campo in ("unchanged", "failed", "skipped"):
+            stats[campo] += pagina[campo]
+        if not dry_run:
+            save_checkpoint(checkpoint, checkpoint_path)
+
+        segundos = time.perf_counter() - inicio
+        print(f"[Reclassificação] {stats['read']} lidas, {stats['updated']} alteradas, "
+              f"{stats['failed']} falhas ({(stats['read'] - lidas_antes) / segundos:.1f} linhas/s)")
+
+    checkpoint["finished"] = True
+    if not dry_run:
+        save_checkpoint(checkpoint, checkpoint_path)
+    return checkpoint
+
+
+if __name__ == "__main__":
+    comando = sys.argv[1] if len(sys.argv) > 1 else ""
+    if comando == "run":
+        categoria = sys.argv[2] if len(sys.argv) > 2 else None
+        try:
+            final = asyncio.run(run_reclassification(categoria))
+        except ValueError as e:
+            print(f"[Reclassificação] {e}")
+            sys.exit(1)
+        except KeyboardInterrupt:
+            print(f"\n[Reclassificação] Interrompida; o progresso está em {RECLASSIFY_CHECKPOINT_PATH}")
+            sys.exit(130)
+        modo = " (simulação, nada gravado)" if RECLASSIFY_DRY_RUN else ""
+        print(f"[Reclassificação] Fim{modo}: {json.dumps(final['stats'], ensure_ascii=False)}")
+    elif comando == "status":
+        checkpoint = load_checkpoint()
+        if checkpoint is None:
+            print("[Reclassificação] Nenhum checkpoint")
+        else:
+            print(json.dumps(checkpoint, ensure_ascii=False, indent=2))
+    elif comando == "reset":
+        if os.path.exists(RECLASSIFY_CHECKPOINT_PATH):
+            os.remove(RECLASSIFY_CHECKPOINT_PATH)
+        print("[Reclassificação] Checkpoint apagado")
+    else:
+        print("Uso: python reclassify.py run [categoria]|status|reset")
+        sys.exit(1)
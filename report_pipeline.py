@@ -0,0 +1,158 @@
+"""
+Relatório incremental de despacho
+
+Em vez de gerar o relatório inteiro só depois da última resposta, cada passo
+do checklist dispara (em segundo plano) uma atualização do rascunho guardado na
+sessão da chamada. No fim, o relatório é o próprio rascunho (se já cobre todas
+as respostas) ou uma atualização pequena com o que faltou.
+"""
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+from dotenv import load_dotenv
+
+from call_session import CallSession
+from classifiers.gerar_relatorio_conciso_ia import (
+    gerar_relatorio_conciso_ia,
+    atualizar_relatorio_conciso_ia,
+    gerar_relatorio_conciso_ia_stream,
+    atualizar_relatorio_conciso_ia_stream,
+    split_sentences,
+)
+from tracing import span
+
+load_dotenv()
+
+REPORT_DRAFT_WORKERS = int(os.getenv("REPORT_DRAFT_WORKERS", "4"))
+# Categorias cujo relatório é usado no fim do checklist (as outras não geram rascunho)
+REPORT_DRAFT_CATEGORIES = set(os.getenv("REPORT_DRAFT_CATEGORIES", "samu").split(","))
+# Quanto o relatório final espera por uma atualização de rascunho em andamento
+REPORT_DRAFT_WAIT_SECONDS = float(os.getenv("REPORT_DRAFT_WAIT_SECONDS", "3"))
+
+
+class IncrementalReportBuilder:
+    """
+    Mantém o rascunho do relatório de cada chamada na sessão (chave "rascunho",
+    com o texto e quantas respostas ele cobre).
+
+    Args:
+        sessoes: Store de sessões de chamada
+        max_workers: Threads para as atualizações em segundo plano
+    """
+
+    def __init__(self, sessoes: CallSession, max_workers: int = REPORT_DRAFT_WORKERS):
+        self.sessoes = sessoes
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="report-draft")
+        self._lock = threading.Lock()
+        # Atualização em andamento por CallSid e se chegou resposta nova enquanto ela rodava
+        self._em_andamento: Dict[str, Future] = {}
+        self._pendente: Dict[str, str] = {}
+
+    def schedule_update(self, call_sid: str, categoria: str) -> None:
+        """
+        Agenda a atualização do rascunho depois de uma nova resposta.
+
+        Se já houver uma atualização rodando para a chamada, só marca que falta
+        incorporar mais respostas; ao terminar, ela roda de novo uma única vez.
+        """
+        if categoria not in REPORT_DRAFT_CATEGORIES:
+            return
+        with self._lock:
+            if call_sid in self._em_andamento:
+                self._pendente[call_sid] = categoria
+                return
+            self._em_andamento[call_sid] = self._executor.submit(self._atualizar, call_sid, categoria)
+
+    def _atualizar(self, call_sid: str, categoria: str) -> None:
+        while True:
+            try:
+                self._atualizar_rascunho(call_sid, categoria)
+            except Exception as e:
+                print(f"[{call_sid}] Erro ao atualizar rascunho do relatório: {e}")
+            with self._lock:
+                categoria = self._pendente.pop(call_sid, None)
+                if categoria is None:
+                    self._em_andamento.pop(call_sid, None)
+                    return
+
+    def _atualizar_rascunho(self, call_sid: str, categoria: str) -> None:
+        dados = self.sessoes.get(call_sid)
+        respostas = dados["respostas"]
+        with span("relatorio_rascunho", call_sid):
+            texto = _relatorio_a_partir_do_rascunho(dados.get("rascunho"), respostas, categoria)
+        if texto is None:
+            return
+
+        def salvar(dados_atuais: Dict) -> None:
+            # Não sobrescreve um rascunho que já cobre mais respostas
+            if dados_atuais.get("rascunho", {}).get("respostas_cobertas", 0) < len(respostas):
+                dados_atuais["rascunho"] = {"texto": texto, "respostas_cobertas": len(respostas)}
+
+        self.sessoes.update(call_sid, salvar)
+        print(f"[{call_sid}] Rascunho do relatório atualizado ({len(respostas)} respostas)")
+
+    def finalize(self, call_sid: str, categoria: str, respostas: Optional[List[str]] = None) -> str:
+        """
+        Retorna o relatório final da chamada.
+
+        Espera (até REPORT_DRAFT_WAIT_SECONDS) uma atualização em andamento
+        neste processo e reaproveita o rascunho; só gera o que faltar.
+
+        Args:
+            call_sid: CallSid da chamada
+            categoria: Categoria da emergência
+            respostas: Respostas completas (se None, usa as da sessão)
+        """
+        rascunho, respostas = self._rascunho_final(call_sid, respostas)
+        texto = _relatorio_a_partir_do_rascunho(rascunho, respostas, categoria)
+        if texto is None:
+            print(f"[{call_sid}] Relatório final reaproveitado do rascunho")
+            return rascunho["texto"]
+        return texto
+
+    def finalize_stream(self, call_sid: str, categoria: str, respostas: Optional[List[str]] = None) -> Iterator[str]:
+        """
+        Como finalize, mas devolve o relatório frase a frase. Se o rascunho já
+        cobre tudo, as frases saem na hora; senão vêm do streaming da IA.
+        """
+        rascunho, respostas = self._rascunho_final(call_sid, respostas)
+        if not rascunho:
+            return gerar_relatorio_conciso_ia_stream(respostas, categoria)
+        if rascunho["respostas_cobertas"] >= len(respostas):
+            print(f"[{call_sid}] Relatório final reaproveitado do rascunho")
+            return iter(split_sentences(rascunho["texto"]))
+        return atualizar_relatorio_conciso_ia_stream(
+            rascunho["texto"], respostas[rascunho["respostas_cobertas"]:], categoria
+        )
+
+    def _rascunho_final(self, call_sid: str, respostas: Optional[List[str]]):
+        """Espera a atualização em andamento e retorna (rascunho, respostas)."""
+        with self._lock:
+            em_andamento = self._em_andamento.get(call_sid)
+        if em_andamento is not None:
+            try:
+                em_andamento.result(timeout=REPORT_DRAFT_WAIT_SECONDS)
+            except Exception:
+                pass
+
+        dados = self.sessoes.get(call_sid)
+        if respostas is None:
+            respostas = dados["respostas"]
+        return dados.get("rascunho"), respostas
+
+
+def _relatorio_a_partir_do_rascunho(rascunho: Optional[Dict], respostas: List[str], categoria: str) -> Optional[str]:
+    """
+    Gera o relatório para `respostas` partindo do rascunho.
+
+    Returns:
+        O texto novo, ou None se o rascunho já cobre todas as respostas
+    """
+    if not rascunho:
+        return gerar_relatorio_conciso_ia(respostas, categoria)
+    cobertas = rascunho["respostas_cobertas"]
+    if cobertas >= len(respostas):
+        return None
+    return atualizar_relatorio_conciso_ia(rascunho["texto"], respostas[cobertas:], categoria)
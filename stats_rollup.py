@@ -0,0 +1,249 @@
+"""
+Rollups de estatísticas do dashboard
+
+Em vez de agregar a tabela `calls` a cada poll, mantemos contadores na tabela
+`call_stats`, atualizados na mesma transação do insert de cada chamada:
+total, por categoria, por nível de urgência e por região, cada um acumulado
+("all") e por janela de tempo (minuto, hora e dia).
+
+O custo de ler as estatísticas depende só do número de categorias/regiões e
+das janelas retidas, não do número de chamadas guardadas.
+
+Recalcular tudo a partir de `calls` (por exemplo, depois de uma migração):
+
+    python stats_rollup.py rebuild
+
+Apagar janelas de minuto/hora antigas:
+
+    python stats_rollup.py prune
+"""
+import os
+import sys
+import time
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List
+
+from dotenv import load_dotenv
+from sqlalchemy import delete, insert, select, text
+
+from database import SessionLocal, engine, init_db, Call, CallStat
+
+load_dotenv()
+
+# Quanto tempo as janelas de minuto e de hora ficam guardadas
+STATS_MINUTE_RETENTION_HOURS = int(os.getenv("STATS_MINUTE_RETENTION_HOURS", "48"))
+STATS_HOUR_RETENTION_DAYS = int(os.getenv("STATS_HOUR_RETENTION_DAYS", "30"))
+# Janelas devolvidas por get_stats (últimos N minutos/horas/dias)
+STATS_RECENT_MINUTES = int(os.getenv("STATS_RECENT_MINUTES", "60"))
+STATS_RECENT_HOURS = int(os.getenv("STATS_RECENT_HOURS", "24"))
+STATS_RECENT_DAYS = int(os.getenv("STATS_RECENT_DAYS", "30"))
+# Vários dashboards fazendo poll ao mesmo tempo compartilham a mesma leitura
+STATS_CACHE_SECONDS = float(os.getenv("STATS_CACHE_SECONDS", "1"))
+
+DIMENSIONS = ["category", "urgency_level", "region"]
+GRANULARITIES = ["minute", "hour", "day"]
+# bucket_start das contagens acumuladas
+ALL_TIME = datetime(1970, 1, 1)
+
+
+def _bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    if granularity == "minute":
+        return timestamp.replace(second=0, microsecond=0)
+    if granularity == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def rollup_deltas(rows: Iterable[Dict[str, Any]]) -> Counter:
+    """
+    Incrementos de contador para um conjunto de chamadas.
+
+    Returns:
+        Counter de (dimension, key, granularity, bucket_start) -> quantidade
+    """
+    deltas: Counter = Counter()
+    for row in rows:
+        timestamp = row.get("timestamp") or datetime.now()
+        chaves = [("total", "")] + [(dimension, row.get(dimension) or "") for dimension in DIMENSIONS]
+        for dimension, key in chaves:
+            deltas[(dimension, key, "all", ALL_TIME)] += 1
+            for granularity in GRANULARITIES:
+                deltas[(dimension, key, granularity, _bucket_start(timestamp, granularity))] += 1
+    return deltas
+
+
+def _upsert(connection, deltas: Counter, replace: bool = False) -> None:
+    """Soma (ou substitui, com replace=True) os contadores na tabela call_stats."""
+    if not deltas:
+        return
+    valores = [
+        {"dimension": d, "key": k, "granularity": g, "bucket_start": b, "count": n}
+        for (d, k, g, b), n in deltas.items()
+    ]
+    tabela = CallStat.__table__
+    dialeto = connection.dialect.name
+    if dialeto == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialeto == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        # Sem upsert: só é usado no rebuild (tabela vazia)
+        connection.execute(insert(tabela), valores)
+        return
+
+    # Lotes para não passar do limite de parâmetros por statement
+    for inicio in range(0, len(valores), 1000):
+        stmt = dialect_insert(tabela).values(valores[inicio:inicio + 1000])
+        novo_valor = stmt.excluded.count if replace else tabela.c.count + stmt.excluded.count
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["dimension", "key", "granularity", "bucket_start"],
+            set_={"count": novo_valor},
+        )
+        connection.execute(stmt)
+
+
+def apply_rollup(rows: List[Dict[str, Any]], connection) -> None:
+    """
+    Atualiza os contadores com chamadas recém-inseridas. Deve rodar na mesma
+    transação do insert, para os contadores nunca divergirem da tabela.
+    """
+    _upsert(connection, rollup_deltas(rows))
+    _cache["expira_em"] = 0.0
+
+
+def apply_rollup_change(old_rows: List[Dict[str, Any]], new_rows: List[Dict[str, Any]], connection) -> None:
+    """
+    Ajusta os contadores quando chamadas já gravadas mudam de categoria,
+    urgência ou região (ex.: reclassificação). old_rows e new_rows são as
+    mesmas chamadas antes e depois; roda na mesma transação do UPDATE.
+    """
+    deltas = rollup_deltas(new_rows)
+    deltas.subtract(rollup_deltas(old_rows))
+    _upsert(connection, Counter({chave: n for chave, n in deltas.items() if n}))
+    _cache["expira_em"] = 0.0
+
+
+def rebuild_rollups(batch_size: int = 10000) -> int:
+    """
+    Recalcula todos os contadores a partir da tabela `calls`.
+
+    Leitura e substituição rodam numa única transação, com call_stats
+    bloqueada para escrita desde antes da leitura: uma chamada gravada durante
+    o rebuild espera o fim dele para somar o seu incremento, em vez de ser
+    apagada dos contadores. Os inserts ficam parados enquanto isso; rode fora
+    do horário de pico.
+
+    Returns:
+        Quantidade de chamadas processadas
+    """
+    init_db()
+    deltas: Counter = Counter()
+    total = 0
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("LOCK TABLE call_stats IN EXCLUSIVE MODE"))
+            # A leitura de calls inteira passa do DB_STATEMENT_TIMEOUT_MS
+            conn.execute(text("SET LOCAL statement_timeout = 0"))
+        # No SQLite, o DELETE já pega o lock de escrita do banco antes da leitura
+        conn.execute(delete(CallStat.__table__))
+
+        colunas = [Call.timestamp] + [getattr(Call, dimension) for dimension in DIMENSIONS]
+        for row in conn.execution_options(yield_per=batch_size).execute(select(*colunas)):
+            deltas.update(rollup_deltas([row._mapping]))
+            total += 1
+        _upsert(conn, deltas, replace=True)
+    _cache["expira_em"] = 0.0
+    print(f"[Rollup] {total} chamadas processadas, {len(deltas)} contadores gravados")
+    return total
+
+
+def prune_rollups() -> int:
+    """Apaga janelas de minuto e hora além da retenção. Retorna quantas linhas saíram."""
+    agora = datetime.now()
+    with engine.begin() as conn:
+        apagadas = 0
+        for granularity, limite in (
+            ("minute", agora - timedelta(hours=STATS_MINUTE_RETENTION_HOURS)),
+            ("hour", agora - timedelta(days=STATS_HOUR_RETENTION_DAYS)),
+        ):
+            resultado = conn.execute(
+                delete(CallStat.__table__)
+                .where(CallStat.granularity == granularity)
+                .where(CallStat.bucket_start < limite)
+            )
+            apagadas += resultado.rowcount
+    return apagadas
+
+
+_cache: Dict[str, Any] = {"expira_em": 0.0, "stats": None}
+_cache_lock = threading.Lock()
+
+
+def _ler_stats() -> Dict[str, Any]:
+    agora = datetime.now()
+    inicio_por_granularidade = {
+        "minute": _bucket_start(agora - timedelta(minutes=STATS_RECENT_MINUTES - 1), "minute"),
+        "hour": _bucket_start(agora - timedelta(hours=STATS_RECENT_HOURS - 1), "hour"),
+        "day": _bucket_start(agora - timedelta(days=STATS_RECENT_DAYS - 1), "day"),
+    }
+
+    stats: Dict[str, Any] = {"total_calls": 0, "by_dimension": {d: {} for d in DIMENSIONS},
+                             "timeline": {g: [] for g in GRANULARITIES}}
+    db = SessionLocal()
+    try:
+        acumulados = db.execute(
+            select(CallStat.dimension, CallStat.key, CallStat.count).where(CallStat.granularity == "all")
+        )
+        for dimension, key, count in acumulados:
+            if dimension == "total":
+                stats["total_calls"] = count
+            else:
+                stats["by_dimension"][dimension][key or "não informado"] = count
+
+        for granularity, inicio in inicio_por_granularidade.items():
+            janelas = db.execute(
+                select(CallStat.bucket_start, CallStat.count)
+                .where(CallStat.dimension == "total")
+                .where(CallStat.granularity == granularity)
+                .where(CallStat.bucket_start >= inicio)
+                .order_by(CallStat.bucket_start)
+            )
+            stats["timeline"][granularity] = [
+                {"bucket_start": bucket_start.isoformat(), "count": count} for bucket_start, count in janelas
+            ]
+    finally:
+        db.close()
+    stats["generated_at"] = agora.isoformat()
+    return stats
+
+
+def get_stats() -> Dict[str, Any]:
+    """
+    Estatísticas do dashboard lidas dos rollups: total, totais por dimensão e
+    as janelas recentes de minuto, hora e dia.
+    """
+    with _cache_lock:
+        if _cache["stats"] is not None and _cache["expira_em"] > time.monotonic():
+            return _cache["stats"]
+        stats = _ler_stats()
+        _cache["stats"] = stats
+        _cache["expira_em"] = time.monotonic() + STATS_CACHE_SECONDS
+        return stats
+
+
+def get_total_calls() -> int:
+    """Total de chamadas sem contar a tabela `calls`."""
+    return get_stats()["total_calls"]
+
+
+if __name__ == "__main__":
+    comando = sys.argv[1] if len(sys.argv) > 1 else ""
+    if comando == "rebuild":
+        rebuild_rollups()
+    elif comando == "prune":
+        print(f"[Rollup] {prune_rollups()} janelas antigas apagadas")
+    else:
+        print("Uso: python stats_rollup.py rebuild|prune")
+        sys.exit(1)
@@ -0,0 +1,255 @@
+"""
+Tempo de cada etapa das ligações e GET /metrics no formato do Prometheus
+
+Cada etapa do atendimento é medida com span():
+
+    with span("classificacao", id_chamada):
+        classificacao = classify_emergency_call(texto)
+
+Etapas usadas pelos apps: twilio_parse, classificacao, urgencia, relatorio,
+relatorio_rascunho, db_write, db_flush, despacho_enqueue, despacho e twiml. Os tempos vão para o
+histograma pipeline_stage_seconds{stage=...}; cada tentativa de chamada à
+OpenAI (classifiers/llm.py) vira llm_request_seconds e os tokens da resposta
+viram llm_tokens_total. Os webhooks em si ficam em http_request_seconds.
+
+Um span custa duas leituras do relógio e um incremento sob lock; com
+METRICS_ENABLED=0 não registra nada. Com TRACE_LOG_SPANS=1 cada span também é
+impresso junto com o CallSid, para ver o detalhe de uma ligação.
+
+Os valores são do processo: com vários workers, o Prometheus raspa cada um.
+"""
+import os
+import time
+import bisect
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+# Carrega variáveis de ambiente
+load_dotenv()
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+TRACE_LOG_SPANS = os.getenv("TRACE_LOG_SPANS", "0") == "1"
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Limites (em segundos) dos buckets de latência
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+_LE_INF = 'le="+Inf"'
+
+
+def _escapar(valor: Any) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _rotulos(nomes: Sequence[str], valores: Sequence[Any], extra: str = "") -> str:
+    pares = [f'{nome}="{_escapar(valor)}"' for nome, valor in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _numero(valor: float) -> str:
+    return str(int(valor)) if float(valor).is_integer() else repr(float(valor))
+
+
+class Counter:
+    """Contador monotônico com rótulos."""
+
+    tipo = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._valores: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        with self._lock:
+            self._valores[labelvalues] = self._valores.get(labelvalues, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            itens = sorted(self._valores.items())
+        return [f"{self.name}{_rotulos(self.labelnames, rotulos)} {_numero(valor)}" for rotulos, valor in itens]
+
+
+class Histogram:
+    """Histograma com buckets fixos; as contagens só viram cumulativas na exportação."""
+
+    tipo = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Por série: [contagem de cada bucket..., contagem acima do último, soma]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        indice = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            serie = self._series.get(labelvalues)
+            if serie is None:
+                serie = [0] * (len(self.buckets) + 2)
+                self._series[labelvalues] = serie
+            serie[indice] += 1
+            serie[-1] += value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            itens = sorted((rotulos, list(serie)) for rotulos, serie in self._series.items())
+        linhas = []
+        for rotulos, serie in itens:
+            acumulado = 0
+            for limite, contagem in zip(self.buckets, serie):
+                acumulado += contagem
+                le = _rotulos(self.labelnames, rotulos, f'le="{_numero(limite)}"')
+                linhas.append(f"{self.name}_bucket{le} {acumulado}")
+            acumulado += serie[len(self.buckets)]
+            linhas.append(f"{self.name}_bucket{_rotulos(self.labelnames, rotulos, _LE_INF)} {acumulado}")
+            linhas.append(f"{self.name}_sum{_rotulos(self.labelnames, rotulos)} {_numero(serie[-1])}")
+            linhas.append(f"{self.name}_count{_rotulos(self.labelnames, rotulos)} {acumulado}")
+        return linhas
+
+
+STAGE_SECONDS = Histogram(
+    "pipeline_stage_seconds", "Duração de cada etapa do atendimento de uma ligação", ("stage",)
+)
+STAGE_ERRORS = Counter(
+    "pipeline_stage_errors_total", "Etapas que terminaram com exceção", ("stage",)
+)
+HTTP_SECONDS = Histogram(
+    "http_request_seconds", "Tempo de resposta de cada rota HTTP", ("route", "method", "status")
+)
+LLM_SECONDS = Histogram(
+    "llm_request_seconds", "Duração de cada tentativa de chamada à OpenAI", ("operation", "model", "outcome")
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total", "Tokens usados nas chamadas à OpenAI", ("operation", "model", "kind")
+)
+
+_metricas = [STAGE_SECONDS, STAGE_ERRORS, HTTP_SECONDS, LLM_SECONDS, LLM_TOKENS]
+
+
+class span:
+    """
+    Mede um bloco como uma etapa do atendimento (funciona também em código async).
+
+    Args:
+        stage: Nome da etapa (rótulo stage do histograma)
+        call_sid: CallSid da ligação, só para o log de TRACE_LOG_SPANS
+    """
+
+    __slots__ = ("stage", "call_sid", "_inicio")
+
+    def __init__(self, stage: str, call_sid: Optional[str] = None):
+        self.stage = stage
+        self.call_sid = call_sid
+
+    def __enter__(self) -> "span":
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo, erro, traceback) -> bool:
+        if not METRICS_ENABLED:
+            return False
+        segundos = time.perf_counter() - self._inicio
+        STAGE_SECONDS.observe(segundos, self.stage)
+        if tipo is not None:
+            STAGE_ERRORS.inc(self.stage)
+        if TRACE_LOG_SPANS:
+            print(f"[Trace] {self.call_sid or '-'} {self.stage}: {1000 * segundos:.1f} ms{' (erro)' if tipo else ''}")
+        return False
+
+
+def observe_request(route: str, method: str, status: int, segundos: float) -> None:
+    """Registra o tempo de resposta de uma rota (use o padrão da rota, não a URL)."""
+    if METRICS_ENABLED:
+        HTTP_SECONDS.observe(segundos, route, method, str(status))
+
+
+def observe_llm_call(operation: str, model: str, segundos: float, response: Any, erro: Optional[Exception]) -> None:
+    """Observador de classifiers/llm.py: latência e tokens de cada tentativa."""
+    if not METRICS_ENABLED:
+        return
+    if erro is not None:
+        LLM_SECONDS.observe(segundos, operation, model, type(erro).__name__)
+        return
+    LLM_SECONDS.observe(segundos, operation, model, "ok")
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        LLM_TOKENS.inc(operation, model, "prompt", amount=usage.prompt_tokens or 0)
+        LLM_TOKENS.inc(operation, model, "completion", amount=usage.completion_tokens or 0)
+
+
+def render_prometheus() -> bytes:
+    """Todas as métricas no formato texto do Prometheus."""
+    linhas = []
+    for metrica in _metricas:
+        linhas.append(f"# HELP {metrica.name} {metrica.documentation}")
+        linhas.append(f"# TYPE {metrica.name} {metrica.tipo}")
+        linhas.extend(metrica.samples())
+    return ("\n".join(linhas) + "\n").encode("utf-8")
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI (FastAPI) que registra http_request_seconds por rota.
+
+    O tempo vai até o início da resposta, então streams longos (SSE) medem só
+    o tempo até o primeiro byte.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        inicio = time.perf_counter()
+        medido = False
+
+        async def enviar(mensagem):
+            nonlocal medido
+            if mensagem["type"] == "http.response.start" and not medido:
+                medido = True
+                rota = getattr(scope.get("route"), "path", "desconhecida")
+                observe_request(rota, scope["method"], mensagem["status"], time.perf_counter() - inicio)
+            await send(mensagem)
+
+        try:
+            await self.app(scope, receive, enviar)
+        except Exception:
+            if not medido:
+                rota = getattr(scope.get("route"), "path", "desconhecida")
+                observe_request(rota, scope["method"], 500, time.perf_counter() - inicio)
+            raise
+
+
+def instrument_flask(app) -> None:
+    """Registra http_request_seconds por rota num app Flask."""
+    from flask import g, request
+
+    @app.before_request
+    def _iniciar_medicao():
+        g._inicio_metricas = time.perf_counter()
+
+    @app.after_request
+    def _registrar_medicao(response):
+        inicio = g.pop("_inicio_metricas", None)
+        if inicio is not None:
+            rota = request.url_rule.rule if request.url_rule else "desconhecida"
+            observe_request(rota, request.method, response.status_code, time.perf_counter() - inicio)
+        return response
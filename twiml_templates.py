@@ -0,0 +1,122 @@
+"""
+Respostas TwiML pré-renderizadas
+
+Os webhooks de entrada (/ e /voice) e os ramos fixos de erro devolvem sempre o
+mesmo XML. Em vez de montar um VoiceResponse e serializá-lo a cada ligação,
+cada resposta é renderizada uma vez, na importação, e servida como bytes.
+
+Respostas com partes variáveis usam marcadores {{nome}} no texto; o XML é
+dividido nos marcadores e render() só junta os pedaços com os valores
+escapados:
+
+    ENVIANDO_AJUDA.render(categoria="samu")
+"""
+import re
+from typing import Callable, List, Union
+from xml.sax.saxutils import escape
+
+from twilio.twiml.voice_response import VoiceResponse
+
+TWIML_CONTENT_TYPE = "application/xml"
+
+_MARCADOR = re.compile(r"\{\{(\w+)\}\}")
+_ENTIDADES_ATRIBUTO = {'"': "&quot;"}
+
+
+class TwimlTemplate:
+    """
+    TwiML renderizado uma única vez.
+
+    Args:
+        build: Função que preenche um VoiceResponse (pode usar marcadores {{nome}})
+    """
+
+    def __init__(self, build: Callable[[VoiceResponse], None]):
+        response = VoiceResponse()
+        build(response)
+        xml = str(response)
+        # Pedaços fixos (bytes) intercalados com nomes de parâmetro (str)
+        self._partes: List[Union[bytes, str]] = []
+        inicio = 0
+        for marcador in _MARCADOR.finditer(xml):
+            self._partes.append(xml[inicio:marcador.start()].encode("utf-8"))
+            self._partes.append(marcador.group(1))
+            inicio = marcador.end()
+        self._partes.append(xml[inicio:].encode("utf-8"))
+        self.params = [parte for parte in self._partes if isinstance(parte, str)]
+        self.body: bytes = self._partes[0] if not self.params else b""
+
+    def render(self, **valores) -> bytes:
+        """Bytes do TwiML com os parâmetros substituídos (e escapados)."""
+        if not self.params:
+            return self.body
+        return b"".join(
+            escape(str(valores[parte]), _ENTIDADES_ATRIBUTO).encode("utf-8") if isinstance(parte, str) else parte
+            for parte in self._partes
+        )
+
+
+def _say(texto: str, **opcoes) -> Callable[[VoiceResponse], None]:
+    """Template de um único <Say> seguido de <Hangup>."""
+    def build(response: VoiceResponse) -> None:
+        response.say(texto, **opcoes)
+        response.hangup()
+    return build
+
+
+# ============================================================================
+# answer_phone.py
+# ============================================================================
+
+def _atender_e_escutar(response: VoiceResponse) -> None:
+    response.say(
+        "Serviço de emergência, fale sua emergência agora.",
+        language="pt-BR",
+        voice="alice"
+    )
+    response.gather(
+        input="speech",
+        language="pt-BR",
+        speech_timeout="auto",
+        action="/receber_transcricao",
+        method="POST"
+    )
+    response.say("Não ouvimos você. Tente novamente.", language="pt-BR")
+    response.hangup()
+
+
+def _nao_classificada(response: VoiceResponse) -> None:
+    response.say("Não foi possível classificar sua emergência. Transferindo para policia.", language="pt-BR", voice="alice")
+    response.dial("190")
+
+
+ATENDER_E_ESCUTAR = TwimlTemplate(_atender_e_escutar)
+TRANSCRICAO_VAZIA = TwimlTemplate(_say("Não foi possível entender sua solicitação. Ligue novamente.", language="pt-BR"))
+NAO_CLASSIFICADA = TwimlTemplate(_nao_classificada)
+RELATORIO_INDISPONIVEL = TwimlTemplate(_say("Relatório indisponível. Desligando.", language="pt-BR", voice="alice"))
+
+
+# ============================================================================
+# app_painel.py
+# ============================================================================
+
+def _atender_e_falar(response: VoiceResponse) -> None:
+    response.say(
+        "Serviço de emergência, o que você precisa?",
+        language="pt-BR",
+        voice="alice"
+    )
+
+
+def _voice(response: VoiceResponse) -> None:
+    response.say(
+        "Olá! Você ligou para o Centro de Emergência Unificado. "
+        "Descreva sua emergência após o bip."
+    )
+    response.record(maxLength=10, action="/handle_recording", transcribe=True)
+
+
+ATENDER_E_FALAR = TwimlTemplate(_atender_e_falar)
+VOICE = TwimlTemplate(_voice)
+TROTE = TwimlTemplate(lambda r: r.say("Percebemos que esta é uma ligação falsa. Não podemos atender.", language="pt-BR"))
+ENVIANDO_AJUDA = TwimlTemplate(lambda r: r.say("Entendido. Enviando ajuda de {{categoria}}.", language="pt-BR"))